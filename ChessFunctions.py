@@ -10,120 +10,83 @@
 # openings. Then, we also used ipywidgets, chess, and IPython display to create
 # an interactive widget where players can choose an opening, and then be 
 # presented with tons of matches and statistics on it. Then, they can choose a
-# match and see it simulated on a chess board. This file is the back end necessary
-# to perform all of these calculations, and is imported by the front end 
-# visualizer in jupyter notebook. 
+# match and see it simulated on a chess board. This file holds the plots and
+# widgets and is imported by the front end visualizer in jupyter notebook. The
+# calculations themselves live in chess_analytics.py, which reads games.csv and
+# builds each table only when it is first needed.
+
+import functools
 
 import pandas as pd
-import chess
-import chess.svg
-import IPython
-from IPython.display import display, SVG, clear_output, HTML
+from IPython.display import display, SVG, Image
 from ipywidgets import widgets
-import time
 import matplotlib.pyplot as plt
-import matplotlib
 import numpy as np
 
-# Read games.csv dataset into pandas dataframe
-games_df = pd.read_csv("games.csv")
+import chess_analytics
+import board_player
+import game_replay
+import opening_views
+
+# Create the dataset object for games.csv. Nothing is read from disk until a
+# table is first needed
+dataset = chess_analytics.ChessDataset("games.csv")
+
+# Tables that used to be computed when this module was imported. They are now
+# looked up on the dataset the first time they are accessed, e.g. cf.win_rates_df
+_lazy_tables = {
+    'games_df': lambda: dataset.games_df,
+    'win_rates_df': lambda: dataset.win_rates_df,
+    'gamesrated': lambda: dataset.gamesrated,
+    'gamesnotrated': lambda: dataset.gamesnotrated,
+    'turns_win_rates': lambda: dataset.turns_win_rates,
+    'freq_black': lambda: dataset.opening_stats('black')[0],
+    'black_openings': lambda: dataset.opening_stats('black')[1],
+    'freq_white': lambda: dataset.opening_stats('white')[0],
+    'white_openings': lambda: dataset.opening_stats('white')[1],
+}
+
+# Define module level __getattr__ so the tables above are computed on first access
+def __getattr__(name):
+    if name in _lazy_tables:
+        return _lazy_tables[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Define getwinners function to return percentage of time that r1 is 
 # higher than r2 and winner wins the match
 def getwinners(r1, r2, winner):
-    # Filter the DataFrame to the matches where r1 is greater than r2
-    filtered_games = games_df[games_df[r1] > games_df[r2]]
-
-    # Calculate the percentage of games won by 'winner' in the filtered DataFrame
-    percentage_won = (filtered_games['winner'] == winner).mean() * 100
-    return percentage_won
-
-# Create new avrating column that takes the average of the black rating and 
-# white rating in the match
-games_df['avrating'] = (games_df['white_rating'] + games_df['black_rating']) / 2
-
-# Define bins and labels for rating groups
-rating_bins = [0, 1200, 1400, 1600, 1800, 2000, 2200, 2400, 2600]
-rating_labels = ['0-1200', '1200-1400', '1400-1600', '1600-1800', 
-         '1800-2000', '2000-2200', '2200-2400', '2400-2600']
+    return dataset.getwinners(r1, r2, winner)
 
-# Define win_rate_for_color_group function to calculate win rate for a color 
+# Define win_rate_for_color function to calculate win rate for a color 
 # within a specified rating group
 def win_rate_for_color(group, color):
-    # Add new column to dataframe that places each match within its respective 
-    # rating group using pd.cut() function
-    games_df['rating_group'] = pd.cut(games_df['avrating'], bins = rating_bins, 
-    labels = rating_labels, right = False)
-
-    # Filter dataframe to get desired rating group and winner
-    games_in_group = games_df[games_df['rating_group'] == group]
-    wins = games_in_group[games_in_group['winner'] == color]
-
-    # Calculate win percentage while avoiding a ZeroDivisionError
-    if len(games_in_group) > 0:
-        return len(wins) / len(games_in_group) * 100 
-    else:
-        return 0
+    return dataset.win_rate_for_color(group, color)
 
 # Define count_matches_in_group function to calculate the number of matches 
 # in each rating group
 def count_matches_in_group(group):
-    return len(games_df[games_df['rating_group'] == group])
-
-# Calculate win rates and total matches played for each group and color using a 
-# for loop
-win_rates = {}
-for group in rating_labels:
-    win_rates[group] = {
-        'white_win_rate': win_rate_for_color(group, 'white'),
-        'black_win_rate': win_rate_for_color(group, 'black'),
-        'total_matches': count_matches_in_group(group)
-    }
-    
-# Convert the results to a pandas DataFrame for better visualization
-win_rates_df = pd.DataFrame(win_rates).T
+    return dataset.count_matches_in_group(group)
 
-# Create win_rate_diff column to show difference between white win rate and 
-# black win rate
-win_rates_df['win_rate_diff'] = (win_rates_df['white_win_rate'] - 
-                                 win_rates_df['black_win_rate'])
-
-# Reorder columns so win_rate_diff is before total_matches
-win_rates_df = win_rates_df[['white_win_rate', 'black_win_rate', 
-                             'win_rate_diff', 'total_matches']]
-
-#Filter games_df dataframe to gamesrated (with rated games) and gamesnotrated
-# (with unrated games)
-gamesrated = games_df[games_df['rated']]
-gamesnotrated = games_df[~games_df['rated']]
+# Define outcome_pie_chart function to draw a pie chart of the white, black and
+# draw percentages passed in
+def outcome_pie_chart(sizes, title):
+    fig1, ax1 = plt.subplots()
+    opening_views.draw_outcome_pie(ax1, sizes, title)
+    plt.show()
 
 # Define rating_win_pie_chart function to draw pie chart for win percentages 
 # for each color in a rating_df passed in
 def rating_win_pie_chart(rating_df, string_rated):
-    # Label the three categories of the pie chart
-    labels = 'White', 'Black', 'Draw'
-
     # Determine categorical percentages by dividing the number of matches each 
-    # color wins by the total number of matches in the dataframe. To find the 
-    # number of matches each color wins, we use a query and filter the dataframe, 
-    # then find the length of the dataframe
-    sizes = [len(rating_df.query("winner == 'white'")) * 100 / len(rating_df), 
-            len(rating_df.query("winner == 'black'")) * 100 / len(rating_df), 
-            len(rating_df.query("winner == 'draw'")) * 100 / len(rating_df)]
-    fig1, ax1 = plt.subplots()
-
-    # Define visual specifications and title, then display the plot
-    ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-            shadow=True, startangle=90)
-    ax1.axis('equal') 
-    plt.title(f'Win percentages for {string_rated} matches')
-    plt.show()
+    # color wins by the total number of matches in the dataframe
+    sizes = chess_analytics.outcome_percentages(rating_df['winner'])
+    outcome_pie_chart(sizes, f'Win percentages for {string_rated} matches')
 
 # Define turnsvrating function that plots a scatterplot to find correlation between 
 # the ratings of players in a game and how many turns their games last
 def turnsvrating():
     # Creates a random sample of 300 games
-    games300 = games_df.sample(300)
+    games300 = dataset.games_df.sample(300)
     
     # Creates a line of best fit for a graph plotting user rating vs turns  
     # Calculates y-intercept and slope using numpy's polyfit function
@@ -142,61 +105,15 @@ def turnsvrating():
     plt.ylabel("Number of turns played in the match")
     plt.show()
 
-# Conduct time analysis by categorizing chess games into groups based on the total
-# number of turns played to understand how the length of the game impacts the win 
-# rates for different colors
-# Define bins and labels for categorizing games by their turn count
-turn_bins = [0, 30, 60, 90, 120, 150, float('inf')]
-turn_labels = ['0-30', '31-60', '61-90', '91-120', '121-150', '150+']
-
-# Add new 'turns_category' column to categorizes each game into one of the 
-# predefined turn bins
-games_df['turns_category'] = pd.cut(games_df['turns'], bins=turn_bins, 
-                                    labels=turn_labels, right=False)
-
-# Calculate win rates for each turn category by grouping the DataFrame by
-# 'turns_category' and 'winner'
-turns_win_rates = (games_df.groupby('turns_category')['winner']
-                          .value_counts(normalize=True)
-                          .unstack()
-                          .fillna(0))
-
 # Define opening_win_percentage function to calculate win percentage for 
 # a given color and opening
 def opening_win_percentage(opening, winner):
-    # Filter the DataFrame to matches with the provided opening name
-    filtered_games = games_df[games_df['opening_name'] == opening]
-
-    # Calculate the percentage of games won by 'winner' in the filtered DataFrame
-    percentage_won = (filtered_games['winner'] == winner).mean() * 100
-    return percentage_won
+    return dataset.opening_win_percentage(opening, winner)
 
 # Define opening_stats function for finding openings with most wins for a specified  
 # color. Returns frequency of each opening and sorted dictionary with win percentages 
 def opening_stats(color):
-    # Calculate the frequency of each opening when the specified color wins
-    freq_color = games_df[games_df['winner'] == color]['opening_name'].value_counts()
-    color_openings = {}
-
-    # Calculate and store the win percentage for top 10 opennings
-    for opening in freq_color.head(10).index:
-        color_openings[opening] = opening_win_percentage(opening, color)
-
-    # Sort the openings by their win percentage in descending order.
-    color_openings = dict(sorted(color_openings.items(), key=lambda item: item[1], 
-                     reverse=True))
-    
-    # Compute the combined win percentage for all openings not in the top 10 and 
-    # add this information to the dictionary
-    other_openings = ~games_df['opening_name'].isin(list(color_openings.keys()))
-    proportion = round((len(games_df[other_openings & (games_df['winner'] == color)])
-                         * 100 / len(games_df[other_openings])), 2)
-    color_openings['Other openings'] = proportion
-
-    return freq_color, color_openings
-
-freq_black, black_openings = opening_stats('black')
-freq_white, white_openings = opening_stats('white')
+    return dataset.opening_stats(color)
 
 # Define opening_dict_bar_chart function to plot a bar chart showing the ten 
 # most common openings leading to victories for a specific color accompanied
@@ -218,108 +135,75 @@ def openings_dict_bar_chart(openings_dict):
     plt.figure(figsize=(10, 6))
     plt.show()
 
-# Define move_freq_plot function for interactive visualizer
-def move_freq_plot(games):
-    # Split moves into individual moves
-    all_moves = ' '.join(games['moves']).split()
-
-    # Count the occurrences of each move
-    move_counts = pd.Series(all_moves).value_counts()
-
-    # Plot the top 10 opening moves
-    move_counts.head(10).plot(kind='bar', color='skyblue')
-    plt.title('Most Frequent Moves')
-    plt.xlabel('Move')
-    plt.ylabel('Frequency')
+# Define move_counts_bar_chart function to plot the 10 most frequent moves from
+# a Series of move counts
+def move_counts_bar_chart(move_counts):
+    fig, ax = plt.subplots()
+    opening_views.draw_move_counts(ax, move_counts)
     plt.show()
 
+# Define move_freq_plot function for interactive visualizer. games is a
+# filtered part of the dataset, e.g. from dataset.games_for_opening()
+def move_freq_plot(games):
+    # Count the occurrences of each move from the tokenized moves of the dataset
+    move_counts_bar_chart(dataset.move_counts(games.index))
+
 # Define win_percentage_plot function for interactive visualizer
 # Plots a pie chart of the win percentages for each color in a filtered dataframe
 def win_percentage_plot(games):
-    # Creates tuple of three labels
-    labels = 'White', 'Black', 'Draw'
-
-    # Calculates percentages for how often each game is won
-    sizes = [len(games.query("winner == 'white'")) * 100 / len(games), 
-        len(games.query("winner == 'black'")) * 100 / len(games), 
-        len(games.query("winner == 'draw'")) * 100 / len(games)]
+    outcome_pie_chart(chess_analytics.outcome_percentages(games['winner']),
+                      'Win percentages')
 
-    # Constructs pie chart with labels from above
-    fig1, ax1 = plt.subplots()
-    ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-        shadow=True, startangle=90)
-    ax1.axis('equal') 
-    plt.title(f'Win percentages')
-
-    # Display graph
+# Define difference_rates_bar_chart function to plot the share of each winner per
+# rating difference group, as returned by chess_analytics.summarize_games()
+def difference_rates_bar_chart(win_percentages):
+    # Plot the win percentages using a stacked bar chart
+    fig, ax = plt.subplots()
+    opening_views.draw_difference_rates(ax, win_percentages)
     plt.show()
 
-# Define rating_difference_impact function for interactive visualizer
+# Define rating_difference_impact function for interactive visualizer. The
+# dataframe passed in is only read, not modified
 def rating_difference_impact(games):
-    # Calculate the rating difference for each game
-    games['rating_difference'] = games['white_rating'] - games['black_rating']
-
-    # Create bins and labels for rating differences
-    bins = [-400, -200, -100, 0, 100, 200, 400]
-    labels = ['<-200', '-200 to -100', '-100 to 0', '0 to 100', '100 to 200', '200+']
-    
-    # Use pd.cut() function to place each game into its respective bin
-    games['rating_difference_group'] = pd.cut(games['rating_difference'], bins=bins, 
-                                              labels=labels, right=False)
-
-    # Calculate win percentages for each rating difference group
-    win_percentages = (games.groupby('rating_difference_group')['winner']
-                           .value_counts(normalize=True)
-                           .unstack()
-                           .fillna(0))
-    
-    # Plot the win percentages using a stacked bar chart
-    win_percentages.plot(kind='bar', stacked=True, colormap='coolwarm_r')
-    plt.title('Win Percentage Based on Rating Difference')
-    plt.xlabel('Rating Difference')
-    plt.ylabel('Win Percentage')
-    plt.legend(title='Winner', loc='upper right')
-    plt.show()
+    summary = chess_analytics.summarize_games(games['white_rating'].to_numpy(),
+                                              games['black_rating'].to_numpy(),
+                                              games['winner'].to_numpy(),
+                                              games['turns'].to_numpy())
+    difference_rates_bar_chart(summary['difference_rates'])
 
 # Change pandas display settings for better visualization
 pd.set_option('display.max_rows', 999)
 pd.set_option('display.max_colwidth', None)
 
-# Define show_data function for interactive visualizer
+# Define display_figure function to show a plot rendered by opening_views
+def display_figure(image, fmt):
+    display(SVG(data=image) if fmt == 'svg' else Image(data=image, format=fmt))
+
+# Define show_data function for interactive visualizer. The statistics, plots and
+# table of each opening come from the opening_view_cache, so an opening seen
+# before is shown again without computing or drawing anything
 def show_data(opening_name):
-    # Filter dataframe to matches with user chosen opening name
-    games = games_df[games_df['opening_name'] == opening_name]
-    
-    # Get dataframe with calculated mean values for each column
-    games_describe = games.describe().loc['mean']
+    view = opening_view_cache.get(opening_name)
+    summary = view['summary']
+    means = summary['means']
     
     # Display statistics and plots about chosen opening in first output window
     with out:
         # Print descriptions and descriptive statistics
-        print(f"Games in dataset with this opening: {len(games)}")
-        print(f"Mean turns per game: {round(games_describe['turns'])}")
-        print(f"Mean overall rating: {round(games_describe['avrating'])}")
-        print(f"Mean white rating: {round(games_describe['white_rating'])}")
-        print(f"Mean black rating: {round(games_describe['black_rating'])}")
-
-        # Call functions to create plots
-        win_percentage_plot(games)
-        move_freq_plot(games)
-        rating_difference_impact(games.copy())
+        print(f"Games in dataset with this opening: {summary['games']}")
+        print(f"Mean turns per game: {round(means['turns'])}")
+        print(f"Mean overall rating: {round(means['avrating'])}")
+        print(f"Mean white rating: {round(means['white_rating'])}")
+        print(f"Mean black rating: {round(means['black_rating'])}")
+
+        # Display the pre-rendered plots
+        for name in ('outcomes', 'moves', 'rating_difference'):
+            display_figure(view['figures'][name], view['format'])
     
-    # Display dataframe of matches with chosen opening
+    # Display dataframe of matches with chosen opening, sorted by average rating
     with out2:
-        # Convert avrating column to int so the dataframe can be sorted by it
-        display(games.assign(avrating = lambda x: x['avrating'].astype(int))
-                     .sort_values(by = 'avrating', ascending = False)
-                     # Copy victory_status column's data into new victory column 
-                     # to shorten dataframe width
-                     .assign(victory = lambda df: df['victory_status'])
-                     # Display relevant columns to user
-                     [['avrating', 'white_rating', 'black_rating', 'winner', 
-                     'victory', 'turns', 'id']]
-                     # Hide index column
-                     .style.hide())
+        # Hide index column
+        display(view['table'].style.hide())
     
 # Create output windows
 out = widgets.Output(layout={'border': '1px solid black'})
@@ -331,7 +215,10 @@ clear_button = widgets.Button(description = 'clear output')
 
 # Define clear_print method that runs when button is clicked
 def clear_print(button=None):
-    # Clear all outputs
+    # Stop the boards that are playing, then clear all outputs
+    for player in list(players.values()):
+        player.stop()
+    players.clear()
     out.clear_output()
     out2.clear_output()
     out3.clear_output()
@@ -339,24 +226,45 @@ def clear_print(button=None):
 # Link clear_button to clear_print function
 clear_button.on_click(clear_print)
 
-# Get all opening names used over 25 times in dataset as options for dropdown menu
-options = (games_df.opening_name.value_counts()
-                               .loc[lambda x: x > 25]
-                               .index.sort_values())
-
-# Create a Dropdown widget with list of selected opening names
-dropdown = widgets.Dropdown(options = options,
-    value=None, 
-    description='Select an opening:',
-    style={'description_width': 'initial'})
+# Create cache of the statistics, rendered plots and tables of the openings shown
+# in the visualizer, limited to 64 MB. Call opening_view_cache.stats() to see its
+# hit and miss counts
+opening_view_cache = opening_views.OpeningViewCache(
+    lambda opening: opening_views.build_opening_view(dataset, opening), max_mb=64)
 
 # Define on_dropdown_change function to handle the dropdown value change event
 def on_dropdown_change(change):
     selected_option = change['new']
     show_data(selected_option)   
 
-# Attach the event handler to the dropdown widget
-dropdown.observe(on_dropdown_change, names='value')
+# Define opening_dropdown function to create the dropdown menu of openings the
+# first time it is shown as cf.dropdown, so importing this module neither reads
+# games.csv nor starts a thread
+@functools.lru_cache(maxsize=None)
+def opening_dropdown():
+    # Get all opening names used over 25 times in dataset as options for dropdown menu
+    options = dataset.popular_openings(25)
+
+    # Create a Dropdown widget with list of selected opening names
+    dropdown = widgets.Dropdown(options = options,
+        value=None, 
+        description='Select an opening:',
+        style={'description_width': 'initial'})
+
+    # Attach the event handler to the dropdown widget
+    dropdown.observe(on_dropdown_change, names='value')
+
+    # Prepare the 10 most played openings of the dropdown in the background so they
+    # show up instantly when first selected. The dataset computes its tables under a
+    # lock, so this thread and the widgets never build the same table at once
+    opening_view_cache.precompute(
+        [opening for opening in opening_views.most_played_openings(dataset, 10)
+         if opening in options])
+    return dropdown
+
+# Look up the dropdown and its options like the lazy tables above
+_lazy_tables['dropdown'] = opening_dropdown
+_lazy_tables['options'] = lambda: opening_dropdown().options
 
 # Create text box to take in game id input
 text_box_id = widgets.Textarea(
@@ -375,49 +283,91 @@ text_box_seconds = widgets.Textarea(
 # Create button to simulate moves
 simulate_button = widgets.Button(description = 'simulate')
 
-# Define simulate function to to visually simulate the moves of a chess game 
+# Create cache of rendered board SVGs keyed by position hash, so positions shown
+# before (like the starting position) are not drawn again
+board_svgs = game_replay.SvgCache(maxsize=512)
+
+# Define show_position function to display a game after a number of plies, using
+# the stored replay if there is one and otherwise replaying just this game
+def show_position(game_id, ply):
+    replay, row = dataset.game_replay(game_id)
+    display(SVG(board_svgs.get(replay.key(row, ply), replay.fen(row, ply))))
+
+# Board players that are currently shown, keyed by game id
+players = {}
+
+# Define board_widget function to create a board for a game with its own output
+# window, play/pause and stop buttons, and a slider to scrub to any ply. The game
+# is animated by a board_player.BoardPlayer task, so the notebook stays responsive
+def board_widget(game_id, delay):
+    board_out = widgets.Output()
+    play_button = widgets.Button(description='pause')
+    stop_button = widgets.Button(description='stop')
+    slider = widgets.IntSlider(value=0, min=0, description='ply',
+                               continuous_update=False)
+
+    # Show each board in the board's output window and move the slider along
+    def show(ply, svg):
+        board_out.clear_output(wait=True)
+        with board_out:
+            display(SVG(svg))
+        slider.value = ply
+
+    replay, row = dataset.game_replay(game_id)
+    player = board_player.BoardPlayer(replay, row, show, board_svgs, delay=delay)
+    slider.max = player.last_ply
+
+    # Define function to pause a playing game or resume a paused one
+    def toggle(button=None):
+        if player.playing:
+            player.pause()
+            play_button.description = 'play'
+        else:
+            player.play()
+            play_button.description = 'pause'
+
+    # Define function to cancel the animation and remove the board
+    def stop(button=None):
+        player.stop()
+        players.pop(game_id, None)
+        box.close()
+
+    play_button.on_click(toggle)
+    stop_button.on_click(stop)
+    slider.observe(lambda change: player.seek(change['new']), names='value')
+    box = widgets.VBox([widgets.HTML(f'<b>{game_id}</b>'), board_out,
+                        widgets.HBox([play_button, stop_button, slider])])
+    return player, box
+
+# Define simulate function to to visually simulate the moves of a chess game.
+# Every click adds another board, and the boards play at the same time
 def simulate(button = None):
-    # Display output in a separate column
-    with out3:
-        # Draw and display the initial state of the chess board
-        board_svg = chess.svg.board(board=chess.Board())
-        display(SVG(board_svg))
-
-        # Retrieve list of moves from chess match with given 'id' value
-        descriptive_moves = games_df.loc[games_df['id'] == text_box_id.value, 
-                                         'moves'].values[0]
-
-        # Initialize an empty list to store moves in UCI (Universal Chess 
-        # Interface) format
-        uci_moves = []
+    game_id = text_box_id.value.strip()
 
-        # Create a new chess board object
-        board = chess.Board()
+    # Restart a game that is already shown instead of adding a second board
+    if game_id in players:
+        players[game_id].seek(0)
+        players[game_id].play()
+        return
+    player, box = board_widget(game_id, float(text_box_seconds.value))
+    players[game_id] = player
 
-        # Convert each descriptive move to UCI format and make the move 
-        # on the board
-        for move_str in descriptive_moves.split():
-            move = board.parse_san(move_str)
-            uci_moves.append(move.uci())
-            board.push(move)
-
-        # Reset the board to the initial state for animation
-        board = chess.Board()
-
-        # Animate each move on the chess board.
-        for move in uci_moves:
-            board.push_uci(move)
-
-            # Clear the previous board state before displaying the new one
-            clear_output(wait=True)
-
-            # Draw the current state of the board
-            board_svg = chess.svg.board(board=board)
-
-            # Display the updated board and pause for the specified number 
-            # of seconds
-            display(SVG(board_svg))
-            time.sleep(float(text_box_seconds.value)) 
+    # Display the board in a separate column and start the animation
+    with out3:
+        display(box)
+    player.play()
+
+# Define on_seconds_change function to apply a new number of seconds between
+# turns to the boards that are already playing
+def on_seconds_change(change):
+    try:
+        delay = float(change['new'])
+    except ValueError:
+        return
+    for player in players.values():
+        player.delay = delay
+
+text_box_seconds.observe(on_seconds_change, names='value')
 
 # Link simulate_button to simulate function
 simulate_button.on_click(simulate)    
\ No newline at end of file
@@ -0,0 +1,280 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program sends the low price emails of update_prices(). Alerts go on a queue
+# and a background thread sends them, so looking up prices never waits on the mail
+# server. Alerts arriving within a short time of each other are sent together in
+# one digest email. An item is alerted about again for the same reason only after a
+# cooldown, or sooner if its price dropped noticeably below the price it was last
+# alerted at, so an item that stays low is not emailed about every update.
+# SmtpSender keeps one SMTP connection open between digests, checking it still
+# works before using it and reconnecting if the server closed it. The mail server
+# and addresses come from the "email" settings of trackitems.json and from
+# environment variables, with the password only read from the environment, so a
+# local SMTP server (e.g. python -m aiosmtpd -n -l localhost:8025) can stand in
+# for the real one in tests.
+
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import db
+
+# Environment variables that set or override each mail setting
+ENVIRONMENT_SETTINGS = {'host': 'PRICE_ALERT_SMTP_HOST', 'port': 'PRICE_ALERT_SMTP_PORT',
+                        'username': 'PRICE_ALERT_SMTP_USER', 'password': 'PRICE_ALERT_SMTP_PASSWORD',
+                        'starttls': 'PRICE_ALERT_SMTP_STARTTLS', 'from_email': 'PRICE_ALERT_FROM',
+                        'to_email': 'PRICE_ALERT_TO'}
+
+# Define function to return the mail settings from a dictionary of settings (the
+# "email" section of trackitems.json) and the environment, which takes precedence.
+# The password is only taken from the environment
+def mail_settings(settings=None, environ=os.environ):
+    settings = {'host': 'smtp.gmail.com', 'port': 587, 'starttls': True,
+                **{key: value for key, value in (settings or {}).items() if key != 'password'}}
+    for key, variable in ENVIRONMENT_SETTINGS.items():
+        if environ.get(variable):
+            settings[key] = environ[variable]
+    settings['port'] = int(settings['port'])
+    if isinstance(settings['starttls'], str):
+        settings['starttls'] = settings['starttls'].lower() not in ('0', 'false', 'no')
+    settings.setdefault('username', settings.get('from_email'))
+    return settings
+
+# Define SmtpSender class that sends emails over one SMTP connection kept open
+# between emails. It is used from one thread at a time
+class SmtpSender:
+
+    # Connections idle for more than idle_timeout seconds are closed before the
+    # next email instead of being checked, since servers drop them after a while
+    def __init__(self, host, port, from_email, to_email, username=None, password=None,
+                 starttls=True, timeout=30, idle_timeout=240, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.from_email = from_email
+        self.to_email = to_email
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.connections = 0
+        self.sent = 0
+        self._server = None
+        self._last_used = None
+
+    # Define function to return an open connection, checking the kept one still
+    # works and connecting and logging in again if it does not
+    def _connection(self):
+        if self._server is not None and self.clock() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.username and self.password:
+                    server.login(self.username, self.password)
+            except BaseException:
+                server.close()
+                raise
+            self._server = server
+            self._last_used = self.clock()
+            self.connections += 1
+        return self._server
+
+    # Define send method to email a subject and body, reconnecting once if the
+    # server closed the connection
+    def send(self, subject, body):
+        msg = MIMEMultipart()
+        msg['From'] = self.from_email
+        msg['To'] = self.to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        for attempt in range(2):
+            server = self._connection()
+            try:
+                server.send_message(msg)
+                break
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt:
+                    raise
+        self._last_used = self.clock()
+        self.sent += 1
+
+    # Define close method to end the session with the server
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+# Define PrintSender class that prints the emails instead of sending them, used
+# when no recipient is set
+class PrintSender:
+
+    def __init__(self):
+        self.sent = 0
+
+    # Define send method to print a subject and body
+    def send(self, subject, body):
+        print(f'{subject}\n{body}')
+        self.sent += 1
+
+    # Define close method, which has nothing to close
+    def close(self):
+        pass
+
+# Define function to make the sender for mail settings as returned by mail_settings()
+def make_sender(settings):
+    if not settings.get('to_email') or not settings.get('from_email'):
+        return PrintSender()
+    return SmtpSender(settings['host'], settings['port'], settings['from_email'],
+                      settings['to_email'], username=settings.get('username'),
+                      password=settings.get('password'), starttls=settings['starttls'])
+
+# Define Alert class holding an item that reached a price
+class Alert:
+
+    def __init__(self, asset_type, name, price, reason):
+        self.asset_type = asset_type
+        self.name = name
+        self.price = price
+        self.reason = reason
+
+    # Define line method to return the alert as a line of a digest
+    def line(self):
+        return f'{self.name} ({self.asset_type}) is at {self.price:,.2f}, its {self.reason}'
+
+# Marker put on the queue to stop the worker. flush() puts an Event on the queue,
+# set once the alerts before it are sent
+STOP = object()
+
+# Define AlertQueue class that removes repeated alerts and sends the rest in
+# digests from a background thread
+class AlertQueue:
+
+    # sender has send(subject, body) and close() methods. An item is alerted about
+    # again for the same reason after cooldown seconds, or sooner if its price is
+    # min_drop (a fraction) below its last alerted price. Alerts are sent
+    # digest_seconds after the first one waiting. clock can be replaced in tests
+    def __init__(self, sender, cooldown=6 * 3600, min_drop=0.01, digest_seconds=60,
+                 clock=time.monotonic):
+        self.sender = sender
+        self.cooldown = cooldown
+        self.min_drop = min_drop
+        self.digest_seconds = digest_seconds
+        self.clock = clock
+        self.queued = 0
+        self.suppressed = 0
+        self.digests = 0
+        self.failures = 0
+        self._last = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Define add method to queue an alert about an item unless it was alerted about
+    # recently for the same reason. The price may be a string like the prices read
+    # from Amazon pages. Returns whether it was queued
+    def add(self, asset_type, name, price, reason):
+        key = (asset_type, name, reason)
+        price = db.to_price(price)
+        now = self.clock()
+        with self._lock:
+            last = self._last.get(key)
+            if (last is not None and now - last[0] < self.cooldown
+                    and price > last[1] * (1 - self.min_drop)):
+                self.suppressed += 1
+                return False
+            self._last[key] = (now, price)
+            self.queued += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='alert-sender',
+                                                daemon=True)
+                self._thread.start()
+        self._queue.put(Alert(asset_type, name, price, reason))
+        return True
+
+    # Define function to send the alerts waiting on the queue, collecting the ones
+    # that arrive within digest_seconds of the first, until stopped
+    def _worker(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is STOP:
+                    return
+                if isinstance(item, threading.Event):
+                    item.set()
+                    continue
+                batch = [item]
+                deadline = time.monotonic() + self.digest_seconds
+                while True:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is STOP or isinstance(item, threading.Event):
+                        break
+                    batch.append(item)
+                self._send(batch)
+                if isinstance(item, threading.Event):
+                    item.set()
+                if item is STOP:
+                    return
+        finally:
+            self.sender.close()
+
+    # Define function to send a digest of alerts. If it cannot be sent, the items
+    # are forgotten so their next alert is not held back by the cooldown
+    def _send(self, batch):
+        subject = f'Low Price: {", ".join(alert.name for alert in batch)}'
+        body = '\n'.join(alert.line() for alert in batch)
+        try:
+            self.sender.send(subject, body)
+            self.digests += 1
+        except Exception as e:
+            self.failures += 1
+            print(f'Could not send price alert email: {e!r}')
+            with self._lock:
+                for alert in batch:
+                    self._last.pop((alert.asset_type, alert.name, alert.reason), None)
+
+    # Define flush method to send the waiting alerts now and wait up to timeout
+    # seconds for them to be sent
+    def flush(self, timeout=30):
+        if self._thread is None:
+            return
+        sent = threading.Event()
+        self._queue.put(sent)
+        sent.wait(timeout)
+
+    # Define close method to send the waiting alerts, then stop the worker and
+    # close the sender's connection
+    def close(self, timeout=30):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            self.sender.close()
+            return
+        self._queue.put(STOP)
+        thread.join(timeout)
+
+    # Define stats method to return the counts of queued, suppressed and sent alerts
+    def stats(self):
+        return {'queued': self.queued, 'suppressed': self.suppressed, 'digests': self.digests,
+                'failures': self.failures, 'sent': self.sender.sent}
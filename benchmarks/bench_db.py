@@ -0,0 +1,87 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This script measures how many prices per second can be written to the price
+# database. It compares the old path, which commits every row on its own in the
+# default rollback journal mode, with the same per-row path in WAL mode and with
+# db.insert_prices(), which writes a whole batch in one transaction. The per-row
+# cases write to a stocks table in the layout of the first version of db.py, since
+# stocks is now a view. Each case writes to a fresh database in a temporary
+# directory.
+#
+# Example: python benchmarks/bench_db.py --rows 5000 --batch 100
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+# Define function to make rows of fake stock prices
+def make_rows(count):
+    timestamp = datetime.datetime(2024, 6, 9).strftime('%Y-%m-%d %H:%M:%S')
+    return [(f'TICK{i % 500}', 100 + (i % 997) / 10, timestamp) for i in range(count)]
+
+# Define function to write rows one at a time with a commit per row into a stocks
+# table like the first version's, as update_prices() used to. journal_mode is
+# 'DELETE' for the old default or 'WAL'
+def per_row(path, rows, journal_mode):
+    con = sqlite3.connect(path)
+    con.execute(f'PRAGMA journal_mode = {journal_mode};')
+    con.execute('''CREATE TABLE stocks (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     stock_symbol TEXT NOT NULL,
+                     price REAL NOT NULL,
+                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                   )''')
+    con.commit()
+    start = time.perf_counter()
+    for name, price, timestamp in rows:
+        cursor = con.cursor()
+        cursor.execute('INSERT INTO stocks (stock_symbol, price, timestamp) VALUES (?, ?, ?);',
+                       (name, price, timestamp))
+        con.commit()
+    elapsed = time.perf_counter() - start
+    con.close()
+    return elapsed
+
+# Define function to write rows in batches with db.insert_prices() on a
+# connection from db.connect()
+def batched(path, rows, batch):
+    db.create_database(path)
+    con = db.connect(path)
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        db.insert_prices(con, 'stock', rows[i:i + batch])
+    elapsed = time.perf_counter() - start
+    con.close()
+    return elapsed
+
+# Define main function to run every case and print rows per second
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Price database insert benchmark')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=100,
+                        help='rows per insert_prices() call, e.g. the prices of one update')
+    args = parser.parse_args(argv)
+    rows = make_rows(args.rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [('per-row commit, rollback journal',
+                  lambda path: per_row(path, rows, 'DELETE')),
+                 ('per-row commit, WAL', lambda path: per_row(path, rows, 'WAL')),
+                 (f'insert_prices batches of {args.batch}, WAL',
+                  lambda path: batched(path, rows, args.batch)),
+                 ('insert_prices single batch, WAL',
+                  lambda path: batched(path, rows, len(rows)))]
+        for number, (name, case) in enumerate(cases):
+            elapsed = case(os.path.join(directory, f'prices_{number}.db'))
+            print(f'{name:40} {args.rows / elapsed:12,.0f} rows/sec ({elapsed:.3f} s)')
+
+if __name__ == '__main__':
+    main()
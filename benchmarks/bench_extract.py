@@ -0,0 +1,94 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This script compares how fast the extractors of price_extractors.py read the
+# product name and price out of Amazon product pages. It runs over saved pages
+# (every .html file in a directory) or, without one, over synthetic pages shaped
+# like Amazon's: large inline scripts and navigation before the title and price
+# and a long list of reviews after them. It first checks that every extractor
+# returns the same name and price for every page, then prints pages per second.
+#
+# Example: python benchmarks/bench_extract.py --fixtures saved_pages/ --repeat 20
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import price_extractors
+
+# Define function to make a synthetic product page of about size_kb kilobytes with
+# the given title and price
+def synthetic_page(title, whole, fraction, size_kb=800, seed=0):
+    rng = random.Random(seed)
+    filler = lambda n: ''.join(rng.choice('abcdefghij klmnop') for _ in range(n))
+    head_scripts = ''.join(f'<script>var d{i} = "{filler(4000)}";</script>' for i in range(size_kb // 16))
+    navigation = ''.join(f'<div class="nav-item"><a href="/x/{i}">{filler(40)}</a></div>'
+                         for i in range(size_kb * 2))
+    reviews = ''.join(f'<div class="review"><span class="a-profile-name">{filler(12)}</span>'
+                      f'<p>{filler(600)}</p><span class="a-price-whole">{rng.randint(1, 99)}'
+                      f'<span class="a-price-decimal">.</span></span>'
+                      f'<span class="a-price-fraction">{rng.randint(10, 99)}</span></div>'
+                      for _ in range(size_kb))
+    return (f'<!DOCTYPE html><html><head><title>Amazon.com</title>{head_scripts}</head><body>'
+            f'<div id="nav">{navigation}</div>'
+            f'<div id="centerCol"><h1><span id="productTitle" class="a-size-large">\n  {title}  \n</span></h1>'
+            f'<div id="corePrice"><span class="a-price aok-align-center"><span class="a-offscreen">$x</span>'
+            f'<span aria-hidden="true"><span class="a-price-symbol">$</span>'
+            f'<span class="a-price-whole">{whole}<span class="a-price-decimal">.</span></span>'
+            f'<span class="a-price-fraction">{fraction}</span></span></span></div></div>'
+            f'<div id="reviews">{reviews}</div></body></html>')
+
+# Define function to load every .html file in a directory
+def load_fixtures(directory):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            pages[os.path.basename(path)] = file.read()
+    return pages
+
+# Define main function to check the extractors agree and print their speed
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare Amazon price extractors')
+    parser.add_argument('--fixtures', help='directory of saved product pages (.html)')
+    parser.add_argument('--pages', type=int, default=5, help='synthetic pages to make')
+    parser.add_argument('--size-kb', type=int, default=800, help='size of each synthetic page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        pages = load_fixtures(args.fixtures)
+    else:
+        pages = {f'synthetic_{i}': synthetic_page(f'Product {i} with a long name', f'{i + 1},2{i}9',
+                                                  f'{i}9', size_kb=args.size_kb, seed=i)
+                 for i in range(args.pages)}
+    if not pages:
+        parser.error('no pages to extract from')
+    print(f'{len(pages)} pages, {sum(map(len, pages.values())) / len(pages) / 1024:.0f} KB on average')
+
+    # Time the BeautifulSoup extractor of the first version first, as the baseline
+    names = ['soup'] + [name for name in price_extractors.EXTRACTORS if name != 'soup']
+    extractors = {name: price_extractors.EXTRACTORS[name]() for name in names}
+
+    # Check every extractor reads the same name and price from every page
+    for page_name, page in pages.items():
+        results = {name: extractor.extract(page) for name, extractor in extractors.items()}
+        if len(set(results.values())) != 1:
+            raise SystemExit(f'extractors disagree on {page_name}: {results}')
+
+    baseline = None
+    for name, extractor in extractors.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for page in pages.values():
+                extractor.extract(page)
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(pages))
+        baseline = baseline or elapsed
+        print(f'{name:10} {elapsed * 1000:8.2f} ms/page {1 / elapsed:8.1f} pages/sec '
+              f'{baseline / elapsed:6.1f}x')
+
+if __name__ == '__main__':
+    main()
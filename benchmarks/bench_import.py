@@ -0,0 +1,68 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This script measures the cold import cost of the chess modules. Each module is
+# imported in a fresh Python process so nothing is cached between runs, and the
+# child process reports how long the import took and its peak resident memory.
+# It compares the headless chess_analytics core against the ChessFunctions front
+# end, and can optionally time the first access of win_rates_df as well.
+#
+# Example: python benchmarks/bench_import.py --data-dir . --repeat 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Code run inside each child process. It imports the module, optionally builds
+# win_rates_df, and prints the timings and peak memory as json
+CHILD_CODE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+if sys.argv[2] == "1":
+    if hasattr(module, "ChessDataset"):
+        module.ChessDataset("games.csv").win_rates_df
+    else:
+        module.win_rates_df
+finished = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "first_table_s": finished - imported,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": sorted(m for m in ("matplotlib", "ipywidgets", "chess")
+                      if m in sys.modules),
+}))
+'''
+
+# Define function to import a module in a fresh interpreter and return its measurements
+def measure(module_name, data_dir, touch):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=repo_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-c', CHILD_CODE, module_name, '1' if touch else '0'],
+                            cwd=data_dir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+# Define function to run the benchmark several times per module and print the medians
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold import benchmark for the chess modules')
+    parser.add_argument('--data-dir', default='.', help='directory containing games.csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--touch', action='store_true',
+                        help='also time the first access of win_rates_df')
+    parser.add_argument('modules', nargs='*', default=['chess_analytics', 'ChessFunctions'])
+    args = parser.parse_args(argv)
+
+    for module_name in args.modules:
+        runs = [measure(module_name, args.data_dir, args.touch) for _ in range(args.repeat)]
+        print(f"{module_name}: "
+              f"import {statistics.median(r['import_s'] for r in runs) * 1000:.1f} ms, "
+              f"first table {statistics.median(r['first_table_s'] for r in runs) * 1000:.1f} ms, "
+              f"peak RSS {statistics.median(r['max_rss_mb'] for r in runs):.1f} MB, "
+              f"loaded {', '.join(runs[0]['modules']) or 'no plotting/widget modules'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This script benchmarks the hot paths of the chess analysis on a games csv, by
+# default a synthetic one written by make_games.py with the requested number of
+# rows. Every case runs in its own Python process so the peak memory of one case
+# does not hide another's. A case is set up once (e.g. loading the games), run
+# several times to time it, and run once more under tracemalloc to measure the
+# peak memory it allocates. Cold cases, like importing the module, start a new
+# process for every run instead. Results are appended to a history file, and
+# each run is compared with the median of earlier runs on the same number of rows
+# to detect regressions in time or memory.
+#
+# Example: python benchmarks/bench_suite.py --rows 1000000 --repeat 5
+#          python benchmarks/bench_suite.py --data games.csv win_rates getwinners
+
+import argparse
+from datetime import datetime, timezone
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Directory for generated csv files and default history file
+DATA_DIR = os.path.join(BENCH_DIR, 'bench_data')
+HISTORY_PATH = os.path.join(BENCH_DIR, 'history.jsonl')
+
+# Smallest growth in seconds or megabytes reported as a regression, so the noise of
+# cases that take a few milliseconds is not reported
+NOISE_FLOOR = {'median_s': 0.005, 'peak_mb': 1.0}
+
+# Define function to remove cached tables from a ChessDataset so they are computed
+# again the next time they are used
+def forget(dataset, *names):
+    for name in names:
+        dataset.__dict__.pop(name, None)
+
+# Define function to load the dataset used by the warm cases
+def load_dataset(path):
+    import chess_analytics
+    dataset = chess_analytics.ChessDataset(path)
+    dataset.games_df
+    return dataset
+
+# Define the set up function of every case. Each returns the function that is
+# timed, given the csv path and the command line arguments
+def setup_import(path, args):
+    return lambda: importlib.import_module('chess_analytics')
+
+def setup_load(path, args):
+    import chess_analytics
+    return lambda: chess_analytics.ChessDataset(path).games_df
+
+def setup_win_rates(path, args):
+    dataset = load_dataset(path)
+
+    def run():
+        forget(dataset, 'rating_group_stats', 'win_rates_df')
+        return dataset.win_rates_df
+    return run
+
+def setup_opening_stats(path, args):
+    dataset = load_dataset(path)
+
+    def run():
+        forget(dataset, 'opening_index', 'opening_outcomes')
+        dataset._opening_stats.clear()
+        return dataset.opening_stats('white'), dataset.opening_stats('black')
+    return run
+
+def setup_getwinners(path, args):
+    dataset = load_dataset(path)
+
+    def run():
+        forget(dataset, 'rating_comparison_table')
+        return [dataset.getwinners(r1, r2, winner)
+                for r1, r2 in (('white_rating', 'black_rating'), ('black_rating', 'white_rating'))
+                for winner in ('white', 'black')]
+    return run
+
+def setup_move_tokens(path, args):
+    dataset = load_dataset(path)
+
+    def run():
+        forget(dataset, 'move_tokens')
+        return dataset.move_tokens
+    return run
+
+def setup_move_counts(path, args):
+    import numpy as np
+    dataset = load_dataset(path)
+    dataset.move_tokens
+
+    # Count the moves of the 10 most played openings
+    index = dataset.opening_index
+    openings = index.names[np.argsort(-index.counts, kind='stable')[:10]]
+    return lambda: [dataset.move_counts(opening=opening) for opening in openings]
+
+def setup_rating_difference(path, args):
+    import numpy as np
+    dataset = load_dataset(path)
+    rows = np.arange(len(dataset.games_df))
+    return lambda: dataset.summarize_rows(rows)
+
+def setup_replay(path, args):
+    import games_cache
+    import game_replay
+    moves_list = games_cache.open_cache(path).series('moves')[:args.replay_games].tolist()
+    return lambda: game_replay.replay_games(moves_list, workers=1)
+
+# Benchmark cases in the order they run: name, set up function and whether every
+# run needs a fresh process
+CASES = {
+    'import': (setup_import, True),
+    'load': (setup_load, False),
+    'win_rates': (setup_win_rates, False),
+    'opening_stats': (setup_opening_stats, False),
+    'getwinners': (setup_getwinners, False),
+    'move_tokens': (setup_move_tokens, False),
+    'move_counts': (setup_move_counts, False),
+    'rating_difference': (setup_rating_difference, False),
+    'replay': (setup_replay, False),
+}
+
+# Define function run inside the child process: set a case up, time it, measure
+# its peak allocations and print the results as json
+def run_child(case, path, args):
+    sys.path.insert(0, REPO_DIR)
+    run = CASES[case][0](path, args)
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    # Measure the allocations of one more run, unless it was a cold import that
+    # would now be cached
+    peak_mb = None
+    if not CASES[case][1]:
+        tracemalloc.start()
+        run()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    print(json.dumps({'times': times, 'peak_mb': peak_mb,
+                      'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+# Define function to run one case in child processes and return its results
+def measure(case, path, args):
+    cold = CASES[case][1]
+    command = [sys.executable, os.path.abspath(__file__), '--child', case, '--data', path,
+               '--replay-games', str(args.replay_games)]
+    runs = []
+    for _ in range(args.repeat if cold else 1):
+        result = subprocess.run(command + ['--repeat', '1' if cold else str(args.repeat)],
+                                cwd=os.path.dirname(os.path.abspath(path)),
+                                capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    times = [t for run in runs for t in run['times']]
+    peaks = [run['peak_mb'] for run in runs if run['peak_mb'] is not None]
+    return {'median_s': statistics.median(times), 'min_s': min(times),
+            'peak_mb': max(peaks) if peaks else None,
+            'max_rss_mb': max(run['max_rss_mb'] for run in runs)}
+
+# Define function to return the commit the benchmarks ran on, if known
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Define function to read earlier results from the history file
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+# Define function to compare a run with the median of the last few earlier runs
+# on the same number of rows. Returns a list of (case, measure, old, new) tuples
+# for every time or memory figure that grew by more than the tolerance and more
+# than the noise floor
+def find_regressions(entry, history, tolerance=0.2, window=5):
+    earlier = [old for old in history if old['rows'] == entry['rows']][-window:]
+    regressions = []
+    for case, result in entry['results'].items():
+        for measure_name in ('median_s', 'peak_mb'):
+            values = [old['results'][case][measure_name] for old in earlier
+                      if case in old['results'] and old['results'][case][measure_name] is not None]
+            if not values or result[measure_name] is None:
+                continue
+            baseline = statistics.median(values)
+            growth = result[measure_name] - baseline
+            if growth > baseline * tolerance and growth > NOISE_FLOOR[measure_name]:
+                regressions.append((case, measure_name, baseline, result[measure_name]))
+    return regressions
+
+# Define function to count the games in a csv file without loading it
+def count_rows(path):
+    with open(path, 'rb') as file:
+        return sum(1 for _ in file) - 1
+
+# Define main function to parse command line arguments, run the cases, store
+# the results and report regressions
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the chess analysis hot paths')
+    parser.add_argument('cases', nargs='*', help=f'cases to run (default: all of {", ".join(CASES)})')
+    parser.add_argument('--rows', type=int, default=20_000,
+                        help='rows of the synthetic games.csv to generate')
+    parser.add_argument('--data', help='benchmark this csv instead of a synthetic one')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--replay-games', type=int, default=1000,
+                        help='number of games replayed by the replay case')
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--no-save', action='store_true', help='do not add this run to the history')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown or memory growth reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.data, args)
+        return 0
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)}')
+
+    # Generate the synthetic data once per size, and build its columnar cache so
+    # the cases do not time that
+    sys.path.insert(0, REPO_DIR)
+    import games_cache
+    if args.data:
+        path = os.path.abspath(args.data)
+        rows = count_rows(path)
+    else:
+        import make_games
+        rows = args.rows
+        path = os.path.join(DATA_DIR, f'games_{rows}.csv')
+        if not os.path.exists(path):
+            print(f'Generating {rows} synthetic games in {path}', flush=True)
+            make_games.make_games(path, rows)
+    games_cache.open_cache(path)
+
+    results = {}
+    for case in args.cases or list(CASES):
+        result = results[case] = measure(case, path, args)
+        peak = 'n/a' if result['peak_mb'] is None else f"{result['peak_mb']:.1f} MB"
+        print(f"{case:18} median {result['median_s'] * 1000:10.1f} ms  "
+              f"min {result['min_s'] * 1000:10.1f} ms  peak alloc {peak:>10}  "
+              f"max RSS {result['max_rss_mb']:.1f} MB", flush=True)
+
+    entry = {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+             'commit': git_commit(), 'python': platform.python_version(),
+             'data': os.path.basename(path), 'rows': rows, 'repeat': args.repeat,
+             'results': results}
+    regressions = find_regressions(entry, read_history(args.history), args.tolerance)
+    for case, measure_name, baseline, value in regressions:
+        print(f'REGRESSION {case} {measure_name}: {value:.4g} vs median {baseline:.4g} '
+              f'of earlier runs')
+    if not args.no_save:
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(entry) + '\n')
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This script writes a synthetic games.csv with the same columns as the Lichess
+# dataset, scalable from thousands to millions of rows, for the benchmarks. Moves
+# are legal games made by playing random legal moves with python-chess, so the
+# SAN replay can be benchmarked too. Because playing out millions of games would
+# take longer than the benchmarks themselves, a pool of random games is played
+# once and every row picks one of them. Openings follow a long tailed popularity
+# like the real data, and the winner depends on the rating difference. Rows are
+# written in chunks, so memory stays bounded for large files.
+#
+# Example: python benchmarks/make_games.py bench_data/games.csv --rows 1000000
+
+import argparse
+import os
+
+import chess
+import numpy as np
+import pandas as pd
+
+# Number of rows generated and written at a time
+CHUNK_SIZE = 500_000
+
+# Opening names and ECO codes used for the synthetic games
+OPENINGS = [
+    ('Sicilian Defense', 'B20'), ('French Defense', 'C00'), ('Queen\'s Pawn Game', 'D00'),
+    ('Italian Game', 'C50'), ('King\'s Pawn Game', 'C20'), ('Ruy Lopez', 'C60'),
+    ('English Opening', 'A10'), ('Scandinavian Defense', 'B01'), ('Caro-Kann Defense', 'B10'),
+    ('Philidor Defense', 'C41'), ('Van\'t Kruijs Opening', 'A00'), ('Scotch Game', 'C45'),
+    ('Queen\'s Gambit Declined', 'D30'), ('Four Knights Game', 'C47'), ('Slav Defense', 'D10'),
+    ('Pirc Defense', 'B07'), ('Indian Game', 'A45'), ('Zukertort Opening', 'A04'),
+    ('Bishop\'s Opening', 'C23'), ('Owen Defense', 'B00'), ('Russian Game', 'C42'),
+    ('Modern Defense', 'B06'), ('Nimzowitsch Defense', 'B00'), ('Petrov\'s Defense', 'C42'),
+    ('King\'s Gambit Accepted', 'C33'), ('Vienna Game', 'C25'), ('Alekhine Defense', 'B02'),
+    ('Dutch Defense', 'A80'), ('Center Game', 'C22'), ('Ponziani Opening', 'C44'),
+    ('Bird Opening', 'A02'), ('Benoni Defense', 'A56'), ('Grob Opening', 'A00'),
+    ('Polish Opening', 'A00'), ('Danish Gambit', 'C21'), ('Elephant Gambit', 'C40'),
+    ('Horwitz Defense', 'A40'), ('Mieses Opening', 'A00'), ('Englund Gambit', 'A40'),
+    ('Trompowsky Attack', 'A45'),
+]
+
+# Other categorical columns and the share of rows taking each value
+VICTORY_STATUS = (['resign', 'mate', 'outoftime', 'draw'], [0.56, 0.32, 0.08, 0.04])
+INCREMENT_CODES = (['10+0', '15+0', '15+15', '5+5', '5+8', '8+0', '10+5', '20+0'],
+                   [0.38, 0.06, 0.04, 0.04, 0.03, 0.03, 0.03, 0.39])
+
+# Define function to play random legal games and return their SAN moves. Game
+# lengths are drawn between 2 and max_plies plies
+def random_games(count, rng, max_plies=120):
+    games = []
+    for length in rng.integers(2, max_plies + 1, size=count):
+        board = chess.Board()
+        moves = []
+        while len(moves) < length and not board.is_game_over():
+            legal = list(board.legal_moves)
+            move = legal[rng.integers(len(legal))]
+            moves.append(board.san(move))
+            board.push(move)
+        games.append(' '.join(moves))
+    return games
+
+# Define function to generate one chunk of rows starting at row number start
+def make_chunk(start, rows, pool, rng):
+    white_rating = np.clip(rng.normal(1600, 290, rows), 780, 2720).astype(np.int64)
+    black_rating = np.clip(white_rating + rng.normal(0, 250, rows), 780, 2720).astype(np.int64)
+
+    # White scores according to the Elo formula with a small first move advantage,
+    # and about one game in twenty is drawn
+    expected = 1 / (1 + 10 ** (-(white_rating - black_rating + 30) / 400))
+    draw = rng.random(rows) < 0.05
+    white_wins = rng.random(rows) < expected
+    winner = np.where(draw, 'draw', np.where(white_wins, 'white', 'black'))
+    victory = rng.choice(VICTORY_STATUS[0][:3], size=rows, p=np.array(VICTORY_STATUS[1][:3]) / 0.96)
+    victory = np.where(draw, 'draw', victory)
+
+    # Pick openings with a long tailed popularity
+    weights = 1 / np.arange(1, len(OPENINGS) + 1) ** 1.1
+    opening = rng.choice(len(OPENINGS), size=rows, p=weights / weights.sum())
+    moves = np.asarray(pool, dtype=object)[rng.integers(len(pool), size=rows)]
+    created = 1.5e12 + rng.integers(0, 10 ** 10, size=rows).astype(float)
+
+    return pd.DataFrame({
+        'id': [f'g{row:08d}' for row in range(start, start + rows)],
+        'rated': rng.random(rows) < 0.8,
+        'created_at': created,
+        'last_move_at': created + rng.integers(0, 10 ** 6, size=rows),
+        'turns': [len(game.split()) for game in moves],
+        'victory_status': victory,
+        'winner': winner,
+        'increment_code': rng.choice(INCREMENT_CODES[0], size=rows, p=INCREMENT_CODES[1]),
+        'white_id': [f'player{n:05d}' for n in rng.integers(0, 20000, size=rows)],
+        'white_rating': white_rating,
+        'black_id': [f'player{n:05d}' for n in rng.integers(0, 20000, size=rows)],
+        'black_rating': black_rating,
+        'moves': moves,
+        'opening_eco': [OPENINGS[code][1] for code in opening],
+        'opening_name': [OPENINGS[code][0] for code in opening],
+        'opening_ply': rng.integers(1, 11, size=rows),
+    })
+
+# Define function to write a synthetic games csv with the given number of rows
+def make_games(path, rows, pool_size=2000, seed=0, chunk_size=CHUNK_SIZE):
+    rng = np.random.default_rng(seed)
+    pool = random_games(min(pool_size, rows), rng)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    for start in range(0, rows, chunk_size):
+        chunk = make_chunk(start, min(chunk_size, rows - start), pool, rng)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
+
+# Define main function to parse command line arguments and write the file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic games.csv for benchmarks')
+    parser.add_argument('path', nargs='?', default='bench_data/games.csv')
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--pool-size', type=int, default=2000,
+                        help='number of distinct random games to sample moves from')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    make_games(args.path, args.rows, pool_size=args.pool_size, seed=args.seed)
+    print(f'Wrote {args.rows} games to {args.path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file animates a replayed chess game without blocking. Instead of sleeping
+# between moves inside a widget callback, which freezes the notebook until the
+# game is over, each board is played by an asyncio task on the kernel's event
+# loop, so other widgets keep responding. A player can be paused, resumed,
+# stopped and moved to any ply, and several players can run at the same time.
+# The boards of the next few plies are rendered ahead of the playhead in a thread
+# pool, so showing a move does not wait for the SVG to be drawn. The player only
+# hands the rendered SVG to a show callback, so it does not depend on ipywidgets.
+
+import asyncio
+from collections import Counter
+
+# Number of plies rendered ahead of the playhead by default
+LOOKAHEAD = 8
+
+# Define BoardPlayer class that plays one game of a game_replay.ReplayStore
+class BoardPlayer:
+
+    # Set up a player for a row of the replay store. show is called with the ply
+    # and the board SVG each time a board is shown, svgs is a game_replay.SvgCache
+    # and delay is the number of seconds between moves. render returns a future of
+    # the SVG for a position key and FEN, rendering with svgs in a thread by
+    # default, and sleep waits a number of seconds; both can be replaced in tests
+    def __init__(self, replay, row, show, svgs, delay=1.0, lookahead=LOOKAHEAD,
+                 render=None, sleep=asyncio.sleep):
+        self.replay = replay
+        self.row = row
+        self.show = show
+        self.svgs = svgs
+        self.delay = delay
+        self.lookahead = lookahead
+        self.render = render or self._render
+        self.sleep = sleep
+        self.ply = 0
+        self.last_ply = replay.plies(row)
+        self.shown_ply = None
+        self.loop = None
+        self._frames = {}
+        self._awaited = Counter()
+        self._task = None
+        self._playing = asyncio.Event()
+        self._wake = asyncio.Event()
+
+    # Define playing property that is True while the game is advancing
+    @property
+    def playing(self):
+        return self._playing.is_set()
+
+    # Define function to render a board with the SVG cache in the default thread pool
+    def _render(self, key, fen):
+        return self.loop.run_in_executor(None, self.svgs.get, key, fen)
+
+    # Define function to return the future rendering the board of a ply, starting
+    # the rendering if it has not been started yet
+    def _frame(self, ply):
+        if ply not in self._frames:
+            self._frames[ply] = self.render(self.replay.key(self.row, ply),
+                                            self.replay.fen(self.row, ply))
+        return self._frames[ply]
+
+    # Define function to start rendering the boards from the playhead up to
+    # lookahead plies ahead, forgetting frames that are far behind or ahead of it.
+    # Frames a _show() call is waiting for are kept, since cancelling them would
+    # cancel the task waiting
+    def _prefetch(self):
+        end = min(self.ply + self.lookahead, self.last_ply)
+        for ply in [ply for ply in self._frames
+                    if not self.ply - 1 <= ply <= end and not self._awaited[ply]]:
+            self._frames.pop(ply).cancel()
+        for ply in range(self.ply, end + 1):
+            self._frame(ply)
+
+    # Define function to wait for the board of a ply and show it, unless the
+    # playhead was moved to another ply in the meantime
+    async def _show(self, ply):
+        self._awaited[ply] += 1
+        try:
+            svg = await self._frame(ply)
+        finally:
+            self._awaited[ply] -= 1
+        if ply != self.ply:
+            return
+        self.shown_ply = ply
+        self.show(ply, svg)
+
+    # Define function run by the asyncio task: show the board at the playhead,
+    # wait delay seconds (or until woken by pause or seek) and advance one ply
+    async def _run(self):
+        while True:
+            await self._playing.wait()
+            if self.shown_ply != self.ply:
+                self._prefetch()
+                await self._show(self.ply)
+
+                # Show the new playhead first if it was moved while rendering
+                if self.shown_ply != self.ply:
+                    continue
+            if self.ply >= self.last_ply:
+                self._playing.clear()
+                continue
+            self._wake.clear()
+            woken = self.loop.create_task(self._wake.wait())
+            timer = self.loop.create_task(self.sleep(self.delay))
+            try:
+                await asyncio.wait([woken, timer], return_when=asyncio.FIRST_COMPLETED)
+                advance = not woken.done()
+            finally:
+                woken.cancel()
+                timer.cancel()
+            if advance and self.playing:
+                self.ply += 1
+
+    # Define function to create the asyncio task the first time it is needed
+    def _start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+
+    # Define play method to start or resume the animation, starting over if the
+    # game has already been played to the end
+    def play(self):
+        self._start()
+        if self.ply >= self.last_ply:
+            self.ply = 0
+        self._playing.set()
+        self._wake.set()
+
+    # Define pause method to stop advancing, keeping the current board shown
+    def pause(self):
+        self._playing.clear()
+        self._wake.set()
+
+    # Define seek method to move the playhead to a ply and show its board right
+    # away, whether the game is playing or paused
+    def seek(self, ply):
+        self._start()
+        ply = max(0, min(int(ply), self.last_ply))
+        if ply == self.ply and self.shown_ply == ply:
+            return
+        self.ply = ply
+        self._prefetch()
+        if self.playing:
+            self._wake.set()
+        else:
+            self.loop.create_task(self._show(ply))
+
+    # Define step method to move the playhead forward (or back) a number of plies
+    def step(self, plies=1):
+        self.seek(self.ply + plies)
+
+    # Define stop method to cancel the animation and the boards still rendering
+    def stop(self):
+        self._playing.clear()
+        if self._task is not None:
+            self._task.cancel()
+        for frame in self._frames.values():
+            frame.cancel()
+        self._frames.clear()
@@ -0,0 +1,154 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program keeps a pool of headless Chrome browsers open for the life of the
+# scheduler process, so loading Amazon pages does not start a new browser (and look
+# up the chromedriver binary) every ten minutes. The pool holds up to a fixed number
+# of browsers that load pages in parallel. Before a browser is handed out it is
+# checked to still respond, and a browser that stopped responding, raised an error,
+# or has loaded a set number of pages is closed and replaced with a fresh one to
+# keep memory use down. The chromedriver path is looked up once per process. The
+# function that starts a browser can be replaced, e.g. with fake drivers in tests.
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import os
+import queue
+import threading
+
+# Define function to return the path of the chromedriver binary, installing it with
+# webdriver_manager the first time. The CHROMEDRIVER_PATH environment variable can
+# point at an existing binary instead
+@functools.lru_cache(maxsize=None)
+def driver_path():
+    if os.environ.get('CHROMEDRIVER_PATH'):
+        return os.environ['CHROMEDRIVER_PATH']
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+# Define function to start a headless Chrome browser that gives up on pages that
+# take longer than page_timeout seconds to load
+def start_chrome(page_timeout=30):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    # Set Chrome options to run headless to avoid opening GUI
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    driver = webdriver.Chrome(service=Service(driver_path()), options=chrome_options)
+    driver.set_page_load_timeout(page_timeout)
+    return driver
+
+# Define BrowserPool class that lends out long lived browsers
+class BrowserPool:
+
+    # Create a pool of at most size browsers, each replaced after max_pages pages.
+    # start_driver is called with no arguments to start a browser
+    def __init__(self, size=2, max_pages=50, start_driver=start_chrome):
+        self.size = size
+        self.max_pages = max_pages
+        self.start_driver = start_driver
+        self.started = 0
+        self.recycled = 0
+        self.pages = 0
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # Define function to check that a browser still responds
+    @staticmethod
+    def _healthy(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    # Define function to close a browser, ignoring errors from one that already died
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+
+    # Define function to take an idle healthy browser, start a new one if the pool
+    # is not full, or wait for a browser to be returned
+    def _take(self):
+        while True:
+            try:
+                driver, pages = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._closed:
+                        raise RuntimeError('browser pool is closed')
+                    can_start = self._open < self.size
+                    if can_start:
+                        self._open += 1
+                if can_start:
+                    try:
+                        driver = self.start_driver()
+                    except BaseException:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    self.started += 1
+                    return driver, 0
+                driver, pages = self._idle.get()
+            if self._healthy(driver):
+                return driver, pages
+            self.recycled += 1
+            self._quit(driver)
+
+    # Define browser method, used in a with statement, to borrow a browser. A
+    # browser that raised an error or reached max_pages is replaced afterwards
+    @contextmanager
+    def browser(self):
+        driver, pages = self._take()
+        failed = True
+        try:
+            yield driver
+            failed = False
+        finally:
+            pages += 1
+            self.pages += 1
+            if failed or pages >= self.max_pages or self._closed:
+                self.recycled += not self._closed
+                self._quit(driver)
+            else:
+                self._idle.put((driver, pages))
+
+    # Define fetch method to load a page and return parse() of its HTML source
+    def fetch(self, url, parse):
+        with self.browser() as driver:
+            driver.get(url)
+            page_source = driver.page_source
+        return parse(page_source)
+
+    # Define fetch_many method to load pages in parallel, one per browser. Returns a
+    # list with parse() of each page, or the exception raised for it, in url order
+    def fetch_many(self, urls, parse):
+        def fetch_or_error(url):
+            try:
+                return self.fetch(url, parse)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(fetch_or_error, urls))
+
+    # Define close method to quit every idle browser. Browsers still in use are
+    # quit when they are returned
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
@@ -0,0 +1,716 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file is the headless analytics core of our chess data analysis project. It
+# holds every calculation that ChessFunctions.py used to run at import time (win
+# percentages by rating, win rates by game length, opening statistics) behind a
+# ChessDataset object that only reads games.csv and derives each table the first
+# time it is asked for, then keeps the result for later calls. It only depends on
+# pandas and numpy, so batch jobs can import it without pulling in matplotlib,
+# ipywidgets, or python-chess. The widget and plotting front end lives in
+# ChessFunctions.py, which imports this module.
+
+from functools import cached_property
+import threading
+
+import pandas as pd
+import numpy as np
+
+import games_cache
+from move_stats import MoveTokens
+from opening_tree import OpeningTree
+
+# Define bins and labels for rating groups
+rating_bins = [0, 1200, 1400, 1600, 1800, 2000, 2200, 2400, 2600]
+rating_labels = ['0-1200', '1200-1400', '1400-1600', '1600-1800',
+         '1800-2000', '2000-2200', '2200-2400', '2400-2600']
+
+# Define bins and labels for categorizing games by their turn count
+turn_bins = [0, 30, 60, 90, 120, 150, float('inf')]
+turn_labels = ['0-30', '31-60', '61-90', '91-120', '121-150', '150+']
+
+# Define bins and labels for the difference between white's and black's rating
+difference_bins = [-float('inf'), -400, -200, -100, 0, 100, 200, 400, float('inf')]
+difference_labels = ['<-400', '-400 to -200', '-200 to -100', '-100 to 0', '0 to 100',
+                     '100 to 200', '200 to 400', '400+']
+
+# Define bins (estimated game length in seconds) and labels for time controls
+time_control_bins = [0, 30, 180, 480, 1500, float('inf')]
+time_control_labels = ['ultrabullet', 'bullet', 'blitz', 'rapid', 'classical']
+
+# Define bins and labels for the rating difference chart of the interactive visualizer
+impact_bins = [-400, -200, -100, 0, 100, 200, 400]
+impact_labels = ['<-200', '-200 to -100', '-100 to 0', '0 to 100', '100 to 200', '200+']
+
+# Possible match outcomes in the order used by outcome_codes()
+OUTCOMES = ('white', 'black', 'draw')
+
+# Define function to create 'low-high' labels for a list of bin edges
+def bucket_labels(bins):
+    if list(bins) == rating_bins:
+        return list(rating_labels)
+    return [f'{low:g}-{high:g}' for low, high in zip(bins[:-1], bins[1:])]
+
+# Define function to return the bucket number of each value, where bucket i holds
+# values in [bins[i], bins[i + 1]). Values outside the bins and NaN get -1
+def bucket_codes(values, bins):
+    codes = np.searchsorted(np.asarray(bins, dtype=float), values, side='right') - 1
+    codes[(codes >= len(bins) - 1) | np.isnan(values)] = -1
+    return codes
+
+# Define function to convert the winner column into integer codes following
+# OUTCOMES, with -1 for any other value
+def outcome_codes(winner):
+    return pd.Categorical(winner, categories=OUTCOMES).codes.astype(np.int64)
+
+# Define function to turn outcome tallies and totals per bucket into the columns of
+# win_rates_df. Buckets without matches get rates of 0
+def bucket_rate_frame(tallies, totals, index, include_draws=False):
+    totals = np.asarray(totals, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(totals[:, None] > 0, tallies / totals[:, None] * 100, 0.0)
+    stats = pd.DataFrame({'white_win_rate': rates[:, 0],
+                          'black_win_rate': rates[:, 1]}, index=index)
+
+    # Create win_rate_diff column to show difference between white win rate and
+    # black win rate
+    stats['win_rate_diff'] = stats['white_win_rate'] - stats['black_win_rate']
+    stats['total_matches'] = totals
+    if include_draws:
+        stats['draw_rate'] = rates[:, 2]
+    return stats
+
+# Define outcome_percentages function to return the percentage of games won by
+# white, won by black, and drawn, out of all games given
+def outcome_percentages(winner):
+    outcomes = outcome_codes(winner)
+    counts = np.bincount(outcomes[outcomes >= 0], minlength=3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return counts * 100 / len(outcomes)
+
+# Define summarize_games function to calculate everything the interactive
+# visualizer shows about a group of games from plain arrays: the number of games,
+# counts and percentages of each outcome, mean turns and ratings, how many games
+# fall in each rating difference bin, and the share of each winner per bin.
+# Returns plain data for the plotting functions to render
+def summarize_games(white_rating, black_rating, winner, turns, bins=impact_bins,
+                    labels=impact_labels):
+    white_rating = np.asarray(white_rating, dtype=float)
+    black_rating = np.asarray(black_rating, dtype=float)
+    outcomes = outcome_codes(winner)
+    counts = np.bincount(outcomes[outcomes >= 0], minlength=3)
+
+    # Count games and outcomes per rating difference bin in one bincount
+    buckets = bucket_codes(white_rating - black_rating, bins)
+    counted = (buckets >= 0) & (outcomes >= 0)
+    tallies = np.bincount(buckets[counted] * 3 + outcomes[counted],
+                          minlength=len(labels) * 3).reshape(len(labels), 3)
+    histogram = np.bincount(buckets[buckets >= 0], minlength=len(labels))
+
+    # Calculate the share of each winner per bin, with winners in alphabetical order
+    # and bins without games at 0
+    present = [code for code in np.argsort(OUTCOMES) if tallies[:, code].sum() > 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = tallies[:, present] / tallies.sum(axis=1, keepdims=True)
+    difference_rates = pd.DataFrame(
+        np.nan_to_num(shares), index=pd.Index(labels, name='rating_difference_group'),
+        columns=pd.Index([OUTCOMES[code] for code in present], name='winner'))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = counts * 100 / len(outcomes)
+    return {'games': len(outcomes),
+            'outcome_counts': dict(zip(OUTCOMES, counts.tolist())),
+            'outcome_percentages': percentages,
+            'means': {'turns': np.mean(turns) if len(outcomes) else np.nan,
+                      'avrating': np.mean((white_rating + black_rating) / 2) if len(outcomes) else np.nan,
+                      'white_rating': np.mean(white_rating) if len(outcomes) else np.nan,
+                      'black_rating': np.mean(black_rating) if len(outcomes) else np.nan},
+            'difference_counts': pd.Series(histogram, index=pd.Index(labels), name='games'),
+            'difference_rates': difference_rates}
+
+# Define function to calculate the white, black and draw percentages (and number of
+# games) among games where white's rating is more than each threshold above
+# black's, and where black's is more than the threshold above white's. difference
+# is white's rating minus black's and outcomes are outcome_codes()
+def comparison_table(difference, outcomes, thresholds):
+    thresholds = np.asarray(thresholds, dtype=float)
+    valid = ~np.isnan(difference)
+    everything = np.sort(difference[valid])
+    columns = {}
+
+    # Games with difference > t are those after t in sorted order, and games with
+    # difference < -t are those before -t
+    def counts(sorted_difference):
+        white_higher = len(sorted_difference) - np.searchsorted(sorted_difference, thresholds,
+                                                                side='right')
+        black_higher = np.searchsorted(sorted_difference, -thresholds, side='left')
+        return np.column_stack((white_higher, black_higher)).ravel()
+
+    games = counts(everything)
+    for code, outcome in enumerate(OUTCOMES):
+        wins = counts(np.sort(difference[valid & (outcomes == code)]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns[outcome] = np.where(games > 0, wins / games * 100, np.nan)
+    columns['games'] = games
+    index = pd.MultiIndex.from_product([thresholds.tolist(), ['white', 'black']],
+                                       names=['threshold', 'higher_rated'])
+    return pd.DataFrame(columns, index=index)
+
+# Define fit_expected_score function to fit white's expected score
+# E = 1 / (1 + 10 ** (-(difference + white_advantage) / scale)) to the summed
+# scores and game counts at each rating difference, by maximum likelihood with
+# Newton's method. Returns the scale and white_advantage in rating points
+def fit_expected_score(differences, score_sums, counts, iterations=50):
+    x = np.asarray(differences, dtype=float) / 400
+    observed = np.asarray(score_sums, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    design = np.column_stack((np.ones_like(x), x))
+
+    # Log-likelihood of the scores for given parameters, written with logaddexp so
+    # large differences do not overflow
+    def log_likelihood(beta):
+        eta = design @ beta
+        return -(observed * np.logaddexp(0, -eta) + (counts - observed) * np.logaddexp(0, eta)).sum()
+
+    # Start from the standard Elo curve with no advantage for white, and halve each
+    # Newton step until it improves the fit
+    beta = np.array([0.0, np.log(10)])
+    current = log_likelihood(beta)
+    for _ in range(iterations):
+        expected = 1 / (1 + np.exp(-np.clip(design @ beta, -500, 500)))
+        gradient = design.T @ (observed - counts * expected)
+        hessian = (design * (counts * expected * (1 - expected))[:, None]).T @ design
+        step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+        while log_likelihood(beta + step) < current and np.abs(step).max() > 1e-12:
+            step /= 2
+        beta += step
+        current = log_likelihood(beta)
+        if np.abs(step).max() < 1e-10:
+            break
+
+    return {'scale': float(400 * np.log(10) / beta[1]),
+            'white_advantage': float(beta[0] * 400 / beta[1]),
+            'games': int(counts.sum())}
+
+# Define rank_openings function to build the opening_stats() result from counts per
+# opening: names, wins for the color, total games, and the position of the first
+# win (used to break ties in the order value_counts() uses). Returns the frequency
+# of each opening and the top 10 openings sorted by win percentage
+def rank_openings(names, wins, totals, first_win, total_games):
+    names = np.asarray(names, dtype=object)
+    order = np.lexsort((first_win, -wins))
+    order = order[wins[order] > 0]
+    freq_color = pd.Series(wins[order], name='count',
+                           index=pd.Index(names[order], name='opening_name'))
+
+    # Calculate and store the win percentage for top 10 opennings, then sort the
+    # openings by their win percentage in descending order
+    top = order[:10]
+    percentages = wins[top] / totals[top] * 100
+    color_openings = dict(sorted(zip(names[top], percentages),
+                                 key=lambda item: item[1], reverse=True))
+
+    # Compute the combined win percentage for all openings not in the top 10 and
+    # add this information to the dictionary
+    other_wins = int(wins.sum() - wins[top].sum())
+    other_total = int(total_games - totals[top].sum())
+    color_openings['Other openings'] = round(other_wins * 100 / other_total, 2)
+    return freq_color, color_openings
+
+# Define OpeningIndex class that groups the rows of the dataset by opening name.
+# Each opening gets an integer code, the row numbers are sorted by code once, and
+# offsets mark where each opening's rows start, so finding the games of one opening
+# only touches those games instead of comparing every opening name
+class OpeningIndex:
+
+    # Build the index from the opening_name column
+    def __init__(self, opening_names):
+        if isinstance(opening_names.dtype, pd.CategoricalDtype):
+            codes = opening_names.cat.codes.to_numpy().astype(np.int64)
+            names = opening_names.cat.categories
+        else:
+            codes, names = pd.factorize(opening_names, sort=True)
+        self.names = pd.Index(names, name='opening_name')
+        self.codes = codes
+
+        # Sort the row numbers by opening code, leaving out missing openings
+        order = np.argsort(codes, kind='stable')
+        self.order = order[codes[order] >= 0]
+        self.counts = np.bincount(codes[codes >= 0], minlength=len(self.names))
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+
+
+    # Return the code of an opening, or -1 if it is not in the dataset
+    def code(self, opening):
+        try:
+            return self.names.get_loc(opening)
+        except KeyError:
+            return -1
+
+    # Return the row numbers of the games played with an opening
+    def rows(self, opening):
+        code = self.code(opening)
+        if code < 0:
+            return self.order[:0]
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+# Define locked_cached_property, a cached_property that computes its value while
+# holding the instance's _lock, so a table asked for from two threads at once (e.g.
+# by the opening view precompute thread of ChessFunctions.py) is computed only once
+# and never read half built. Once stored, the value is read without the lock
+class locked_cached_property(cached_property):
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with instance._lock:
+            if self.attrname in instance.__dict__:
+                return instance.__dict__[self.attrname]
+            return super().__get__(instance, owner)
+
+# Define ChessDataset class that loads a games csv file and lazily computes and
+# caches every derived table used by the front end. The tables can be used from
+# several threads
+class ChessDataset:
+
+    # Store the path to the dataset without reading it yet. With use_cache the csv is
+    # read through the columnar cache in games_cache.py instead of being parsed
+    def __init__(self, path="games.csv", use_cache=True):
+        self.path = path
+        self.use_cache = use_cache
+
+        # Lock held while a table is computed. It is reentrant since the tables are
+        # computed from each other
+        self._lock = threading.RLock()
+
+        # Cache of opening_stats() results keyed by color
+        self._opening_stats = {}
+
+    # Open the columnar cache of the csv the first time it is used
+    @locked_cached_property
+    def cache(self):
+        return games_cache.open_cache(self.path)
+
+    # Read the dataset and derive the extra columns the first time it is used. From
+    # the cache, the numbers and categories are read-only memory maps shared with
+    # other processes using the same cache, and the long moves column is left out
+    # and read one game at a time through moves
+    @locked_cached_property
+    def games_df(self):
+        if self.use_cache:
+            games_df = self.cache.frame([name for name in self.cache.columns
+                                         if name != 'moves'], shared=True)
+        else:
+            games_df = pd.read_csv(self.path)
+
+        # Create new avrating column that takes the average of the black rating and
+        # white rating in the match
+        games_df['avrating'] = (games_df['white_rating'] + games_df['black_rating']) / 2
+
+        # Place each match within its respective rating group using pd.cut()
+        games_df['rating_group'] = pd.cut(games_df['avrating'], bins = rating_bins,
+                                          labels = rating_labels, right = False)
+
+        # Add new 'turns_category' column to categorize each game into one of the
+        # predefined turn bins
+        games_df['turns_category'] = pd.cut(games_df['turns'], bins=turn_bins,
+                                            labels=turn_labels, right=False)
+        return games_df
+
+    # Define getwinners method to return percentage of time that r1 is
+    # higher than r2 and winner wins the match
+    def getwinners(self, r1, r2, winner):
+        # Comparisons between the two players' ratings are read from the table
+        # that getwinners_matrix() computes for every outcome in one pass
+        if {r1, r2} == {'white_rating', 'black_rating'} and winner in OUTCOMES:
+            higher = 'white' if r1 == 'white_rating' else 'black'
+            return self.rating_comparison_table.loc[(0, higher), winner]
+
+        # Otherwise compare the two columns directly, without copying any rows
+        games_df = self.games_df
+        higher = games_df[r1].to_numpy() > games_df[r2].to_numpy()
+        winners = games_df['winner'].to_numpy()[higher]
+        if len(winners) == 0:
+            return np.nan
+        return (winners == winner).sum() / len(winners) * 100
+
+    # Define getwinners_matrix method to calculate, for each threshold t, the white,
+    # black and draw percentages of the games where white's rating is more than t
+    # points above black's and of the games where black's is more than t above
+    # white's. Each outcome's rating differences are sorted once and every threshold
+    # is counted with a binary search, so no filtered copies are made. by optionally
+    # splits the table by columns such as 'rated' or 'time_control'
+    def getwinners_matrix(self, thresholds=(0, 50, 100, 200, 400), by=None):
+        games_df = self.games_df
+        difference = (games_df['white_rating'].to_numpy(dtype=float) -
+                      games_df['black_rating'].to_numpy(dtype=float))
+        outcomes = outcome_codes(games_df['winner'])
+        if not by:
+            return comparison_table(difference, outcomes, thresholds)
+
+        by = [by] if isinstance(by, str) else list(by)
+        keys = pd.DataFrame({key: self._group_column(key) for key in by})
+        tables = {group: comparison_table(difference[rows], outcomes[rows], thresholds)
+                  for group, rows in keys.groupby(by, sort=True).indices.items()}
+        return pd.concat(tables, names=by)
+
+    # Calculate the getwinners_matrix() table at threshold 0 used by getwinners()
+    @locked_cached_property
+    def rating_comparison_table(self):
+        return self.getwinners_matrix(thresholds=(0,))
+
+    # Classify each game as ultrabullet, bullet, blitz, rapid or classical from its
+    # increment code, using Lichess' estimated duration of base time plus 40 times
+    # the increment
+    @locked_cached_property
+    def time_control(self):
+        parts = self.games_df['increment_code'].astype(str).str.split('+', expand=True)
+        minutes = pd.to_numeric(parts[0], errors='coerce')
+        increment = (pd.to_numeric(parts[1], errors='coerce') if 1 in parts
+                     else pd.Series(0, index=parts.index))
+        seconds = (minutes * 60 + 40 * increment.fillna(0)).to_numpy()
+        classes = pd.cut(seconds, bins=time_control_bins, labels=time_control_labels,
+                         right=False)
+        return pd.Series(classes, index=self.games_df.index, name='time_control')
+
+    # Define function to return the values of a grouping column, including the
+    # derived 'time_control' column
+    def _group_column(self, key):
+        if key == 'time_control':
+            return self.time_control.to_numpy()
+        return self.games_df[key].to_numpy()
+
+    # Define expected_score_fit method to fit an Elo-style expected score curve,
+    # E = 1 / (1 + 10 ** (-(difference + white_advantage) / scale)), to white's
+    # score (1 for a win, 0.5 for a draw) against the rating difference. Games are
+    # first summed per distinct rating difference so the fit only sees those points
+    @locked_cached_property
+    def expected_score_fit(self):
+        games_df = self.games_df
+        difference = (games_df['white_rating'].to_numpy(dtype=float) -
+                      games_df['black_rating'].to_numpy(dtype=float))
+        outcomes = outcome_codes(games_df['winner'])
+        counted = (outcomes >= 0) & ~np.isnan(difference)
+        score = np.array([1.0, 0.0, 0.5])[outcomes[counted]]
+        differences, inverse = np.unique(difference[counted], return_inverse=True)
+        return fit_expected_score(differences, np.bincount(inverse, weights=score),
+                                  np.bincount(inverse))
+
+    # Define expected_score method to return white's expected score for rating
+    # differences (white minus black) according to expected_score_fit
+    def expected_score(self, difference):
+        fit = self.expected_score_fit
+        return 1 / (1 + 10 ** (-(np.asarray(difference, dtype=float) +
+                                 fit['white_advantage']) / fit['scale']))
+
+    # Define rating_difference_stats method to calculate outcome rates, match counts
+    # and white's average score for buckets of rating difference (white minus
+    # black) in one pass, optionally split by extra columns like rating_bucket_stats
+    def rating_difference_stats(self, bins=difference_bins, labels=None, by=None):
+        games_df = self.games_df
+        labels = ((difference_labels if list(bins) == difference_bins else bucket_labels(bins))
+                  if labels is None else list(labels))
+        difference = (games_df['white_rating'].to_numpy(dtype=float) -
+                      games_df['black_rating'].to_numpy(dtype=float))
+        tallies, totals, index = self._bucket_tallies(difference, bins, labels, by,
+                                                      'rating_difference_group')
+        stats = bucket_rate_frame(tallies, totals, index, include_draws=True)
+        stats['white_score'] = stats['white_win_rate'] + stats['draw_rate'] / 2
+        return stats
+
+    # Define win_rate_for_color method to calculate win rate for a color
+    # within a specified rating group
+    def win_rate_for_color(self, group, color):
+        stats = self.rating_group_stats
+
+        # Look the rate up in the precomputed table, returning 0 for groups or
+        # colors that have no matches
+        column = 'draw_rate' if color == 'draw' else f'{color}_win_rate'
+        if group not in stats.index or column not in stats.columns:
+            return 0
+        return stats.loc[group, column]
+
+    # Define count_matches_in_group method to calculate the number of matches
+    # in each rating group
+    def count_matches_in_group(self, group):
+        stats = self.rating_group_stats
+        if group not in stats.index:
+            return 0
+        return int(stats.loc[group, 'total_matches'])
+
+    # Define rating_bucket_stats method to calculate white, black and draw rates and
+    # match counts for every rating bucket in a single pass. bins are the bucket
+    # edges (lower edge included), column is the rating column to bucket, and by is
+    # an optional list of extra columns such as 'rated' or 'increment_code' to
+    # split each bucket by. Returns a dataframe in the same shape as win_rates_df,
+    # with a draw_rate column added when include_draws is True
+    def rating_bucket_stats(self, bins=rating_bins, labels=None, by=None,
+                            column='avrating', include_draws=False):
+        labels = bucket_labels(bins) if labels is None else list(labels)
+        tallies, totals, index = self._bucket_tallies(self.games_df[column].to_numpy(),
+                                                      bins, labels, by, 'rating_group')
+        return bucket_rate_frame(tallies, totals, index, include_draws)
+
+    # Define function to count outcomes and games for every bucket of values, and
+    # for every combination of bucket and the extra 'by' columns when given.
+    # Returns the outcome tallies, the totals and the index labelling each row
+    def _bucket_tallies(self, values, bins, labels, by, name):
+        buckets = bucket_codes(np.asarray(values, dtype=float), bins)
+        outcomes = outcome_codes(self.games_df['winner'])
+        in_bucket = buckets >= 0
+
+        if not by:
+            # Count every (bucket, outcome) pair at once with np.bincount on a
+            # combined code, and the bucket sizes with a second bincount
+            counted = in_bucket & (outcomes >= 0)
+            tallies = np.bincount(buckets[counted] * 3 + outcomes[counted],
+                                  minlength=len(labels) * 3).reshape(len(labels), 3)
+            totals = np.bincount(buckets[in_bucket], minlength=len(labels))
+            return tallies, totals, pd.Index(labels)
+
+        # Group the bucket codes together with the extra keys in one groupby
+        by = [by] if isinstance(by, str) else list(by)
+        frame = pd.DataFrame({key: self._group_column(key)[in_bucket] for key in by})
+        frame[name] = pd.Categorical.from_codes(buckets[in_bucket], labels)
+        for code, outcome in enumerate(OUTCOMES):
+            frame[outcome] = outcomes[in_bucket] == code
+        grouped = frame.groupby(by + [name], observed=True, sort=True)
+        sums = grouped[list(OUTCOMES)].sum()
+        return sums.to_numpy(), grouped.size().to_numpy(), sums.index
+
+    # Calculate win and draw rates and total matches for the default rating groups
+    @locked_cached_property
+    def rating_group_stats(self):
+        return self.rating_bucket_stats(include_draws=True)
+
+    # Calculate win rates and total matches played for each rating group
+    @locked_cached_property
+    def win_rates_df(self):
+        return self.rating_group_stats.drop(columns='draw_rate')
+
+    # Filter games_df dataframe to rated games
+    @locked_cached_property
+    def gamesrated(self):
+        return self.games_df[self.games_df['rated']]
+
+    # Filter games_df dataframe to unrated games
+    @locked_cached_property
+    def gamesnotrated(self):
+        return self.games_df[~self.games_df['rated']]
+
+    # Calculate win rates for each turn category by grouping the DataFrame by
+    # 'turns_category' and 'winner'
+    @locked_cached_property
+    def turns_win_rates(self):
+        return (self.games_df.groupby('turns_category', observed=False)['winner']
+                             .value_counts(normalize=True)
+                             .unstack()
+                             .fillna(0))
+
+    # Build the opening index the first time an opening is looked up
+    @locked_cached_property
+    def opening_index(self):
+        return OpeningIndex(self.games_df['opening_name'])
+
+    # Count white wins, black wins and draws for every opening at once, using the
+    # opening index codes in one np.bincount. Rows follow opening_index.names
+    @locked_cached_property
+    def opening_outcomes(self):
+        index = self.opening_index
+        outcomes = outcome_codes(self.games_df['winner'])
+        counted = (index.codes >= 0) & (outcomes >= 0)
+        tallies = np.bincount(index.codes[counted] * 3 + outcomes[counted],
+                              minlength=len(index.names) * 3)
+        return pd.DataFrame(tallies.reshape(-1, 3), index=index.names,
+                            columns=list(OUTCOMES))
+
+    # Define games_for_opening method to return the matches played with an opening.
+    # Only the rows of that opening are touched, using the opening index
+    def games_for_opening(self, opening):
+        return self.games_df.take(self.opening_index.rows(opening))
+
+    # Define summarize_rows method to run summarize_games() on the given row numbers,
+    # reading only those rows of the needed columns
+    def summarize_rows(self, rows):
+        games_df = self.games_df
+        return summarize_games(games_df['white_rating'].to_numpy()[rows],
+                               games_df['black_rating'].to_numpy()[rows],
+                               games_df['winner'].to_numpy()[rows],
+                               games_df['turns'].to_numpy()[rows])
+
+    # Define opening_summary method to return the summarize_games() result for the
+    # games played with an opening
+    def opening_summary(self, opening):
+        return self.summarize_rows(self.opening_index.rows(opening))
+
+    # Define opening_win_percentage method to calculate win percentage for
+    # a given color and opening
+    def opening_win_percentage(self, opening, winner):
+        index = self.opening_index
+        code = index.code(opening)
+
+        # Read the answer from the outcome table for the three usual outcomes
+        if code >= 0 and winner in OUTCOMES:
+            total = index.counts[code]
+            if total == 0:
+                return np.nan
+            return self.opening_outcomes[winner].iloc[code] / total * 100
+
+        # Calculate the percentage of games won by 'winner' in the filtered games
+        winners = self.games_df['winner'].to_numpy()[index.rows(opening)]
+        percentage_won = (winners == winner).mean() * 100 if len(winners) else np.nan
+        return percentage_won
+
+    # Define opening_stats method for finding openings with most wins for a specified
+    # color. Returns frequency of each opening and sorted dictionary with win percentages
+    def opening_stats(self, color):
+        # Return the cached result if this color was already computed
+        if color in self._opening_stats:
+            return self._opening_stats[color]
+        index = self.opening_index
+        outcomes = self.opening_outcomes
+        totals = index.counts
+
+        # Calculate the number of wins for the specified color with every opening
+        won = (self.games_df['winner'] == color).to_numpy() & (index.codes >= 0)
+        if color in OUTCOMES:
+            wins = outcomes[color].to_numpy()
+        else:
+            wins = np.bincount(index.codes[won], minlength=len(index.names))
+
+        # Find the first game the color won with each opening, which rank_openings()
+        # uses to break ties between openings with the same number of wins
+        first_win = np.full(len(index.names), len(won))
+        won_codes, first_positions = np.unique(index.codes[won], return_index=True)
+        first_win[won_codes] = first_positions
+        freq_color, color_openings = rank_openings(index.names, wins, totals, first_win,
+                                                   len(index.codes))
+
+        self._opening_stats[color] = (freq_color, color_openings)
+        return freq_color, color_openings
+
+    # Get all opening names used over min_games times in dataset
+    def popular_openings(self, min_games=25):
+        index = self.opening_index
+        return index.names[index.counts > min_games].sort_values()
+
+    # Tokenize the moves column into integer arrays the first time it is needed
+    @locked_cached_property
+    def move_tokens(self):
+        return MoveTokens.from_moves(self.moves)
+
+    # Define select_games method to return the row numbers of the games matching
+    # every given filter: an opening name, a rating group label and a winner. With an
+    # opening, the other filters are only checked on that opening's games
+    def select_games(self, opening=None, rating_group=None, winner=None):
+        games_df = self.games_df
+        if opening is None:
+            rows = np.arange(len(games_df))
+        else:
+            rows = self.opening_index.rows(opening)
+        for column, value in (('rating_group', rating_group), ('winner', winner)):
+            if value is not None:
+                rows = rows[(games_df[column].iloc[rows] == value).to_numpy()]
+        return rows
+
+    # Define function to turn either index labels of games_df or filters into the
+    # row numbers used by the move statistics
+    def _move_rows(self, games, filters):
+        if games is not None:
+            return self.games_df.index.get_indexer(games)
+        if any(value is not None for value in filters.values()):
+            return self.select_games(**filters)
+        return None
+
+    # Define move_counts method to count how often each move is played. games is
+    # an optional list of games_df index labels, otherwise the keyword filters of
+    # select_games() choose the games
+    def move_counts(self, games=None, **filters):
+        return self.move_tokens.move_counts(self._move_rows(games, filters))
+
+    # Define ply_counts method to count the moves played at one ply of the chosen games
+    def ply_counts(self, ply, games=None, **filters):
+        return self.move_tokens.ply_counts(ply, self._move_rows(games, filters))
+
+    # Define ngram_counts method to count sequences of n consecutive moves in the
+    # chosen games
+    def ngram_counts(self, n, games=None, top=None, **filters):
+        return self.move_tokens.ngram_counts(n, self._move_rows(games, filters), top=top)
+
+    # Build the opening tree over the moves of every game the first time it is needed
+    @locked_cached_property
+    def opening_tree(self):
+        games_df = self.games_df
+        return OpeningTree.build(self.move_tokens, outcome_codes(games_df['winner']),
+                                 games_df['white_rating'].to_numpy(),
+                                 games_df['black_rating'].to_numpy())
+
+    # Define prefix_stats method to return the game count, outcome percentages and
+    # mean ratings of the games starting with a sequence of moves, e.g. 'e4 e5 Nf3'
+    def prefix_stats(self, moves):
+        return self.opening_tree.stats(moves)
+
+    # Define games_for_prefix method to return the matches starting with a sequence
+    # of moves, like games_for_opening() does for an opening name
+    def games_for_prefix(self, moves):
+        return self.games_df.take(self.opening_tree.game_rows(moves))
+
+    # Replay every game with python-chess the first time positions are needed. The
+    # results are stored next to the csv by game_replay.py and reused afterwards
+    @locked_cached_property
+    def replay(self):
+        # Imported here so that the core does not need python-chess until now
+        import game_replay
+        return game_replay.open_replay(self.path)
+
+    # Build the index of every position reached in the dataset, keyed by Zobrist
+    # hash, the first time it is needed
+    @locked_cached_property
+    def position_index(self):
+        from position_index import PositionIndex
+        games_df = self.games_df
+        return PositionIndex.build(self.replay, outcome_codes(games_df['winner']),
+                                   games_df['white_rating'].to_numpy(),
+                                   games_df['black_rating'].to_numpy())
+
+    # Define position_stats method to return how a position scores across every game
+    # that reached it, by any move order. The position is given as a FEN or as a
+    # sequence of SAN moves such as 'Nf3 Nf6 c4'
+    def position_stats(self, fen=None, moves=None):
+        return self.position_index.stats(fen=fen, moves=moves)
+
+    # Define game_row method to return the row number of the chess match with the
+    # given 'id' value
+    def game_row(self, game_id):
+        return int(np.flatnonzero((self.games_df['id'] == game_id).to_numpy())[0])
+
+    # Return the moves of every game, by row number, read from the cache one game at
+    # a time or taken from the csv
+    @locked_cached_property
+    def moves(self):
+        if self.use_cache:
+            return self.cache.text('moves')
+        return self.games_df['moves'].to_numpy(dtype=object)
+
+    # Define game_replay method to return a replay holding the positions of a match
+    # and the match's row in it. The stored replay of every game is used if it is
+    # loaded or up to date on disk; otherwise only this match is replayed, since
+    # replaying the whole dataset takes minutes
+    def game_replay(self, game_id):
+        import game_replay
+        row = self.game_row(game_id)
+        if 'replay' not in self.__dict__:
+            store = game_replay.stored_replay(self.path)
+            if store is None:
+                return game_replay.GameReplay(self.moves[row]), 0
+            self.replay = store
+        return self.replay, row
+
+    # Define position_fen method to return the FEN of a match after a number of plies
+    def position_fen(self, game_id, ply):
+        replay, row = self.game_replay(game_id)
+        return replay.fen(row, ply)
+
+    # Return the moves of the chess match with the given 'id' value
+    def game_moves(self, game_id):
+        return self.moves[self.game_row(game_id)]
@@ -1,83 +1,307 @@
 # Shaurya Jeloka, Akshay Vakharia, Ian Jeong
 # 6/9/2024
 
-# This script creates and manages a SQLite database that stores pricing data for Amazon 
-# items, stocks, and cryptocurrencies. The database contains three tables: amazon_items,
-# stocks, and cryptocurrencies. Each table stores the name, price, and timestamp of the 
-# items being tracked. This program defines functions to create the database and insert 
-# pricing information into each of the three tables. This setup allows for more 
-# structured and efficient management of pricing data.
+# This script creates and manages a SQLite database that stores pricing data for Amazon
+# items, stocks, and cryptocurrencies. Every tracked item is a row of the assets table
+# (its type and name), and every price is a row of a single prices table holding the
+# asset id, the time as integer seconds since the epoch, and the price as a number.
+# A row also holds the last time its price was seen, so when prices are inserted
+# with skip_unchanged a price equal to the asset's latest one only moves that
+# row's last_seen forward, and a row stands for the interval the price held. An
+# index on (asset_id, timestamp, price) lets range and lowest price queries seek
+# straight to one asset's recent prices instead of scanning the whole history. The
+# amazon_items, stocks, and cryptocurrencies tables of the first version of the
+# database are now views over these tables with the same columns, and databases in
+# the old layout are migrated by create_database(). Prices are written in batches,
+# one transaction per call, and the database uses write-ahead logging so the
+# dashboard can read while the scheduler writes. Connections are reused by the
+# long running scheduler process instead of being opened for every update.
 
+import datetime
 import sqlite3
+import threading
 
-# Define function to create the SQL database that will store all pricing info
-def create_database():
-    
-    # Create a database and connection and cursor objects for it
-    con = sqlite3.connect('prices.db')
-    cursor = con.cursor()
-
-    # Create tables for storing pricing data on amazon items,stocks, and cryptos
-    cursor.execute('''CREATE TABLE IF NOT EXISTS amazon_items (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        item_name TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                      )''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS stocks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        stock_symbol TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                      )''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS cryptocurrencies (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        crypto_name TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                      )''')
-    
-    # Commit changes and close the connection
-    con.commit()
+# Path of the database file
+DB_PATH = 'prices.db'
+
+# Version of the database layout stored in PRAGMA user_version. Version 1 had one
+# table per asset type
+SCHEMA_VERSION = 3
+
+# Asset types, each with the table (now a view) and name column used for it by
+# the first version of the database
+ASSET_TYPES = {'amazon': ('amazon_items', 'item_name'),
+               'stock': ('stocks', 'stock_symbol'),
+               'crypto': ('cryptocurrencies', 'crypto_name')}
+
+# Asset type of each table name of the first version, so callers can keep using them
+TABLE_ASSET_TYPES = {table: asset_type for asset_type, (table, _) in ASSET_TYPES.items()}
+
+# Settings applied to every connection. In WAL mode synchronous=NORMAL only syncs at
+# checkpoints, which stays safe against corruption and avoids an fsync per commit
+CONNECTION_PRAGMAS = {'synchronous': 'NORMAL',
+                      'busy_timeout': 5000,
+                      'temp_store': 'MEMORY',
+                      'cache_size': -16000,
+                      'foreign_keys': 'ON'}
+
+# Connections reused by get_connection(), keyed by thread id and database path
+_connections = {}
+_connections_lock = threading.Lock()
+
+# Define function to open a connection to the database with the tuned settings.
+# Other keyword arguments are passed to sqlite3.connect()
+def connect(path=DB_PATH, **options):
+    con = sqlite3.connect(path, **options)
+    for name, value in CONNECTION_PRAGMAS.items():
+        con.execute(f'PRAGMA {name} = {value};')
+    return con
+
+# Define function to return a connection to the database that stays open and is
+# reused by later calls from the same thread, e.g. every run of the scheduler.
+# Every connection is registered so close_connections() can close the ones opened
+# in other threads, like the scheduler's job threads
+def get_connection(path=DB_PATH):
+    key = (threading.get_ident(), path)
+    with _connections_lock:
+        con = _connections.get(key)
+    if con is None:
+        con = connect(path, check_same_thread=False)
+        with _connections_lock:
+            _connections[key] = con
+    return con
+
+# Define function to close the connections opened by get_connection() in this
+# thread, or in every thread with all_threads
+def close_connections(all_threads=False):
+    ident = threading.get_ident()
+    with _connections_lock:
+        keys = [key for key in _connections if all_threads or key[0] == ident]
+        connections = [_connections.pop(key) for key in keys]
+    for con in connections:
+        con.close()
+
+# Define function to convert a timestamp to integer seconds since the epoch. Accepts
+# numbers, datetime objects, and 'YYYY-MM-DD HH:MM:SS' strings in local time as
+# written by update_prices()
+def to_epoch(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, datetime.datetime):
+        return int(timestamp.timestamp())
+    return int(timestamp)
+
+# Define function to convert a price to a float. Accepts numbers, Decimals, and
+# strings with thousands separators like the prices scraped from Amazon
+def to_price(price):
+    if isinstance(price, str):
+        return float(price.replace(',', '').strip())
+    return float(price)
+
+# Define function to check an asset type, also accepting the old table names
+def asset_type_for(asset_type):
+    asset_type = TABLE_ASSET_TYPES.get(asset_type, asset_type)
+    if asset_type not in ASSET_TYPES:
+        raise ValueError(f'unknown asset type {asset_type!r}, expected one of {list(ASSET_TYPES)}')
+    return asset_type
+
+# Define function to create the tables and index of the current layout
+def create_tables(con):
+    con.execute('''CREATE TABLE IF NOT EXISTS assets (
+                     asset_id INTEGER PRIMARY KEY,
+                     asset_type TEXT NOT NULL,
+                     name TEXT NOT NULL,
+                     UNIQUE (asset_type, name)
+                   )''')
+
+    con.execute('''CREATE TABLE IF NOT EXISTS prices (
+                     asset_id INTEGER NOT NULL REFERENCES assets (asset_id),
+                     timestamp INTEGER NOT NULL,
+                     price REAL NOT NULL,
+                     last_seen INTEGER NOT NULL
+                   )''')
+
+    # Index the prices by asset and time, with the price included so lowest price
+    # queries are answered from the index alone
+    con.execute('''CREATE INDEX IF NOT EXISTS prices_asset_time
+                   ON prices (asset_id, timestamp, price)''')
+
+# Define function to create views with the tables and columns of the first
+# version, so existing queries like SELECT * FROM stocks keep working
+def create_views(con):
+    for asset_type, (table, column) in ASSET_TYPES.items():
+        con.execute(f'''CREATE VIEW IF NOT EXISTS {table} AS
+                        SELECT prices.rowid AS id, assets.name AS {column}, prices.price AS price,
+                               datetime(prices.timestamp, 'unixepoch', 'localtime') AS timestamp
+                        FROM prices JOIN assets USING (asset_id)
+                        WHERE assets.asset_type = '{asset_type}' ''')
+
+# Define function to return the names of the first version's tables that are
+# still real tables in the database
+def legacy_tables(con):
+    tables = {name for (name,) in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table';")}
+    return [table for table, _ in ASSET_TYPES.values() if table in tables]
+
+# Define function to move the prices of the first version's tables into the assets
+# and prices tables and replace those tables with views. Runs in one transaction,
+# so a failed migration leaves the database as it was. Returns the number of
+# prices moved
+def migrate(con):
+    moved = 0
+    con.execute('BEGIN')
+    try:
+        create_tables(con)
+        for table in legacy_tables(con):
+            asset_type = TABLE_ASSET_TYPES[table]
+            column = ASSET_TYPES[asset_type][1]
+            rows = con.execute(f'SELECT {column}, price, timestamp FROM {table} ORDER BY id;').fetchall()
+            moved += write_prices(con, asset_type, rows)
+            con.execute(f'DROP TABLE {table};')
+        create_views(con)
+        con.execute(f'PRAGMA user_version = {SCHEMA_VERSION};')
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return moved
+
+# Define function to copy the database to a backup file with SQLite's online backup
+def backup_database(con, backup_path):
+    backup = sqlite3.connect(backup_path)
+    con.backup(backup)
+    backup.close()
+
+# Define function to create the SQL database that will store all pricing info,
+# migrating a database in the first version's layout. The old database file is
+# copied to a .bak file before it is migrated
+def create_database(path=DB_PATH, backup=True):
+
+    # Create a database and connection object for it
+    con = connect(path)
+
+    # Switch the database to write-ahead logging. The journal mode is stored in the
+    # database file, so every later connection uses it too
+    con.execute('PRAGMA journal_mode = WAL;')
+
+    # Move the prices of an old database into the new tables
+    if legacy_tables(con):
+        if backup:
+            backup_database(con, f'{path}.bak')
+        migrate(con)
+
+    # Create the tables, index and views, then commit changes and close the connection
+    with con:
+        create_tables(con)
+        create_views(con)
+        con.execute(f'PRAGMA user_version = {SCHEMA_VERSION};')
     con.close()
 
-# Define function to insert information into the amazon_items table
-def insert_amazon_item(con, item_name, price, timestamp):
-    
-    # Create a cursor using the connection object passed in as an argument
-    cursor = con.cursor()
-    
-    # Use a SQL insert statement to put the item name, price, and timestamp into the database
-    cursor.execute('''INSERT INTO amazon_items (item_name, price, timestamp) VALUES (?, ?, ?);''', 
-                   (item_name, price, timestamp))
+# Define function to return the asset ids of names of one asset type, adding the
+# names that are not in the assets table yet
+def asset_ids(con, asset_type, names):
+    asset_type = asset_type_for(asset_type)
+    names = list(dict.fromkeys(names))
+    con.executemany('INSERT OR IGNORE INTO assets (asset_type, name) VALUES (?, ?);',
+                    [(asset_type, name) for name in names])
+    ids = {}
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        ids.update(con.execute(
+            f'''SELECT name, asset_id FROM assets WHERE asset_type = ?
+                AND name IN ({", ".join("?" * len(chunk))});''', [asset_type] + chunk))
+    return ids
 
-    # Commit changes
-    con.commit()
+# Define function to return the rowid, last_seen and price of the latest row of an
+# asset, or None if it has no prices
+def latest_price(con, asset_id):
+    return con.execute(
+        '''SELECT rowid, last_seen, price FROM prices WHERE asset_id = ?
+           ORDER BY timestamp DESC LIMIT 1;''', (asset_id,)).fetchone()
 
-# Define function to insert information into the stocks table
-def insert_stock(con, stock_symbol, price, timestamp):
+# Define function to add prices without committing, used by insert_prices() and
+# migrate(). rows is an iterable of (name, price, timestamp) tuples. With
+# skip_unchanged, a price equal to the asset's latest price extends that row's
+# last_seen instead of adding a row. Returns the number of rows added
+def write_prices(con, asset_type, rows, skip_unchanged=False):
+    rows = [(name, to_price(price), to_epoch(timestamp)) for name, price, timestamp in rows]
+    ids = asset_ids(con, asset_type, [name for name, _, _ in rows])
 
-    # Create a cursor using the connection object passed in as an argument
-    cursor = con.cursor()
+    # Collect the rows to add as [rowid, asset_id, timestamp, last_seen, price]
+    # intervals, with a rowid of None for the new ones, joining runs of equal prices
+    new, extended, current = [], {}, {}
+    for name, price, timestamp in rows:
+        asset_id = ids[name]
+        if skip_unchanged:
+            if asset_id not in current:
+                latest = latest_price(con, asset_id)
+                current[asset_id] = latest and [latest[0], asset_id, None, latest[1], latest[2]]
+            interval = current[asset_id]
+            if interval and interval[4] == price and interval[3] <= timestamp:
+                interval[3] = timestamp
+                if interval[0] is not None:
+                    extended[interval[0]] = interval
+                continue
+        interval = [None, asset_id, timestamp, timestamp, price]
+        new.append(interval)
+        current[asset_id] = interval
 
-    # Use a SQL insert statement to put the stock symbol, price, and timestamp into the database
-    cursor.execute('''INSERT INTO stocks (stock_symbol, price, timestamp) VALUES (?, ?, ?);''', 
-                   (stock_symbol, price, timestamp))
+    con.executemany('UPDATE prices SET last_seen = ? WHERE rowid = ?;',
+                    [(interval[3], rowid) for rowid, interval in extended.items()])
+    cursor = con.executemany(
+        'INSERT INTO prices (asset_id, timestamp, last_seen, price) VALUES (?, ?, ?, ?);',
+        [interval[1:] for interval in new])
+    return cursor.rowcount if new else 0
 
-    # Commit changes
-    con.commit()
+# Define function to insert many prices of one asset type in a single transaction.
+# rows is an iterable of (name, price, timestamp) tuples; prices may be strings
+# with thousands separators and timestamps may be local time strings. With
+# skip_unchanged, unchanged prices extend the latest row instead of adding one.
+# Returns the number of rows inserted
+def insert_prices(con, asset_type, rows, skip_unchanged=False):
 
-# Define function to insert information into the cryptocurrencies table
-def insert_cryptocurrency(con, crypto_name, price, timestamp):
-    
-    # Create a cursor using the connection object passed in as an argument
-    cursor = con.cursor()
+    # Insert every row and commit once, or roll back if any row fails
+    with con:
+        return write_prices(con, asset_type, rows, skip_unchanged)
 
-    # Use a SQL insert statement to put the crypto name, price, and timestamp into the database
-    cursor.execute('''INSERT INTO cryptocurrencies (crypto_name, price, timestamp) VALUES (?, ?, ?);''',
-                    (crypto_name, price, timestamp))
+# Define function to return the lowest price of an asset since a time, or None if
+# there are no prices for it in that range. Besides the rows starting in the range,
+# the row starting before it counts if its price was still seen in the range
+def lowest_price(con, asset_type, name, since):
+    since = to_epoch(since)
+    (price,) = con.execute(
+        '''WITH asset AS (SELECT asset_id FROM assets WHERE asset_type = ? AND name = ?)
+           SELECT MIN(price) FROM (
+             SELECT price FROM prices
+             WHERE asset_id = (SELECT asset_id FROM asset) AND timestamp >= ?
+             UNION ALL
+             SELECT price FROM (SELECT price, last_seen FROM prices
+                                WHERE asset_id = (SELECT asset_id FROM asset) AND timestamp < ?
+                                ORDER BY timestamp DESC LIMIT 1)
+             WHERE last_seen >= ?);''',
+        (asset_type_for(asset_type), name, since, since, since)).fetchone()
+    return price
 
-    # Commit changes
-    con.commit()
\ No newline at end of file
+# Define function to return the prices of an asset between two times, oldest first,
+# as a list of (timestamp, price) tuples. A price that held for several updates is
+# returned once, at the time it was first seen
+def price_history(con, asset_type, name, start=0, end=None):
+    end = 2 ** 62 if end is None else to_epoch(end)
+    return con.execute(
+        '''SELECT prices.timestamp, prices.price FROM prices
+           WHERE prices.asset_id = (SELECT asset_id FROM assets
+                                    WHERE asset_type = ? AND name = ?)
+           AND prices.timestamp BETWEEN ? AND ? ORDER BY prices.timestamp;''',
+        (asset_type_for(asset_type), name, to_epoch(start), end)).fetchall()
+
+# Define function to insert information into the amazon_items table
+def insert_amazon_item(con, item_name, price, timestamp):
+    insert_prices(con, 'amazon', [(item_name, price, timestamp)])
+
+# Define function to insert information into the stocks table
+def insert_stock(con, stock_symbol, price, timestamp):
+    insert_prices(con, 'stock', [(stock_symbol, price, timestamp)])
+
+# Define function to insert information into the cryptocurrencies table
+def insert_cryptocurrency(con, crypto_name, price, timestamp):
+    insert_prices(con, 'crypto', [(crypto_name, price, timestamp)])
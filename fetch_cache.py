@@ -0,0 +1,104 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program keeps the answers of the price lookups of update_prices() so they are
+# not downloaded again while they are still fresh. FetchCache holds each answer
+# under its source (amazon, stock, or crypto) and the item it is for, and gives it
+# back until the time to live of its source has passed. ConditionalSession stands in
+# for a requests session and sends the ETag and Last-Modified of the last answer
+# for a URL with the next request to it, so a server that honors them (CoinGecko
+# does) can answer 304 Not Modified with no body and the stored answer is used.
+# Yahoo Finance downloads through yfinance and Amazon pages loaded in a browser
+# cannot send these headers, so they rely on the time to live alone.
+
+import time
+
+# Seconds an answer of each source is reused, a little less than the interval
+# run_script.py updates the source at (hourly for Amazon, every five minutes for
+# stocks, every minute for crypto), so every scheduled update gets fresh prices
+# while lookups in between reuse them. Sources not given are not cached
+DEFAULT_TTLS = {'amazon': 3300, 'stock': 240, 'crypto': 50}
+
+# Define FetchCache class keeping answers for a time to live that depends on their source
+class FetchCache:
+
+    # Create a cache. ttls maps sources to seconds, added to DEFAULT_TTLS. clock
+    # returns the current time in seconds and can be replaced in tests
+    def __init__(self, ttls=None, clock=time.monotonic):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._answers = {}
+
+    # Define get method to return the answer kept for a source and key, or None if
+    # there is no answer younger than the source's time to live
+    def get(self, source, key):
+        stored = self._answers.get((source, key))
+        if stored is not None and self.clock() - stored[0] < self.ttls.get(source, 0):
+            self.hits += 1
+            return stored[1]
+        self.misses += 1
+        return None
+
+    # Define put method to keep the answer for a source and key
+    def put(self, source, key, answer):
+        if self.ttls.get(source, 0) > 0:
+            self._answers[(source, key)] = (self.clock(), answer)
+
+    # Define clear method to forget every answer
+    def clear(self):
+        self._answers.clear()
+
+    # Define stats method to return the number of hits, misses, and kept answers
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._answers)}
+
+# Define ConditionalSession class that makes GET requests conditional on the last
+# answer for the same URL. session is a requests session, made the first time
+# it is needed if not given
+class ConditionalSession:
+
+    def __init__(self, session=None):
+        self._session = session
+        self.requests = 0
+        self.not_modified = 0
+        self._responses = {}
+
+    # Define session property to return the requests session, creating it if needed
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    # Define get method to send a GET request with the validators of the last
+    # answer for the URL, returning that answer again if the server says it has
+    # not changed
+    def get(self, url, params=None, headers=None, **kwargs):
+        key = (url, tuple(sorted((params or {}).items())))
+        headers = dict(headers or {})
+        stored = self._responses.get(key)
+        if stored is not None:
+            if stored.headers.get('ETag'):
+                headers['If-None-Match'] = stored.headers['ETag']
+            if stored.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = stored.headers['Last-Modified']
+
+        self.requests += 1
+        response = self.session.get(url, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and stored is not None:
+            self.not_modified += 1
+            return stored
+
+        # Keep successful answers the server gave a validator for
+        if response.status_code == 200 and (response.headers.get('ETag')
+                                            or response.headers.get('Last-Modified')):
+            self._responses[key] = response
+        return response
+
+    # Define close method to close the requests session
+    def close(self):
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,288 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file replays the games of the chess dataset with python-chess once and stores
+# the results next to games.csv, so the simulator and any other code can jump to
+# any position of any game without parsing SAN moves again. For every game we keep
+# its moves in UCI format, and for every position (the starting position plus one
+# per move) its FEN and a 64-bit Zobrist hash (the polyglot hash python-chess
+# provides). Replaying is split into chunks of games that run in parallel worker
+# processes. The stored arrays are memory mapped back in, so looking up the FEN of
+# ply N of a game takes constant time. A single game can also be replayed on its
+# own, for showing it before the whole dataset has been replayed. The file also holds a small LRU cache of
+# rendered board SVGs keyed by position hash.
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import chess
+import chess.polyglot
+import chess.svg
+import numpy as np
+
+import games_cache
+
+# Version of the on-disk layout, bumped whenever the format changes
+REPLAY_VERSION = 1
+
+# Number of games each worker process replays at a time
+CHUNK_SIZE = 500
+
+# Define function to play a game given as space separated SAN moves on a board,
+# calling before(board, move, ply) before each move is made and after(board, move,
+# ply) once it is made. The replay stops at the first move that cannot be parsed.
+# Returns the board, the ply of that move (None if every move was parsed), and
+# its error message
+def replay_san(moves, before=None, after=None):
+    board = chess.Board()
+    for ply, move_str in enumerate(str(moves).split(), start=1):
+        try:
+            move = board.parse_san(move_str)
+        except ValueError as e:
+            return board, ply, f'{move_str}: {e}'
+        if before is not None:
+            before(board, move, ply)
+        board.push(move)
+        if after is not None:
+            after(board, move, ply)
+    return board, None, None
+
+# Define function to replay one game given as space separated SAN moves. Returns
+# the UCI moves, the FEN and Zobrist hash of every position, and an error message
+# if a move could not be parsed (the replay stops at that move)
+def replay_game(moves):
+    start = chess.Board()
+    uci_moves = []
+    fens = [start.fen()]
+    keys = [chess.polyglot.zobrist_hash(start)]
+
+    # Record each move in UCI format and the position it leads to
+    def record(board, move, ply):
+        uci_moves.append(move.uci())
+        fens.append(board.fen())
+        keys.append(chess.polyglot.zobrist_hash(board))
+
+    _, error_ply, error = replay_san(moves, after=record)
+    if error is not None:
+        error = f'ply {error_ply} {error}'
+    return uci_moves, fens, keys, error
+
+# Define function to replay a list of games, used as the job of one worker process
+def replay_chunk(moves_list):
+    return [replay_game(moves) for moves in moves_list]
+
+# Define function to call function on chunks of items in parallel worker processes
+# and return the concatenated results in item order. function takes a list of
+# items and returns a list with one result per item. workers=1 runs in this
+# process. report is called with (items done, total items, seconds elapsed) after
+# each chunk
+def map_chunks(function, items, workers=None, chunk_size=CHUNK_SIZE, report=None):
+    items = list(items)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = [None] * len(chunks)
+    started = time.perf_counter()
+    done = 0
+
+    # Store the results of one chunk and report progress
+    def collect(index, result):
+        nonlocal done
+        results[index] = result
+        done += len(chunks[index])
+        if report is not None:
+            report(done, len(items), time.perf_counter() - started)
+
+    if workers == 1 or len(chunks) <= 1:
+        for index, chunk in enumerate(chunks):
+            collect(index, function(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(function, chunk): index
+                       for index, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+    return [result for chunk in results for result in chunk]
+
+# Define function to replay every game, splitting them into chunks that run in
+# parallel. workers=1 replays in this process
+def replay_games(moves_list, workers=None, chunk_size=CHUNK_SIZE, report=None):
+    return map_chunks(replay_chunk, moves_list, workers=workers, chunk_size=chunk_size,
+                      report=report)
+
+# Define function to return the directory holding the replay results for a csv file
+def replay_dir_for(csv_path):
+    directory, filename = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(directory, f'.{filename}.replay')
+
+# Define ReplayStore class that gives constant time access to the replayed moves
+# and positions of every game
+class ReplayStore:
+
+    # Open a replay directory, memory mapping its arrays when mmap is enabled
+    def __init__(self, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        self.errors = {int(row): error for row, error in self.meta['errors'].items()}
+        for name in ('ply_offsets', 'uci', 'keys', 'fen_blob', 'fen_offsets'):
+            setattr(self, name, np.load(os.path.join(directory, f'{name}.npy'),
+                                        mmap_mode=mmap_mode))
+
+        # Every game has one more position than moves, so its positions start at
+        # its move offset plus its row number
+        self.position_offsets = self.ply_offsets + np.arange(len(self.ply_offsets))
+
+    # Define write method to save replay results for the rows of a dataset
+    @staticmethod
+    def write(directory, results, source_hash):
+        lengths = np.array([len(uci_moves) for uci_moves, _, _, _ in results], dtype=np.int64)
+        ply_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        uci = np.array([move for uci_moves, _, _, _ in results for move in uci_moves],
+                       dtype='S5')
+        keys = np.array([key for _, _, game_keys, _ in results for key in game_keys],
+                        dtype=np.uint64)
+        fen_blob, fen_offsets = games_cache.encode_strings(
+            [fen for _, fens, _, _ in results for fen in fens])
+        errors = {str(row): error for row, (_, _, _, error) in enumerate(results)
+                  if error is not None}
+
+        os.makedirs(directory, exist_ok=True)
+        for name, array in (('ply_offsets', ply_offsets), ('uci', uci), ('keys', keys),
+                            ('fen_blob', fen_blob), ('fen_offsets', fen_offsets)):
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'meta.json'), 'w') as file:
+            json.dump({'version': REPLAY_VERSION, 'source_hash': source_hash,
+                       'games': len(results), 'errors': errors}, file)
+
+    # Define plies method to return how many moves of a game could be replayed
+    def plies(self, row):
+        return int(self.ply_offsets[row + 1] - self.ply_offsets[row])
+
+    # Define uci_moves method to return the moves of a game in UCI format
+    def uci_moves(self, row):
+        return [move.decode('ascii')
+                for move in self.uci[self.ply_offsets[row]:self.ply_offsets[row + 1]]]
+
+    # Define fen method to return the FEN of a game after a number of plies
+    # (0 is the starting position)
+    def fen(self, row, ply):
+        if not 0 <= ply <= self.plies(row):
+            raise IndexError(f'game {row} has no ply {ply}')
+        position = self.position_offsets[row] + ply
+        start, end = self.fen_offsets[position], self.fen_offsets[position + 1]
+        return self.fen_blob[start:end].tobytes().decode('ascii')
+
+    # Define key method to return the Zobrist hash of a game after a number of plies
+    def key(self, row, ply):
+        if not 0 <= ply <= self.plies(row):
+            raise IndexError(f'game {row} has no ply {ply}')
+        return int(self.keys[self.position_offsets[row] + ply])
+
+    # Define board method to return a chess.Board set up at a ply of a game
+    def board(self, row, ply):
+        return chess.Board(self.fen(row, ply))
+
+# Define function to replay every game of a csv file and store the results next to
+# it. The results are written to a temporary directory and moved into place
+def build_replay(csv_path, workers=None):
+    cache = games_cache.open_cache(csv_path)
+    moves_list = cache.series('moves').tolist()
+    results = replay_games(moves_list, workers=workers)
+
+    replay_dir = replay_dir_for(csv_path)
+    temp_dir = tempfile.mkdtemp(prefix='.replay-', dir=os.path.dirname(replay_dir))
+    try:
+        ReplayStore.write(temp_dir, results, cache.meta['source_hash'])
+        if os.path.exists(replay_dir):
+            shutil.rmtree(replay_dir)
+        os.replace(temp_dir, replay_dir)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return replay_dir
+
+# Define function to open the stored replay results for a csv file, or return None
+# if there are none or they were made from a different csv
+def stored_replay(csv_path, mmap=True):
+    replay_dir = replay_dir_for(csv_path)
+    source_hash = games_cache.open_cache(csv_path).meta['source_hash']
+    meta = games_cache.read_meta(replay_dir)
+    if (meta is None or meta.get('version') != REPLAY_VERSION
+            or meta.get('source_hash') != source_hash):
+        return None
+    return ReplayStore(replay_dir, mmap=mmap)
+
+# Define function to open the replay results for a csv file, replaying the games
+# first when there are no results or they were made from a different csv
+def open_replay(csv_path, workers=None, mmap=True):
+    store = stored_replay(csv_path, mmap=mmap)
+    if store is None:
+        build_replay(csv_path, workers=workers)
+        store = ReplayStore(replay_dir_for(csv_path), mmap=mmap)
+    return store
+
+# Define GameReplay class that replays a single game and answers the same questions
+# as a ReplayStore for it (as row 0), so one game can be shown without replaying
+# the whole dataset first
+class GameReplay:
+
+    def __init__(self, moves):
+        self.moves, self.fens, self.keys, self.error = replay_game(moves)
+
+    # Define plies method to return how many moves of the game could be replayed
+    def plies(self, row=0):
+        return len(self.moves)
+
+    # Define uci_moves method to return the moves of the game in UCI format
+    def uci_moves(self, row=0):
+        return list(self.moves)
+
+    # Define fen method to return the FEN of the game after a number of plies
+    def fen(self, row, ply):
+        if not 0 <= ply <= self.plies():
+            raise IndexError(f'game has no ply {ply}')
+        return self.fens[ply]
+
+    # Define key method to return the Zobrist hash of the game after a number of plies
+    def key(self, row, ply):
+        if not 0 <= ply <= self.plies():
+            raise IndexError(f'game has no ply {ply}')
+        return self.keys[ply]
+
+    # Define board method to return a chess.Board set up at a ply of the game
+    def board(self, row, ply):
+        return chess.Board(self.fen(row, ply))
+
+# Define SvgCache class that keeps the most recently rendered board SVGs, keyed by
+# position hash, and counts cache hits and misses. It can be used from several
+# threads, e.g. when boards are rendered ahead of time in a thread pool
+class SvgCache:
+
+    # Create an empty cache holding up to maxsize boards
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Define get method to return the SVG of a position, rendering it from its FEN
+    # only when it is not cached yet
+    def get(self, key, fen):
+        with self._lock:
+            if key in self._boards:
+                self.hits += 1
+                self._boards.move_to_end(key)
+                return self._boards[key]
+            self.misses += 1
+        svg = chess.svg.board(board=chess.Board(fen))
+        with self._lock:
+            self._boards[key] = svg
+            if len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+        return svg
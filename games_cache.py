@@ -0,0 +1,279 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file converts games.csv into a compact columnar cache on disk so that the
+# csv only has to be parsed once. Every column is written as its own NumPy .npy
+# file: numbers keep the type pandas read from the csv, low-cardinality text
+# columns such as opening_name, winner and victory_status are stored as integer
+# codes plus a list of categories, and long text columns such as id and moves are
+# stored as one UTF-8 byte buffer plus an array of offsets. Missing text is
+# remembered, so it comes back as NaN. The loader opens the .npy files as memory
+# maps, so several worker processes reading the same cache share the same pages of
+# memory instead of each holding a private copy. With shared, numbers and category
+# codes stay those read-only memory maps, and StringColumn reads a long text column
+# one row at a time straight from its byte buffer; otherwise load_games() copies
+# everything into writable arrays, so the dataframe it returns behaves like the one
+# from pd.read_csv(). The cache records the size, modification time, and hash of
+# the csv it was built from and is rebuilt automatically when the csv changes.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Version of the on-disk layout, bumped whenever the format changes
+CACHE_VERSION = 3
+
+# Text columns that are always stored as categoricals. Other text columns become
+# categoricals when less than half of their values are unique
+CATEGORICAL_COLUMNS = ['winner', 'victory_status', 'increment_code',
+                       'opening_eco', 'opening_name']
+
+# Define function to return the directory holding the cache for a csv file
+def cache_dir_for(csv_path):
+    directory, filename = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(directory, f'.{filename}.cache')
+
+# Define function to hash the contents of a file in chunks
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Define function to read the metadata of an existing cache, or None if there is none
+def read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+# Define function to check whether the cache still matches the csv file. The size
+# and modification time are checked first; the hash is only computed when they
+# differ, so touching the csv without changing it does not force a rebuild
+def is_fresh(csv_path):
+    cache_dir = cache_dir_for(csv_path)
+    meta = read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+
+    stat = os.stat(csv_path)
+    if stat.st_size == meta['source_size'] and stat.st_mtime_ns == meta['source_mtime_ns']:
+        return True
+    if stat.st_size != meta['source_size'] or file_hash(csv_path) != meta['source_hash']:
+        return False
+
+    # Same contents with a new modification time, so record the new time
+    meta['source_mtime_ns'] = stat.st_mtime_ns
+    write_json_atomic(os.path.join(cache_dir, 'meta.json'), meta)
+    return True
+
+# Define function to write a json file by replacing it in one step
+def write_json_atomic(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+# Define function to pick the smallest integer type that can hold the given codes
+def code_dtype(count):
+    for dtype in (np.int8, np.int16, np.int32):
+        if count < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+# Define function to encode a list of strings as one UTF-8 buffer and offsets
+def encode_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+# Define function to decode a UTF-8 buffer and offsets back into a list of strings
+def decode_strings(blob, offsets, is_ascii):
+    # When every character is one byte the whole buffer can be decoded at once and
+    # sliced, which is much faster than decoding each value separately
+    if is_ascii:
+        text = blob.tobytes().decode('ascii')
+        return [text[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    data = blob.tobytes()
+    return [data[start:end].decode('utf-8')
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+# Define function to convert a dataframe column into the arrays stored in the cache
+# and the metadata describing it
+def encode_column(name, series, directory):
+    # Booleans and numbers are stored directly in the type pandas read, so the
+    # shared memory maps can be used as they are
+    if pd.api.types.is_bool_dtype(series):
+        np.save(os.path.join(directory, f'{name}.npy'), series.to_numpy(dtype=bool))
+        return {'kind': 'bool', 'dtype': 'bool'}
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series):
+        np.save(os.path.join(directory, f'{name}.npy'), series.to_numpy())
+        return {'kind': 'numeric', 'dtype': str(series.dtype)}
+
+    # Everything else is text. Missing values become the code -1 of a categorical,
+    # or an empty string marked in a mask of missing values
+    series = series.map(str, na_action='ignore')
+    if name in CATEGORICAL_COLUMNS or series.nunique() * 2 < len(series):
+        codes, categories = pd.factorize(series, sort=True)
+        np.save(os.path.join(directory, f'{name}.npy'),
+                codes.astype(code_dtype(len(categories))))
+        return {'kind': 'categorical', 'categories': categories.tolist()}
+
+    missing = series.isna().to_numpy()
+    series = series.fillna('')
+    blob, offsets = encode_strings(series.tolist())
+    np.save(os.path.join(directory, f'{name}.npy'), blob)
+    np.save(os.path.join(directory, f'{name}.offsets.npy'), offsets)
+    if missing.any():
+        np.save(os.path.join(directory, f'{name}.missing.npy'), missing)
+    return {'kind': 'string', 'ascii': bool(series.str.isascii().all()),
+            'missing': bool(missing.any())}
+
+# Define function to parse the csv and write a fresh cache next to it. The cache is
+# written to a temporary directory first and then moved into place so readers
+# never see a half written cache
+def build_cache(csv_path):
+    cache_dir = cache_dir_for(csv_path)
+    stat = os.stat(csv_path)
+    source_hash = file_hash(csv_path)
+    games_df = pd.read_csv(csv_path)
+
+    temp_dir = tempfile.mkdtemp(prefix='.build-', dir=os.path.dirname(cache_dir))
+    try:
+        columns = {}
+        for name in games_df.columns:
+            columns[name] = encode_column(name, games_df[name], temp_dir)
+
+        meta = {'version': CACHE_VERSION, 'source_size': stat.st_size,
+                'source_mtime_ns': stat.st_mtime_ns, 'source_hash': source_hash,
+                'rows': len(games_df), 'column_order': list(games_df.columns),
+                'columns': columns}
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+        # Swap the new cache into place, removing any old one
+        if os.path.exists(cache_dir):
+            old_dir = f'{temp_dir}.old'
+            os.replace(cache_dir, old_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        try:
+            os.replace(temp_dir, cache_dir)
+        except OSError:
+            # Another process finished building the same cache first, so keep theirs
+            if not is_fresh(csv_path):
+                raise
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return cache_dir
+
+# Define StringColumn class that reads the values of a string column from its byte
+# buffer and offsets one row at a time. Only the rows used are decoded, so a memory
+# mapped column stays in pages shared between processes
+class StringColumn:
+
+    def __init__(self, blob, offsets, missing=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Define function to return the value of one row, or NaN if it is missing
+    def __getitem__(self, row):
+        row = range(len(self))[row]
+        if self.missing is not None and self.missing[row]:
+            return np.nan
+        return self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    # Define take method to return the values of some rows as an object array
+    def take(self, rows):
+        return np.array([self[row] for row in rows], dtype=object)
+
+# Define GamesCache class that gives access to the raw arrays of a cache directory
+class GamesCache:
+
+    # Open the cache directory and read its metadata
+    def __init__(self, cache_dir, mmap=True):
+        self.cache_dir = cache_dir
+        self.mmap_mode = 'r' if mmap else None
+        self.meta = read_meta(cache_dir)
+        self.rows = self.meta['rows']
+        self.columns = self.meta['column_order']
+
+    # Return the stored array for a column, memory mapped when mmap is enabled.
+    # For categoricals this is the integer codes, for strings the byte buffer
+    def array(self, name, suffix=''):
+        return np.load(os.path.join(self.cache_dir, f'{name}{suffix}.npy'),
+                       mmap_mode=self.mmap_mode)
+
+    # Return the categories of a categorical column
+    def categories(self, name):
+        return self.meta['columns'][name]['categories']
+
+    # Return the byte buffer and offsets of a string column
+    def strings(self, name):
+        return self.array(name), self.array(name, '.offsets')
+
+    # Return a text column for reading one row at a time: a StringColumn reading
+    # the stored buffer, or a categorical over the stored codes
+    def text(self, name):
+        info = self.meta['columns'][name]
+        if info['kind'] == 'categorical':
+            return pd.Categorical.from_codes(self.array(name), info['categories'])
+        blob, offsets = self.strings(name)
+        return StringColumn(blob, offsets,
+                            self.array(name, '.missing') if info.get('missing') else None)
+
+    # Return one column as a pandas Series. With shared, numbers are backed by the
+    # read-only memory maps, so they are shared between processes; otherwise they
+    # are copied into writable arrays. String columns are always decoded into
+    # private Python strings, use text() to read them one row at a time instead
+    def series(self, name, shared=False):
+        info = self.meta['columns'][name]
+        if info['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(self.array(name), info['categories'])
+        elif info['kind'] == 'string':
+            blob, offsets = self.strings(name)
+            values = np.array(decode_strings(blob, offsets, info['ascii']), dtype=object)
+            if info.get('missing'):
+                values[self.array(name, '.missing')] = np.nan
+        elif shared:
+            values = self.array(name)
+        else:
+            values = np.array(self.array(name), dtype=info['dtype'])
+        return pd.Series(values, name=name, copy=False)
+
+    # Return the cached columns as a dataframe, with the numbers and category codes
+    # shared between processes or copied as described for series()
+    def frame(self, columns=None, shared=False):
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.series(name, shared) for name in columns}, copy=False)
+
+# Define function to open the cache for a csv file, building or rebuilding it first
+# when it is missing or out of date
+def open_cache(csv_path, mmap=True):
+    if not is_fresh(csv_path):
+        build_cache(csv_path)
+    return GamesCache(cache_dir_for(csv_path), mmap=mmap)
+
+# Define load_games function that returns games.csv as a dataframe read from the
+# columnar cache. Passing columns only loads those columns. With shared, numeric
+# columns are read-only memory maps shared between processes
+def load_games(csv_path='games.csv', columns=None, mmap=True, shared=False):
+    return open_cache(csv_path, mmap=mmap).frame(columns, shared)
@@ -0,0 +1,42 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program migrates a prices.db made by the first version of db.py, with one
+# table per asset type and text timestamps, to the current layout: an assets table
+# and a single indexed prices table with integer timestamps and numeric prices.
+# The old tables are replaced by views with the same names and columns, so the
+# dashboard keeps working. The database is backed up to a .bak file first, and
+# the migration runs in one transaction, so it either moves everything or nothing.
+#
+# Example: python migrate_prices.py prices.db
+
+import argparse
+
+import db
+
+# Define the function to migrate the database given on the command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate prices.db to the indexed prices table')
+    parser.add_argument('path', nargs='?', default=db.DB_PATH)
+    parser.add_argument('--no-backup', action='store_true', help='do not write a .bak copy first')
+    args = parser.parse_args(argv)
+
+    con = db.connect(args.path)
+    tables = db.legacy_tables(con)
+    if not tables:
+        print(f'{args.path} is already in the current layout')
+        con.close()
+        return
+
+    # Back up the database, then move the prices and switch to write-ahead logging
+    if not args.no_backup:
+        db.backup_database(con, f'{args.path}.bak')
+        print(f'Backed up {args.path} to {args.path}.bak')
+    moved = db.migrate(con)
+    con.close()
+    db.create_database(args.path, backup=False)
+    print(f'Moved {moved} prices from {", ".join(tables)} into the prices table')
+
+# Execute main function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file turns the moves column of the chess dataset into integer arrays so that
+# move statistics never have to split the move strings again. Every distinct move
+# (in SAN, e.g. 'e4' or 'Nxf7+') gets an integer id in a vocabulary, the moves of
+# all games are stored back to back in one token array, and an offsets array marks
+# where each game starts. From these arrays we count move frequencies, move
+# frequencies at a given ply, and sequences of 2 or more consecutive moves
+# (n-grams) for any subset of games using NumPy instead of Python strings.
+
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+# Define MoveTokens class that holds the moves of every game as a ragged array of
+# integer move ids
+class MoveTokens:
+
+    # Store the vocabulary, the flat token array and the per-game offsets, and
+    # derive the game number and ply of every token
+    def __init__(self, vocab, tokens, offsets):
+        self.vocab = np.asarray(vocab, dtype=object)
+        self.tokens = np.asarray(tokens)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.diff(self.offsets)
+        self.game_of_token = np.repeat(np.arange(len(self.lengths)), self.lengths)
+        self.ply = np.arange(len(self.tokens)) - np.repeat(self.offsets[:-1], self.lengths)
+
+    # Define from_moves class method to tokenize a sequence of space separated move
+    # strings, splitting every game exactly once
+    @classmethod
+    def from_moves(cls, moves):
+        split_games = [str(game).split() for game in moves]
+        lengths = np.fromiter((len(game) for game in split_games), dtype=np.int64,
+                              count=len(split_games))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        # Give every distinct move an integer id
+        flat_moves = np.fromiter(chain.from_iterable(split_games), dtype=object,
+                                 count=int(offsets[-1]))
+        codes, vocab = pd.factorize(flat_moves)
+        return cls(np.asarray(vocab, dtype=object), codes.astype(np.int32), offsets)
+
+    # Define save method to write the arrays to a .npz file
+    def save(self, path):
+        np.savez(path, vocab=self.vocab.astype(str), tokens=self.tokens,
+                 offsets=self.offsets)
+
+    # Define load class method to read arrays written by save()
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vocab'].astype(object), data['tokens'], data['offsets'])
+
+    # Define game_moves method to return the moves of one game as strings
+    def game_moves(self, game):
+        return self.vocab[self.tokens[self.offsets[game]:self.offsets[game + 1]]].tolist()
+
+    # Define token_mask method to return which tokens belong to the selected games.
+    # games can be None for every game, a boolean mask or an array of game numbers
+    def token_mask(self, games=None):
+        if games is None:
+            return np.ones(len(self.tokens), dtype=bool)
+        games = np.asarray(games)
+        if games.dtype != bool:
+            selected = np.zeros(len(self.lengths), dtype=bool)
+            selected[games] = True
+            games = selected
+        return games[self.game_of_token]
+
+    # Define function to turn counts per vocabulary id into a Series of the moves
+    # that occur, most frequent first. Ties keep the order the moves first appear
+    # in, like value_counts()
+    def _count_series(self, counts, selected_tokens, name='count'):
+        first_seen = np.full(len(counts), len(selected_tokens))
+        seen, positions = np.unique(selected_tokens, return_index=True)
+        first_seen[seen] = positions
+        order = np.lexsort((first_seen, -counts))
+        order = order[counts[order] > 0]
+        return pd.Series(counts[order], index=pd.Index(self.vocab[order], name='move'),
+                         name=name)
+
+    # Define move_counts method to count how often every move is played in the
+    # selected games
+    def move_counts(self, games=None):
+        selected = self.tokens[self.token_mask(games)]
+        counts = np.bincount(selected, minlength=len(self.vocab))
+        return self._count_series(counts, selected)
+
+    # Define ply_counts method to count the moves played at one ply (0 is white's
+    # first move) in the selected games
+    def ply_counts(self, ply, games=None):
+        selected = self.tokens[self.token_mask(games) & (self.ply == ply)]
+        counts = np.bincount(selected, minlength=len(self.vocab))
+        return self._count_series(counts, selected)
+
+    # Define ply_table method to count every move at each of the first max_ply plies
+    # in one pass. Returns a dataframe with one row per ply and one column per move
+    def ply_table(self, max_ply=10, games=None):
+        mask = self.token_mask(games) & (self.ply < max_ply)
+        keys = self.ply[mask] * len(self.vocab) + self.tokens[mask]
+        counts = np.bincount(keys, minlength=max_ply * len(self.vocab))
+        table = counts.reshape(max_ply, len(self.vocab))
+        played = table.sum(axis=0) > 0
+        return pd.DataFrame(table[:, played], index=pd.RangeIndex(max_ply, name='ply'),
+                            columns=pd.Index(self.vocab[played], name='move'))
+
+    # Define ngram_counts method to count every sequence of n consecutive moves
+    # inside the selected games. Returns a Series indexed by the space separated
+    # moves, most frequent first, optionally cut to the top entries
+    def ngram_counts(self, n, games=None, top=None):
+        # An n-gram can start at any token that has n - 1 more moves after it in
+        # the same game
+        starts = np.flatnonzero(self.token_mask(games) &
+                                (self.ply <= self.lengths[self.game_of_token] - n))
+        columns = np.stack([self.tokens[starts + i] for i in range(n)], axis=1)
+
+        # Combine the move ids into one integer key when it fits in 64 bits, and
+        # otherwise find the distinct rows directly
+        vocab_size = max(len(self.vocab), 1)
+        if vocab_size ** n < 2 ** 63:
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for i in range(n):
+                keys = keys * vocab_size + columns[:, i]
+            _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+            grams = columns[first]
+        else:
+            grams, counts = np.unique(columns, axis=0, return_counts=True)
+
+        order = np.argsort(-counts, kind='stable')
+        if top is not None:
+            order = order[:top]
+        names = [' '.join(moves) for moves in self.vocab[grams[order]]]
+        return pd.Series(counts[order], index=pd.Index(names, name='moves'), name='count')
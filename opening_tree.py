@@ -0,0 +1,228 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file builds an opening tree (a trie) over the moves of every game in the
+# dataset so that questions like "what happens after 1.e4 e5 2.Nf3" can be answered
+# for any sequence of moves, not only for named openings. Each node of the tree is a
+# sequence of moves from the starting position and stores how many games reached
+# it, how many of those white won, black won or drew, and the sum of the players'
+# ratings. Instead of nested dictionaries the tree is kept in flat NumPy arrays:
+# nodes are numbered level by level, the children of a node sit next to each other
+# sorted by move, and an offsets array points at them, so following a move is a
+# binary search. Because it is only arrays, the tree can be saved as .npy files and
+# memory mapped back in by other processes.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Names of the per-node arrays written by save() and read by load()
+NODE_ARRAYS = ['parent', 'move', 'depth', 'games', 'white', 'black', 'draw',
+               'white_rating_sum', 'black_rating_sum', 'child_offsets', 'preorder',
+               'subtree_size', 'game_order', 'game_keys']
+
+# Define OpeningTree class that stores the trie in flat arrays
+class OpeningTree:
+
+    # Store the move vocabulary and the node arrays
+    def __init__(self, vocab, arrays):
+        self.vocab = np.asarray(vocab, dtype=object)
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self._move_ids = None
+
+    # Define build class method to create the tree from tokenized moves (a
+    # move_stats.MoveTokens), outcome codes (0 white, 1 black, 2 draw, -1 other) and
+    # the players' ratings. max_depth limits how many plies of each game are added
+    @classmethod
+    def build(cls, move_tokens, outcomes, white_rating, black_rating, max_depth=None):
+        lengths = move_tokens.lengths
+        offsets = move_tokens.offsets
+        tokens = move_tokens.tokens
+        vocab_size = max(len(move_tokens.vocab), 1)
+        outcomes = np.asarray(outcomes)
+        white_rating = np.asarray(white_rating, dtype=float)
+        black_rating = np.asarray(black_rating, dtype=float)
+        depth_limit = int(lengths.max(initial=0)) if max_depth is None else max_depth
+
+        # The root node stands for the starting position and counts every game
+        columns = {name: [value] for name, value in (
+            ('parent', np.array([-1])), ('move', np.array([-1])), ('depth', np.array([0])),
+            ('games', np.array([len(lengths)])),
+            ('white', np.array([(outcomes == 0).sum()])),
+            ('black', np.array([(outcomes == 1).sum()])),
+            ('draw', np.array([(outcomes == 2).sum()])),
+            ('white_rating_sum', np.array([white_rating.sum()])),
+            ('black_rating_sum', np.array([black_rating.sum()])))}
+        level_starts = [0, 1]
+
+        # Add one level of nodes per ply. Each game still going at this ply moves
+        # from its current node to the child for its next move; np.unique on
+        # (node, move) keys finds the distinct children, already sorted by parent
+        # and then by move
+        game_node = np.zeros(len(lengths), dtype=np.int64)
+        next_id = 1
+        for ply in range(depth_limit):
+            active = np.flatnonzero(lengths > ply)
+            if len(active) == 0:
+                break
+            keys = game_node[active] * vocab_size + tokens[offsets[active] + ply]
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            count = len(unique_keys)
+
+            columns['parent'].append(unique_keys // vocab_size)
+            columns['move'].append(unique_keys % vocab_size)
+            columns['depth'].append(np.full(count, ply + 1))
+            columns['games'].append(np.bincount(inverse, minlength=count))
+            for code, name in enumerate(('white', 'black', 'draw')):
+                columns[name].append(np.bincount(inverse, weights=outcomes[active] == code,
+                                                 minlength=count))
+            columns['white_rating_sum'].append(np.bincount(inverse, weights=white_rating[active],
+                                                           minlength=count))
+            columns['black_rating_sum'].append(np.bincount(inverse, weights=black_rating[active],
+                                                           minlength=count))
+
+            game_node[active] = next_id + inverse
+            next_id += count
+            level_starts.append(next_id)
+
+        arrays = {
+            'parent': np.concatenate(columns['parent']).astype(np.int32),
+            'move': np.concatenate(columns['move']).astype(np.int32),
+            'depth': np.concatenate(columns['depth']).astype(np.int16),
+            'white_rating_sum': np.concatenate(columns['white_rating_sum']),
+            'black_rating_sum': np.concatenate(columns['black_rating_sum']),
+        }
+        for name in ('games', 'white', 'black', 'draw'):
+            arrays[name] = np.concatenate(columns[name]).astype(np.int32)
+
+        # Node ids grow with depth and, inside a level, with the parent id, so the
+        # parent array is sorted and the children of node n are the nodes from
+        # child_offsets[n] to child_offsets[n + 1]
+        node_count = next_id
+        arrays['child_offsets'] = 1 + np.searchsorted(arrays['parent'][1:],
+                                                      np.arange(node_count + 1), side='left')
+
+        # Number the nodes in depth first order so the subtree below a node is one
+        # range of numbers. Subtree sizes are summed from the deepest level up, and a
+        # child's number is its parent's number plus the sizes of earlier siblings
+        subtree_size = np.ones(node_count, dtype=np.int64)
+        for start, end in reversed(list(zip(level_starts[1:-1], level_starts[2:]))):
+            np.add.at(subtree_size, arrays['parent'][start:end], subtree_size[start:end])
+        preorder = np.zeros(node_count, dtype=np.int64)
+        for start, end in zip(level_starts[1:-1], level_starts[2:]):
+            parents = arrays['parent'][start:end]
+            sizes = subtree_size[start:end]
+            before = np.cumsum(sizes) - sizes
+            group_starts = np.concatenate(([0], np.flatnonzero(np.diff(parents)) + 1))
+            group = np.cumsum(np.concatenate(([0], np.diff(parents) != 0)))
+            preorder[start:end] = preorder[parents] + 1 + before - before[group_starts][group]
+        arrays['preorder'] = preorder
+        arrays['subtree_size'] = subtree_size
+
+        # Sort the games by the depth first number of the last node they reached, so
+        # the games passing through a node are one slice of game_order
+        game_keys = preorder[game_node]
+        arrays['game_order'] = np.argsort(game_keys, kind='stable')
+        arrays['game_keys'] = game_keys[arrays['game_order']]
+        return cls(move_tokens.vocab, arrays)
+
+    # Define save method to write the tree as .npy files in a directory
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'vocab.json'), 'w') as file:
+            json.dump(self.vocab.tolist(), file)
+
+    # Define load class method to read a tree written by save(), memory mapping the
+    # arrays by default
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in NODE_ARRAYS}
+        with open(os.path.join(directory, 'vocab.json'), 'r') as file:
+            vocab = json.load(file)
+        return cls(vocab, arrays)
+
+    # Define function to look up the id of a move string in the vocabulary
+    def _move_id(self, move):
+        if self._move_ids is None:
+            self._move_ids = {name: i for i, name in enumerate(self.vocab)}
+        return self._move_ids.get(move, -1)
+
+    # Define child method to return the node reached by playing a move from a node,
+    # or -1 if no game played it
+    def child(self, node, move):
+        move_id = self._move_id(move)
+        start, end = self.child_offsets[node], self.child_offsets[node + 1]
+        position = start + np.searchsorted(self.move[start:end], move_id)
+        if move_id < 0 or position >= end or self.move[position] != move_id:
+            return -1
+        return int(position)
+
+    # Define find method to return the node for a sequence of moves, given as a
+    # space separated string or a list, or -1 if no game started that way
+    def find(self, moves):
+        if isinstance(moves, str):
+            moves = moves.split()
+        node = 0
+        for move in moves:
+            node = self.child(node, move)
+            if node < 0:
+                return -1
+        return node
+
+    # Define node_stats method to return the game count, outcome percentages and
+    # mean ratings stored at a node
+    def node_stats(self, node):
+        games = int(self.games[node])
+        if games == 0:
+            return {'games': 0}
+        return {'games': games,
+                'white_win_rate': self.white[node] * 100 / games,
+                'black_win_rate': self.black[node] * 100 / games,
+                'draw_rate': self.draw[node] * 100 / games,
+                'mean_white_rating': self.white_rating_sum[node] / games,
+                'mean_black_rating': self.black_rating_sum[node] / games,
+                'mean_rating': (self.white_rating_sum[node] +
+                                self.black_rating_sum[node]) / (2 * games)}
+
+    # Define stats method to return the statistics for a sequence of moves, or None
+    # if no game started that way
+    def stats(self, moves):
+        node = self.find(moves)
+        return None if node < 0 else self.node_stats(node)
+
+    # Define continuations method to return a dataframe with one row per next move
+    # played after a sequence of moves, most common first
+    def continuations(self, moves):
+        node = self.find(moves)
+        if node < 0:
+            return pd.DataFrame(columns=['games', 'white_win_rate', 'black_win_rate',
+                                         'draw_rate', 'mean_rating'])
+        children = np.arange(self.child_offsets[node], self.child_offsets[node + 1])
+        games = self.games[children].astype(float)
+        table = pd.DataFrame({
+            'games': self.games[children],
+            'white_win_rate': self.white[children] * 100 / games,
+            'black_win_rate': self.black[children] * 100 / games,
+            'draw_rate': self.draw[children] * 100 / games,
+            'mean_rating': (self.white_rating_sum[children] +
+                            self.black_rating_sum[children]) / (2 * games),
+        }, index=pd.Index(self.vocab[self.move[children]], name='move'))
+        return table.sort_values('games', ascending=False, kind='stable')
+
+    # Define game_rows method to return the row numbers of every game that started
+    # with a sequence of moves
+    def game_rows(self, moves):
+        node = self.find(moves)
+        if node < 0:
+            return self.game_order[:0]
+        first = self.preorder[node]
+        start = np.searchsorted(self.game_keys, first, side='left')
+        end = np.searchsorted(self.game_keys, first + self.subtree_size[node], side='left')
+        return np.sort(self.game_order[start:end])
@@ -0,0 +1,194 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file prepares what the interactive visualizer shows for one opening: the
+# summary statistics, the three plots rendered to PNG or SVG bytes, and the sorted
+# table of its games. Views are kept in a least recently used cache limited by
+# their size in megabytes, so flipping back to an opening seen before shows it
+# again without recomputing or redrawing anything. The most played openings can
+# be prepared ahead of time in a background thread, and the cache counts hits and
+# misses so its size can be tuned. Plots are drawn on matplotlib Figure objects
+# instead of through pyplot, so they can be rendered outside the main thread.
+
+from collections import OrderedDict
+import io
+import threading
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# Columns of the games table shown for an opening, in display order
+TABLE_COLUMNS = ['avrating', 'white_rating', 'black_rating', 'winner', 'victory',
+                 'turns', 'id']
+
+# Define draw_outcome_pie function to draw a pie chart of the white, black and
+# draw percentages on an axes
+def draw_outcome_pie(ax, sizes, title):
+    ax.pie(sizes, labels=('White', 'Black', 'Draw'), autopct='%1.1f%%',
+           shadow=True, startangle=90)
+    ax.axis('equal')
+    ax.set_title(title)
+
+# Define draw_move_counts function to draw a bar chart of the 10 most frequent
+# moves from a Series of move counts on an axes
+def draw_move_counts(ax, move_counts):
+    move_counts.head(10).plot(kind='bar', color='skyblue', ax=ax)
+    ax.set_title('Most Frequent Moves')
+    ax.set_xlabel('Move')
+    ax.set_ylabel('Frequency')
+
+# Define draw_difference_rates function to draw the stacked share of each winner
+# per rating difference group on an axes
+def draw_difference_rates(ax, win_percentages):
+    win_percentages.plot(kind='bar', stacked=True, colormap='coolwarm_r', ax=ax)
+    ax.set_title('Win Percentage Based on Rating Difference')
+    ax.set_xlabel('Rating Difference')
+    ax.set_ylabel('Win Percentage')
+    ax.legend(title='Winner', loc='upper right')
+
+# Define render function to draw a plot with one of the draw functions above and
+# return the image as bytes in the given format ('png' or 'svg')
+def render(draw, *args, fmt='png'):
+    fig = Figure()
+    draw(fig.add_subplot(), *args)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, bbox_inches='tight')
+    return buffer.getvalue()
+
+# Define build_opening_view function to compute everything shown for an opening
+# of a chess_analytics.ChessDataset: its summary, its rendered plots and the table
+# of its games sorted by average rating
+def build_opening_view(dataset, opening, fmt='png'):
+    summary = dataset.opening_summary(opening)
+    figures = {
+        'outcomes': render(draw_outcome_pie, summary['outcome_percentages'],
+                           'Win percentages', fmt=fmt),
+        'moves': render(draw_move_counts, dataset.move_counts(opening=opening), fmt=fmt),
+        'rating_difference': render(draw_difference_rates, summary['difference_rates'],
+                                    fmt=fmt),
+    }
+    table = (dataset.games_for_opening(opening)
+             .assign(avrating=lambda x: x['avrating'].astype(int),
+                     victory=lambda x: x['victory_status'])
+             .sort_values(by='avrating', ascending=False)
+             [TABLE_COLUMNS])
+    return {'opening': opening, 'format': fmt, 'summary': summary,
+            'figures': figures, 'table': table}
+
+# Define function to estimate the memory held by an opening view in bytes
+def view_size(view):
+    return (sum(len(image) for image in view['figures'].values())
+            + int(view['table'].memory_usage(deep=True).sum())
+            + int(view['summary']['difference_rates'].memory_usage(deep=True).sum()))
+
+# Define function to return the names of the most played openings of a dataset,
+# most played first
+def most_played_openings(dataset, count=10):
+    index = dataset.opening_index
+    order = np.argsort(-index.counts, kind='stable')[:count]
+    return index.names[order].tolist()
+
+# Define OpeningViewCache class that keeps the most recently used opening views
+# within a size limit in megabytes
+class OpeningViewCache:
+
+    # Create an empty cache. build is called with an opening name and returns its
+    # view, e.g. lambda opening: build_opening_view(dataset, opening)
+    def __init__(self, build, max_mb=64):
+        self.build = build
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.precomputed = 0
+        self._views = OrderedDict()
+        self._sizes = {}
+        self._building = {}
+        self._lock = threading.Lock()
+
+    # Define __contains__ method to check if an opening's view is cached
+    def __contains__(self, opening):
+        with self._lock:
+            return opening in self._views
+
+    # Define __len__ method to return the number of cached views
+    def __len__(self):
+        return len(self._views)
+
+    # Define get method to return the view of an opening, building it only when it
+    # is not cached. If another thread is already building it, wait for that view
+    def get(self, opening, count=True):
+        with self._lock:
+            if opening in self._views:
+                if count:
+                    self.hits += 1
+                self._views.move_to_end(opening)
+                return self._views[opening]
+            if count:
+                self.misses += 1
+            building = self._building.get(opening)
+            if building is None:
+                building = self._building[opening] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            building.wait()
+            with self._lock:
+                if opening in self._views:
+                    return self._views[opening]
+            return self.build(opening)
+
+        try:
+            view = self.build(opening)
+            self._store(opening, view)
+        finally:
+            with self._lock:
+                del self._building[opening]
+            building.set()
+        return view
+
+    # Define function to add a view and drop the least recently used views until
+    # the cache fits its size limit. Views bigger than the whole limit are not kept
+    def _store(self, opening, view):
+        size = view_size(view)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._views[opening] = view
+            self._sizes[opening] = size
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                old, _ = self._views.popitem(last=False)
+                self.nbytes -= self._sizes.pop(old)
+
+    # Define precompute method to build the views of the given openings in a
+    # background daemon thread. Returns the thread so callers can join it
+    def precompute(self, openings):
+        def work():
+            for opening in openings:
+                if opening not in self:
+                    self.get(opening, count=False)
+                    self.precomputed += 1
+
+        thread = threading.Thread(target=work, name='opening-view-precompute', daemon=True)
+        thread.start()
+        return thread
+
+    # Define clear method to drop every cached view and reset the counters
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.precomputed = 0
+
+    # Define stats method to return the counters used to tune the cache size
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'precomputed': self.precomputed, 'views': len(self._views),
+                'megabytes': self.nbytes / (1024 * 1024),
+                'max_megabytes': self.max_bytes / (1024 * 1024)}
@@ -0,0 +1,134 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file builds an index of every position reached in the chess dataset, keyed by
+# the 64-bit Zobrist hash stored by game_replay.py. Different move orders that reach
+# the same position (transpositions) share one hash, so the index answers "how does
+# this position score" no matter how the position was reached, unlike the opening
+# statistics that are keyed by opening name or move strings. For each position we
+# store how often it occurred, how many games reached it, how those games ended, and
+# the players' rating sums. The positions are kept as a sorted array of hashes with
+# matching arrays of statistics, so a lookup is a binary search, and the arrays can
+# be saved and memory mapped like the opening tree.
+
+import os
+
+import chess
+import chess.polyglot
+import numpy as np
+import pandas as pd
+
+# Names of the arrays written by save() and read by load()
+INDEX_ARRAYS = ['keys', 'occurrences', 'games', 'white', 'black', 'draw',
+                'white_rating_sum', 'black_rating_sum']
+
+# Define function to return the Zobrist hash of a position given as a FEN, a
+# chess.Board, or a sequence of SAN moves from the starting position
+def position_key(fen=None, board=None, moves=None):
+    if board is None:
+        if fen is not None:
+            board = chess.Board(fen)
+        else:
+            board = chess.Board()
+            for move_str in (moves.split() if isinstance(moves, str) else moves or []):
+                board.push_san(move_str)
+    return chess.polyglot.zobrist_hash(board)
+
+# Define PositionIndex class that stores per-position statistics in sorted arrays
+class PositionIndex:
+
+    # Store the sorted hashes and the statistics arrays that go with them
+    def __init__(self, arrays):
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    # Define build class method to create the index from a game_replay.ReplayStore,
+    # outcome codes (0 white, 1 black, 2 draw, -1 other) and the players' ratings.
+    # Rows of the replay store must line up with the outcome and rating arrays
+    @classmethod
+    def build(cls, replay, outcomes, white_rating, black_rating):
+        keys = np.asarray(replay.keys, dtype=np.uint64)
+        positions_per_game = np.diff(replay.position_offsets)
+        game_of_position = np.repeat(np.arange(len(positions_per_game)), positions_per_game)
+
+        # Count every occurrence of each position
+        unique_keys, occurrences = np.unique(keys, return_counts=True)
+
+        # A game that repeats a position should only count once for that position's
+        # results, so drop repeated (position, game) pairs first
+        order = np.lexsort((game_of_position, keys))
+        sorted_keys = keys[order]
+        sorted_games = game_of_position[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_games[1:] != sorted_games[:-1])
+        sorted_keys = sorted_keys[first]
+        sorted_games = sorted_games[first]
+        slot = np.searchsorted(unique_keys, sorted_keys)
+
+        # Sum the results and ratings of the games reaching each position
+        outcomes = np.asarray(outcomes)[sorted_games]
+        count = len(unique_keys)
+        arrays = {'keys': unique_keys, 'occurrences': occurrences.astype(np.int32),
+                  'games': np.bincount(slot, minlength=count).astype(np.int32)}
+        for code, name in enumerate(('white', 'black', 'draw')):
+            arrays[name] = np.bincount(slot, weights=outcomes == code,
+                                       minlength=count).astype(np.int32)
+        arrays['white_rating_sum'] = np.bincount(
+            slot, weights=np.asarray(white_rating, dtype=float)[sorted_games], minlength=count)
+        arrays['black_rating_sum'] = np.bincount(
+            slot, weights=np.asarray(black_rating, dtype=float)[sorted_games], minlength=count)
+        return cls(arrays)
+
+    # Define save method to write the arrays as .npy files in a directory
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+
+    # Define load class method to read arrays written by save(), memory mapping them
+    # by default
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        return cls({name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                    for name in INDEX_ARRAYS})
+
+    # Define find method to return the slot of a position hash, or -1 if no game
+    # reached that position
+    def find(self, key):
+        key = np.uint64(key)
+        slot = int(np.searchsorted(self.keys, key))
+        if slot < len(self.keys) and self.keys[slot] == key:
+            return slot
+        return -1
+
+    # Define slot_stats method to return the statistics stored in one slot
+    def slot_stats(self, slot):
+        games = int(self.games[slot])
+        return {'key': int(self.keys[slot]),
+                'occurrences': int(self.occurrences[slot]),
+                'games': games,
+                'white_win_rate': self.white[slot] * 100 / games,
+                'black_win_rate': self.black[slot] * 100 / games,
+                'draw_rate': self.draw[slot] * 100 / games,
+                'mean_white_rating': self.white_rating_sum[slot] / games,
+                'mean_black_rating': self.black_rating_sum[slot] / games}
+
+    # Define stats method to return the statistics of a position given as a hash,
+    # FEN, board or list of SAN moves, or None if no game reached it
+    def stats(self, key=None, fen=None, board=None, moves=None):
+        if key is None:
+            key = position_key(fen=fen, board=board, moves=moves)
+        slot = self.find(key)
+        return None if slot < 0 else self.slot_stats(slot)
+
+    # Define most_common method to return a dataframe of the positions reached by
+    # the most games
+    def most_common(self, count=10):
+        order = np.argsort(-np.asarray(self.games), kind='stable')[:count]
+        games = self.games[order].astype(float)
+        return pd.DataFrame({'key': self.keys[order], 'games': self.games[order],
+                             'occurrences': self.occurrences[order],
+                             'white_win_rate': self.white[order] * 100 / games,
+                             'black_win_rate': self.black[order] * 100 / games,
+                             'draw_rate': self.draw[order] * 100 / games})
@@ -0,0 +1,138 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program reads the product name and price out of the HTML of an Amazon
+# product page. An extractor is any object with an extract() method that takes the
+# page source and returns the product name and the price as a Decimal, so prices
+# like "1,299.99" no longer need their commas stripped later. LxmlExtractor parses
+# the page with lxml and finds the three elements with XPath expressions compiled
+# once. StreamingExtractor feeds the page to lxml in pieces and stops as soon as
+# the name and price have been read, which skips most of a long page.
+# SoupExtractor is the original BeautifulSoup search, kept for comparison and as
+# a fallback. benchmarks/bench_extract.py compares their speed.
+
+from decimal import Decimal, InvalidOperation
+import re
+
+from lxml import etree as et
+
+# XPath expressions for the whole and fractional parts of the first price on the
+# page and for the product title, compiled once
+CLASS_TEST = 'contains(concat(" ", normalize-space(@class), " "), " {} ")'
+PRICE_WHOLE = et.XPath(f'(//span[{CLASS_TEST.format("a-price-whole")}])[1]')
+PRICE_FRACTION = et.XPath(f'(//span[{CLASS_TEST.format("a-price-fraction")}])[1]')
+PRODUCT_TITLE = et.XPath('//*[@id="productTitle"][1]')
+
+# Pattern of the characters that are not digits
+NOT_DIGITS = re.compile(r'\D')
+
+# Define ExtractionError exception raised when a page has no product name or price
+class ExtractionError(ValueError):
+    pass
+
+# Define function to turn the text of the whole and fractional parts of a price,
+# e.g. "1,299." and "99", into a Decimal
+def parse_price(whole, fraction):
+    try:
+        return Decimal(f'{NOT_DIGITS.sub("", whole) or "0"}.{NOT_DIGITS.sub("", fraction) or "0"}')
+    except InvalidOperation:
+        raise ExtractionError(f'cannot read a price from {whole!r} and {fraction!r}') from None
+
+# Define function to return the text of an lxml element and its children
+def element_text(element):
+    return ''.join(element.itertext())
+
+# Define function to build the (name, price) result from the three elements found
+# on a page, raising ExtractionError if one is missing
+def extraction_result(title, whole, fraction):
+    if title is None or whole is None or fraction is None:
+        missing = [name for name, element in (('productTitle', title), ('a-price-whole', whole),
+                                              ('a-price-fraction', fraction))
+                   if element is None]
+        raise ExtractionError(f'page has no {", ".join(missing)}')
+    return element_text(title).strip(), parse_price(element_text(whole), element_text(fraction))
+
+# Define LxmlExtractor class that parses the whole page with lxml and looks the
+# elements up with precompiled XPath expressions
+class LxmlExtractor:
+
+    def __init__(self):
+        self.parser = et.HTMLParser(remove_comments=True, remove_blank_text=True)
+
+    # Define extract method to return the product name and Decimal price of a page
+    def extract(self, page_content):
+        root = et.fromstring(page_content, self.parser)
+        if root is None:
+            raise ExtractionError('page is empty')
+
+        # Return the first match of each expression, or None if nothing matched
+        def first(xpath):
+            matches = xpath(root)
+            return matches[0] if matches else None
+        return extraction_result(first(PRODUCT_TITLE), first(PRICE_WHOLE), first(PRICE_FRACTION))
+
+# Define StreamingExtractor class that parses a page in pieces and stops once the
+# product title and both parts of the price have been read
+class StreamingExtractor:
+
+    def __init__(self, chunk_size=16384):
+        self.chunk_size = chunk_size
+
+    # Define function to return which of the wanted elements an element is
+    @staticmethod
+    def _kind(element):
+        if element.get('id') == 'productTitle':
+            return 'title'
+        classes = (element.get('class') or '').split()
+        if element.tag == 'span' and 'a-price-whole' in classes:
+            return 'whole'
+        if element.tag == 'span' and 'a-price-fraction' in classes:
+            return 'fraction'
+        return None
+
+    # Define extract method to return the product name and Decimal price of a page
+    def extract(self, page_content):
+        parser = et.HTMLPullParser(events=('end',), remove_comments=True)
+        found = {}
+
+        # Define function to remember the first of each wanted element parsed so far
+        def collect():
+            for _, element in parser.read_events():
+                kind = self._kind(element)
+                if kind is not None and kind not in found:
+                    found[kind] = element
+
+        for start in range(0, len(page_content), self.chunk_size):
+            parser.feed(page_content[start:start + self.chunk_size])
+            collect()
+            if len(found) == 3:
+                break
+        else:
+            # The whole page was fed, so close the parser to get the last elements
+            if page_content:
+                parser.close()
+                collect()
+        return extraction_result(found.get('title'), found.get('whole'), found.get('fraction'))
+
+# Define SoupExtractor class that finds the elements with BeautifulSoup like the
+# first version of return_price()
+class SoupExtractor:
+
+    def __init__(self, features='html.parser'):
+        self.features = features
+
+    # Define extract method to return the product name and Decimal price of a page
+    def extract(self, page_content):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(page_content, self.features)
+        price_int = soup.find('span', class_="a-price-whole")
+        price_decimal = soup.find('span', class_='a-price-fraction')
+        product_name = soup.find(id='productTitle')
+        if price_int is None or price_decimal is None or product_name is None:
+            raise ExtractionError('page has no product title or price')
+        return (product_name.get_text().strip(),
+                parse_price(price_int.get_text(), price_decimal.get_text()))
+
+# Extractors by name, for choosing one in settings or on the command line
+EXTRACTORS = {'lxml': LxmlExtractor, 'streaming': StreamingExtractor, 'soup': SoupExtractor}
@@ -0,0 +1,147 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program runs the price lookups of update_prices() concurrently. Every lookup
+# is a job belonging to a source (amazon, stock, or crypto). The blocking lookups
+# run in a thread pool driven by asyncio, so the network waits of all sources
+# overlap, while a semaphore per source limits how many lookups of that source run
+# at the same time. Each attempt has a timeout, failed or timed out attempts are
+# retried with exponential backoff, and the latency of every attempt is recorded
+# per source. The lookup functions are passed in, so the fetcher can be tested
+# offline with fake clients or local stub servers.
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import time
+
+# Define SourceLimits class holding how a source is fetched: how many lookups run
+# at once, the timeout of one attempt in seconds, how many times a failed lookup is
+# retried, and the delay before the first retry (doubled for every later retry)
+class SourceLimits:
+
+    def __init__(self, concurrency=4, timeout=30.0, retries=2, backoff=1.0):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+# Limits used for the sources of update_prices() unless others are given. Amazon
+# pages are slow to load and share a pool of two browsers, while Yahoo Finance and
+# CoinGecko are asked once for every ticker or coin
+DEFAULT_LIMITS = {'amazon': SourceLimits(concurrency=2, timeout=60.0, retries=1),
+                  'stock': SourceLimits(concurrency=1, timeout=20.0, retries=2),
+                  'crypto': SourceLimits(concurrency=1, timeout=15.0, retries=2)}
+
+# Define SourceStats class counting the attempts of one source and keeping the
+# latencies of its most recent attempts
+class SourceStats:
+
+    def __init__(self, history=1000):
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=history)
+
+    # Define summary method to return the counts and latency percentiles in seconds
+    def summary(self):
+        latencies = sorted(self.latencies)
+        summary = {'attempts': self.attempts, 'successes': self.successes,
+                   'failures': self.failures, 'retries': self.retries,
+                   'timeouts': self.timeouts}
+        if latencies:
+            summary.update({'mean_s': statistics.fmean(latencies),
+                            'p50_s': latencies[len(latencies) // 2],
+                            'p95_s': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                            'max_s': latencies[-1]})
+        return summary
+
+# Define Fetcher class that runs jobs of several sources concurrently
+class Fetcher:
+
+    # Create a fetcher. limits maps source names to SourceLimits, with sources not
+    # given using SourceLimits(). sleep is awaited between retries and can be
+    # replaced in tests
+    def __init__(self, limits=None, sleep=asyncio.sleep):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.sleep = sleep
+        self.stats = {}
+
+    # Define function to return the limits and statistics of a source
+    def _source(self, source):
+        if source not in self.limits:
+            self.limits[source] = SourceLimits()
+        if source not in self.stats:
+            self.stats[source] = SourceStats()
+        return self.limits[source], self.stats[source]
+
+    # Define function to run one job, retrying failed attempts, while holding its
+    # source's semaphore. Returns the job's result or raises its last error
+    async def _run_job(self, source, function, executor, semaphores):
+        limits, stats = self._source(source)
+        loop = asyncio.get_running_loop()
+        async with semaphores[source]:
+            for attempt in range(limits.retries + 1):
+                if attempt:
+                    stats.retries += 1
+                    await self.sleep(limits.backoff * 2 ** (attempt - 1))
+                stats.attempts += 1
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(loop.run_in_executor(executor, function),
+                                                    limits.timeout)
+                except Exception as e:
+                    stats.latencies.append(time.perf_counter() - start)
+                    if isinstance(e, asyncio.TimeoutError):
+                        stats.timeouts += 1
+                    error = e
+                    continue
+                stats.latencies.append(time.perf_counter() - start)
+                stats.successes += 1
+                return result
+        stats.failures += 1
+        raise error
+
+    # Define fetch method to run jobs given as (source, key, function) tuples, where
+    # function takes no arguments. Jobs with the same source and key run once.
+    # Returns a dictionary of results and a dictionary of errors, both keyed by
+    # (source, key)
+    async def fetch(self, jobs):
+        unique = {}
+        for source, key, function in jobs:
+            unique.setdefault((source, key), (source, key, function))
+        jobs = list(unique.values())
+        semaphores = {source: asyncio.Semaphore(self._source(source)[0].concurrency)
+                      for source, _, _ in jobs}
+
+        # Size the pool so every source can use its full concurrency, with room for
+        # threads still busy with attempts that timed out. The pool is not waited
+        # for when done, so a lookup that hangs does not hold up the results
+        workers = 2 * sum(self.limits[source].concurrency for source in semaphores) or 1
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        try:
+            outcomes = await asyncio.gather(
+                *(self._run_job(source, function, executor, semaphores)
+                  for source, _, function in jobs),
+                return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        results, errors = {}, {}
+        for (source, key, _), outcome in zip(jobs, outcomes):
+            if isinstance(outcome, BaseException):
+                errors[(source, key)] = outcome
+            else:
+                results[(source, key)] = outcome
+        return results, errors
+
+    # Define fetch_sync method to run fetch() from code that is not async
+    def fetch_sync(self, jobs):
+        return asyncio.run(self.fetch(jobs))
+
+    # Define metrics method to return the statistics summary of every source
+    def metrics(self):
+        return {source: stats.summary() for source, stats in self.stats.items()}
@@ -0,0 +1,100 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program keeps track of the lowest price of every tracked item over a rolling
+# window (two weeks by default), so update_prices() can tell whether a new price is
+# a new low without querying the database for each item. Each item has a monotonic
+# deque of (timestamp, price) pairs with increasing prices: a new price first removes
+# the pairs at the back that are not lower than it, then is appended, and pairs at
+# the front older than the window are dropped. The lowest price in the window is
+# then always at the front, and each price is added and removed at most once. The
+# deques are filled from the database when the scheduler starts and updated with
+# every new price. The window length can be set per asset type.
+
+from collections import deque
+import datetime
+
+import db
+
+# Default number of days in the window of each asset type
+DEFAULT_WINDOW_DAYS = 14
+
+# Define RollingMinimum class holding the prices of one item inside the window
+class RollingMinimum:
+
+    # Create an empty window of the given length in seconds
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._prices = deque()
+
+    # Define function to drop the prices that are older than the window at a time
+    def expire(self, now):
+        start = now - self.window_seconds
+        while self._prices and self._prices[0][0] < start:
+            self._prices.popleft()
+
+    # Define minimum method to return the lowest price in the window ending at a
+    # time, or None if there are no prices in it
+    def minimum(self, now):
+        self.expire(now)
+        return self._prices[0][1] if self._prices else None
+
+    # Define push method to add a price. Prices must be added oldest first
+    def push(self, timestamp, price):
+        while self._prices and self._prices[-1][1] >= price:
+            self._prices.pop()
+        self._prices.append((timestamp, price))
+        self.expire(timestamp)
+
+# Define LowTracker class holding a rolling minimum for every tracked item
+class LowTracker:
+
+    # Create the tracker. window_days maps asset types to the number of days in
+    # their window; asset types that are not given use DEFAULT_WINDOW_DAYS
+    def __init__(self, window_days=None):
+        window_days = window_days or {}
+        self.window_seconds = {asset_type: int(window_days.get(asset_type, DEFAULT_WINDOW_DAYS) * 86400)
+                               for asset_type in db.ASSET_TYPES}
+        self._windows = {}
+
+    # Define function to return the rolling minimum of an item, creating it if needed
+    def _window(self, asset_type, name):
+        key = (asset_type, name)
+        if key not in self._windows:
+            self._windows[key] = RollingMinimum(self.window_seconds[asset_type])
+        return self._windows[key]
+
+    # Define load method to fill the windows with the prices in the database that
+    # are inside each asset type's window at a time (now by default). A price that
+    # held for several updates is pushed at the last time it was seen
+    def load(self, con, now=None):
+        now = db.to_epoch(datetime.datetime.now() if now is None else now)
+        for asset_type, seconds in self.window_seconds.items():
+            rows = con.execute(
+                '''SELECT assets.name, prices.last_seen, prices.price
+                   FROM assets JOIN prices USING (asset_id)
+                   WHERE assets.asset_type = ? AND prices.last_seen >= ?
+                   ORDER BY prices.asset_id, prices.timestamp;''',
+                (asset_type, now - seconds))
+            for name, timestamp, price in rows:
+                self._window(asset_type, name).push(timestamp, price)
+        return self
+
+    # Define lowest method to return the lowest price of an item in its window
+    # ending at a time, or None if it has no prices in the window
+    def lowest(self, asset_type, name, now):
+        asset_type = db.asset_type_for(asset_type)
+        window = self._windows.get((asset_type, name))
+        return None if window is None else window.minimum(db.to_epoch(now))
+
+    # Define update method to add a new price of an item and return True if it is
+    # lower than every earlier price in the item's window. An item's first price
+    # is not a new low, since there is nothing to compare it with
+    def update(self, asset_type, name, price, timestamp):
+        asset_type = db.asset_type_for(asset_type)
+        timestamp = db.to_epoch(timestamp)
+        price = db.to_price(price)
+        window = self._window(asset_type, name)
+        lowest = window.minimum(timestamp)
+        window.push(timestamp, price)
+        return lowest is not None and price < lowest
@@ -8,86 +8,100 @@
 # uses Selenium with a headless Chrome browser for web scraping, and it is designed to run 
 # periodically to ensure the database has accurate and up to date pricing.
 
-import requests
-from bs4 import BeautifulSoup
-from lxml import etree as et
 import datetime
 import json
+import threading
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-
-import yfinance as yf
 from pycoingecko import CoinGeckoAPI
 
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
+import alerts
+import browser_pool
 import db
-import sqlite3
-
-# Set Chrome options to run headless to avoid opening GUI
-chrome_options = Options()
-chrome_options.add_argument("--headless") 
-
-# Define function to access and return prices for a list of amazon links
+import fetch_cache
+import price_extractors
+import price_fetching
+import price_lows
+import quote_providers
+
+# Pool of headless Chrome browsers kept open between updates, created the first
+# time an Amazon page is loaded
+amazon_browsers = None
+
+# Define function to return the browser pool, starting it the first time
+def get_browser_pool():
+    global amazon_browsers
+    if amazon_browsers is None:
+        amazon_browsers = browser_pool.BrowserPool(size=2, max_pages=50)
+    return amazon_browsers
+
+# Define function to quit the browsers of the pool, called when the scheduler stops
+def close_browser_pool():
+    global amazon_browsers
+    if amazon_browsers is not None:
+        amazon_browsers.close()
+        amazon_browsers = None
+
+# Extractor reading the product name and price out of Amazon pages. The streaming
+# lxml extractor stops parsing once it has them; any extractor of price_extractors
+# can be used instead
+amazon_extractor = price_extractors.StreamingExtractor()
+
+# Define function to find the name and Decimal price of the product in an Amazon page
+def parse_amazon_page(page_content, extractor=None):
+    return (extractor or amazon_extractor).extract(page_content)
+
+# Define function to access and return the product name and price at an amazon link
+# with a browser from the pool
+def return_amazon_price(url):
+    return get_browser_pool().fetch(url, parse_amazon_page)
+
+# Define function to access and return prices for a list of amazon links, loading
+# the pages in parallel with the browsers of the pool
 def return_price(amazon_url_list):
     
-    # Initialize webdriver using ChromeDriverManager
-    driver = webdriver.Chrome(ChromeDriverManager().install(), options=chrome_options)  
-    
     # Create empty return list
     return_list = []
 
-    # Loop through each url, extract price, and append it to the return list
-    for url in amazon_url_list:
-        driver.get(url)
-        
-        # Extract the HTML page source
-        page_content = driver.page_source
-        
-        # Parse page content using BeautifulSoup
-        soup = BeautifulSoup(page_content, 'html.parser')
-    
-        # Use the class and id elements to find the name and price of the product at the url
-        price_int = soup.find('span', class_="a-price-whole")
-        price_decimal = soup.find('span', class_='a-price-fraction')
-        price_total = price_int.get_text() + price_decimal.get_text()
-        product_name = soup.find(id = 'productTitle').get_text().strip()
-
-        # Append name and price information to return list
-        return_list.append((product_name, price_total))
-        
-    
-    # Close the browser
-    driver.quit()
+    # Append the name and price of each page to the return list, skipping pages
+    # that could not be loaded or read
+    for url, result in zip(amazon_url_list,
+                           get_browser_pool().fetch_many(amazon_url_list, parse_amazon_page)):
+        if isinstance(result, Exception):
+            print(f"Could not get amazon price for {url}: {result!r}")
+        else:
+            return_list.append(result)
 
     # Return the list of product names and prices
     return return_list
 
-# Define function to get the stock pricesof a list of stocks using the yfinance package
-def return_stock_prices(stock_tickers):
+# Provider of stock quotes: every tracked ticker is requested from Yahoo Finance in
+# one call. The answers are reused by price_cache below under the 'stock' time to
+# live, so they are not cached here as well
+quote_provider = quote_providers.YahooQuoteProvider()
 
-    # Define an empty return list 
-    return_list = []
+# Define function to get the stock prices of a list of stocks with one request to
+# the quote provider
+def return_stock_prices(stock_tickers, provider=None):
+    quotes = (provider or quote_provider).quotes(stock_tickers)
 
-    # Loop through stock tickers and append each ticker and price to the return list
-    for ticker in stock_tickers:
-        stock = yf.Ticker(ticker)
-        current_price = stock.history(period='1d')['Close'].iloc[0]
-        return_list.append((ticker, round(current_price, 2)))
+    # Return a list of each ticker and price, skipping tickers without a quote
+    missing = [ticker for ticker in stock_tickers if ticker not in quotes]
+    if missing:
+        print(f"No stock quote for {missing}")
+    return [(ticker, round(quotes[ticker], 2)) for ticker in stock_tickers if ticker in quotes]
 
-    # Return the list of all stock tickers and prices
-    return return_list
+# Session for CoinGecko requests that asks whether the prices changed since the
+# last answer, so an unchanged price map is not downloaded again
+coingecko_session = fetch_cache.ConditionalSession()
 
 # Define function to get cryptocurrency prices using the CoinGecko API
-def return_crypto_prices(crypto_currency):
+def return_crypto_prices(crypto_currency, timeout=15, session=None):
 
     # Set desired currency to USD and get prices of the specified cryptocurrencies
     currency = 'usd'
     cg_client = CoinGeckoAPI()
+    cg_client.request_timeout = timeout
+    cg_client.session = session or coingecko_session
     prices = cg_client.get_price(ids = crypto_currency, vs_currencies = currency)
 
     # Define empty return list
@@ -114,112 +128,159 @@ amazon_item_list = data['amazon_items']
 stock_tickers = data['stocks']
 cryptos = data['cryptocurrencies']
 
-# Define function to update prices in the database and send email alerts if prices hit new lows
-def update_prices():
-
-    # Create connection object to database and record current time
-    con = sqlite3.connect('prices.db')
+# Number of days over which a new low price is checked for each asset type
+# ('amazon', 'stock', 'crypto'), two weeks unless set in the JSON file
+low_window_days = data.get('low_window_days', {})
+
+# Cache of the answers of every source, reused for the seconds set per source in
+# the JSON file, or fetch_cache.DEFAULT_TTLS
+price_cache = fetch_cache.FetchCache(data.get('cache_ttl_seconds'))
+
+# Whether a price equal to an item's last recorded price only extends that record
+# instead of adding a row to the database, on unless turned off in the JSON file
+skip_unchanged_prices = data.get('skip_unchanged_prices', True)
+
+# Define function to return a list without repeated items, keeping their order.
+# A comma separated string, as cryptocurrencies may be given, is split first
+def unique(items):
+    if isinstance(items, str):
+        items = [item.strip() for item in items.split(',')]
+    return [item for item in dict.fromkeys(items) if item]
+
+# Fetcher running the price lookups of every update concurrently. It is kept for
+# the life of the process so fetcher.metrics() covers every update
+fetcher = price_fetching.Fetcher()
+
+# Define function to get the prices of every tracked amazon item, stock and
+# cryptocurrency at the same time. Repeated urls, tickers and coins are looked up
+# once, and answers still fresh in the cache are not looked up again. The lookup
+# functions, the stock quote provider and the cache can be replaced, e.g. with
+# fakes for testing offline. Lookups that still fail after their retries are
+# printed and left out. Returns the amazon, stock and crypto lists of (name, price)
+def fetch_prices(fetcher=fetcher, amazon_urls=None, tickers=None, crypto_ids=None,
+                 amazon_lookup=None, quote_provider=None, crypto_lookup=None,
+                 cache=price_cache):
+    amazon_urls = unique(amazon_item_list if amazon_urls is None else amazon_urls)
+    tickers = unique(stock_tickers if tickers is None else tickers)
+    crypto_ids = unique(cryptos if crypto_ids is None else crypto_ids)
+    amazon_lookup = amazon_lookup or return_amazon_price
+    crypto_lookup = crypto_lookup or return_crypto_prices
+
+    # Make one job per amazon page, loaded by the browsers of the pool, one job for
+    # all stock tickers, and one job for all cryptocurrencies, which CoinGecko
+    # returns at once
+    jobs = [('amazon', url, lambda url=url: amazon_lookup(url)) for url in amazon_urls]
+    if tickers:
+        jobs.append(('stock', tuple(tickers), lambda: return_stock_prices(tickers, quote_provider)))
+    if crypto_ids:
+        jobs.append(('crypto', tuple(crypto_ids), lambda: crypto_lookup(crypto_ids)))
+
+    # Use the cached answers that are still fresh and look up the rest
+    results = {}
+    for source, key, _ in jobs:
+        answer = cache.get(source, key) if cache is not None else None
+        if answer is not None:
+            results[(source, key)] = answer
+    fetched, errors = fetcher.fetch_sync(job for job in jobs if job[:2] not in results)
+    for (source, key), answer in fetched.items():
+        if cache is not None:
+            cache.put(source, key, answer)
+    results.update(fetched)
+
+    for (source, key), error in errors.items():
+        print(f"Could not get {source} price for {key}: {error!r}")
+    amazon_list = [results[('amazon', url)] for url in amazon_urls if ('amazon', url) in results]
+    return (amazon_list, results.get(('stock', tuple(tickers)), []),
+            results.get(('crypto', tuple(crypto_ids)), []))
+
+# Rolling minimum prices of every tracked item, filled from the database the
+# first time update_prices() runs in this process
+low_tracker = None
+low_tracker_lock = threading.Lock()
+
+# Define function to return the rolling minimum tracker, loading it from the
+# database the first time it is needed. The updates of different sources run in
+# different threads, so only the first of them loads it
+def get_low_tracker(con):
+    global low_tracker
+    with low_tracker_lock:
+        if low_tracker is None:
+            low_tracker = price_lows.LowTracker(low_window_days).load(con)
+    return low_tracker
+
+# Queue sending the low price emails from a background thread, created the first
+# time an item reaches a new low. The mail server and addresses are set in the
+# "email" section of the JSON file or with PRICE_ALERT_* environment variables,
+# and the password with PRICE_ALERT_SMTP_PASSWORD. Without a recipient the alerts
+# are printed instead
+alert_queue = None
+alert_queue_lock = threading.Lock()
+
+# Define function to return the alert queue, creating it the first time
+def get_alert_queue():
+    global alert_queue
+    with alert_queue_lock:
+        if alert_queue is None:
+            settings = data.get('alerts', {})
+            alert_queue = alerts.AlertQueue(
+                alerts.make_sender(alerts.mail_settings(data.get('email'))),
+                cooldown=settings.get('cooldown_hours', 6) * 3600,
+                min_drop=settings.get('min_drop', 0.01),
+                digest_seconds=settings.get('digest_seconds', 60))
+    return alert_queue
+
+# Define function to send the waiting alerts and close the mail connection, called
+# when the scheduler stops
+def close_alert_queue():
+    global alert_queue
+    with alert_queue_lock:
+        queue, alert_queue = alert_queue, None
+    if queue is not None:
+        queue.close()
+
+# Define function to close the database connections that update_prices() kept open
+# in every job thread, called when the scheduler stops
+def close_database():
+    db.close_connections(all_threads=True)
+
+# Sources that update_prices() updates unless told otherwise
+SOURCES = ('amazon', 'stock', 'crypto')
+
+# Define function to update prices in the database and send email alerts if prices
+# hit new lows. sources limits the update to some of 'amazon', 'stock' and 'crypto',
+# so the scheduler can update each on its own interval
+def update_prices(sources=SOURCES):
+
+    # Get the database connection kept open between runs and record current time
+    con = db.get_connection()
     current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    # Get current prices for amazon items, stocks, and cryptocurrencies
-    amazon_list = return_price(amazon_item_list)
-    stock_list = return_stock_prices(stock_tickers)
-    crypto_list = return_crypto_prices(cryptos)
-
-    # Define empty list of items at new price lows
+    # Get current prices for amazon items, stocks, and cryptocurrencies, looking
+    # them all up at the same time
+    amazon_list, stock_list, crypto_list = fetch_prices(
+        amazon_urls=None if 'amazon' in sources else [],
+        tickers=None if 'stock' in sources else [],
+        crypto_ids=None if 'crypto' in sources else [])
+
+    # Load the rolling minimums before the new prices are in the database
+    tracker = get_low_tracker(con)
+
+    # Insert the amazon item, stock, and cryptocurrency prices into the database,
+    # one transaction per table, extending the last record of unchanged prices
+    for asset_type, price_list in (("stock", stock_list), ("amazon", amazon_list),
+                                   ("crypto", crypto_list)):
+        db.insert_prices(con, asset_type, [(name, price, current_time) for name, price in price_list],
+                         skip_unchanged=skip_unchanged_prices)
+
+    # Add the new prices to the rolling minimums, append items at new low prices
+    # to the low price list and queue an alert about them
     low_price_list = []
-
-    # Insert amazon item, stock, and cryptocurrency prices into the database and append items 
-    # at new low prices to the low price list
-    for stock in stock_list:
-        db.insert_stock(con, stock[0], stock[1], current_time)
-        if float(stock[1]) < check_lowest_price(con, stock[0], "stocks", "stock_symbol"):
-            low_price_list.append(stock[0])
-            
-    for item in amazon_list:
-        db.insert_amazon_item(con, item[0], item[1], current_time)
-        if float(item[1].replace(',', ''))  < check_lowest_price(con, item[0], "amazon_items", "item_name"):
-            low_price_list.append(item[0])
-            
-    for crypto in crypto_list:
-        db.insert_cryptocurrency(con, crypto[0], crypto[1], current_time)
-        if float(crypto[1]) < check_lowest_price(con, crypto[0], "cryptocurrencies", "crypto_name"):
-            low_price_list.append(crypto[0])
-
-    # Close connection object
-    con.close()
-
-    # Send myself an email about items at their lowest price in the last two weeks
-    subject = "Low Price"
-    body = f"The prices of {low_price_list} are at their lowest in the last two weeks"
-    to_email = "shaurya.jeloka@gmail.com"
-    from_email = "shaurya.jeloka@gmail.com"
-    password = "ngwtpvqaqctoxdzq" 
-    send_email(subject, body, to_email, from_email, password)
+    for asset_type, price_list in (("stock", stock_list), ("amazon", amazon_list),
+                                   ("crypto", crypto_list)):
+        days = tracker.window_seconds[asset_type] / 86400
+        for name, price in price_list:
+            if tracker.update(asset_type, name, price, current_time):
+                low_price_list.append(name)
+                get_alert_queue().add(asset_type, name, price, f"lowest price in {days:g} days")
 
     return low_price_list
-
-# Define function to check the lowest price of an item in the last 
-# two weeks from the database
-def check_lowest_price(con, item, table, column):
-
-    # Create cursor from connection object
-    cursor = con.cursor()
-
-    # Define SQL query to check the lowest price in the last 14 days 
-    # for a given item
-    query = f'''
-    SELECT MIN(price) AS lowest_price
-    FROM {table}
-    WHERE {column} = ?
-    AND timestamp >= datetime('now', '-14 days');
-    '''
-
-    # Execute the query with the item as the parameter and store the result
-    cursor.execute(query, (item,))
-    result = cursor.fetchone()
-
-    # Close the cursor
-    cursor.close()
-
-    # Return the lowest price as a float
-    if isinstance(result[0], float):
-        return result[0]
-    else:
-        return float(result[0].replace(',', ''))
-
-# Define function to send email notifications to users
-def send_email(subject, body, to_email, from_email, password):
-    try:
-        # Begin creating the email
-        msg = MIMEMultipart()
-        msg['From'] = from_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        # Attach the email's main body
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Setup the SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-
-        # Login to the server
-        server.login(from_email, password)
-
-        # Send the email and quit the server
-        server.send_message(msg)
-        server.quit()
-
-        print("Email sent successfully!")
-
-    # In case of an authentication error when logging in, print the 
-    # authentication error
-    except smtplib.SMTPAuthenticationError as e:
-        print("SMTPAuthenticationError: Unable to log in. Check your \
-              email and password.")
-        print(f"Error details: {e}")
-
-    # Print any other general errors
-    except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
@@ -0,0 +1,55 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program gets stock quotes for every tracked ticker with one request instead
+# of one history download per ticker. A quote provider is any object with a quotes()
+# method that takes a list of tickers and returns a dictionary of ticker to price.
+# YahooQuoteProvider asks Yahoo Finance for all tickers in one yfinance download,
+# and FakeQuoteProvider returns fixed prices for testing without a network.
+
+# Define YahooQuoteProvider class that downloads the latest close of many tickers
+# from Yahoo Finance in one request
+class YahooQuoteProvider:
+
+    def __init__(self, timeout=15):
+        self.timeout = timeout
+        self.requests = 0
+
+    # Define quotes method to return the latest price of each ticker. Tickers Yahoo
+    # has no price for are left out
+    def quotes(self, tickers):
+        import yfinance as yf
+
+        tickers = list(tickers)
+        if not tickers:
+            return {}
+        self.requests += 1
+        history = yf.download(tickers, period='1d', group_by='column', progress=False,
+                              threads=False, timeout=self.timeout)
+        closes = history['Close']
+
+        # A single ticker may come back as a Series instead of a one column dataframe
+        if not hasattr(closes, 'columns'):
+            closes = closes.to_frame(tickers[0])
+        prices = {}
+        for ticker in tickers:
+            if ticker in closes.columns:
+                column = closes[ticker].dropna()
+                if len(column):
+                    prices[ticker] = float(column.iloc[-1])
+        return prices
+
+# Define FakeQuoteProvider class that returns given prices, for tests
+class FakeQuoteProvider:
+
+    # prices maps tickers to prices, or is a function of the ticker
+    def __init__(self, prices):
+        self.prices = prices
+        self.requests = 0
+
+    # Define quotes method to return the fake price of each known ticker
+    def quotes(self, tickers):
+        self.requests += 1
+        if callable(self.prices):
+            return {ticker: self.prices(ticker) for ticker in tickers}
+        return {ticker: self.prices[ticker] for ticker in tickers if ticker in self.prices}
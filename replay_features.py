@@ -0,0 +1,137 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This program replays every game in games.csv with python-chess and extracts
+# features of each game: the material left on the board at the end, the number of
+# checks and captures, the ply on which each side castled, and whether (and where)
+# a move could not be parsed. The games are replayed with the SAN replay of
+# game_replay.py and split into chunks for a pool of worker processes the same
+# way game_replay.py does, progress and throughput in games per second are
+# printed as chunks finish, and the features are written as a columnar .npz file
+# (or a .csv file) with one row per game that can be joined to games.csv on 'id'.
+#
+# Example: python replay_features.py games.csv -o game_features.npz --workers 8
+
+import argparse
+import os
+import time
+
+import chess
+import numpy as np
+import pandas as pd
+
+import game_replay
+import games_cache
+
+# Number of games sent to a worker process at a time
+CHUNK_SIZE = game_replay.CHUNK_SIZE
+
+# Value of each piece type when counting material
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5,
+                chess.QUEEN: 9}
+
+# Integer feature columns produced for each game, in output order
+FEATURE_COLUMNS = ['plies_replayed', 'white_material', 'black_material',
+                   'material_balance', 'checks', 'captures', 'white_castle_ply',
+                   'black_castle_ply', 'illegal_ply']
+
+# Define function to replay one game and return its integer features and the error
+# message of the first move that could not be parsed (or an empty string)
+def game_features(moves):
+    counts = {'checks': 0, 'captures': 0}
+    castle_ply = {chess.WHITE: -1, chess.BLACK: -1}
+
+    # Record captures and castling before each move is made, checks after
+    def before(board, move, ply):
+        if board.is_capture(move):
+            counts['captures'] += 1
+        if board.is_castling(move) and castle_ply[board.turn] < 0:
+            castle_ply[board.turn] = ply
+
+    def after(board, move, ply):
+        if board.is_check():
+            counts['checks'] += 1
+
+    board, illegal_ply, error = game_replay.replay_san(moves, before, after)
+
+    # Count the material each side has left on the board
+    material = {color: sum(len(board.pieces(piece, color)) * value
+                           for piece, value in PIECE_VALUES.items())
+                for color in (chess.WHITE, chess.BLACK)}
+    features = [len(board.move_stack), material[chess.WHITE], material[chess.BLACK],
+                material[chess.WHITE] - material[chess.BLACK], counts['checks'],
+                counts['captures'], castle_ply[chess.WHITE], castle_ply[chess.BLACK],
+                -1 if illegal_ply is None else illegal_ply]
+    return features, error or ''
+
+# Define function to extract features for one chunk of games, run in a worker process
+def features_chunk(moves_list):
+    return [game_features(moves) for moves in moves_list]
+
+# Define function to extract the features of every game in parallel. report is
+# called with (games done, total games, seconds elapsed) after each chunk
+def extract_features(game_ids, moves_list, workers=None, chunk_size=CHUNK_SIZE,
+                     report=None):
+    rows = game_replay.map_chunks(features_chunk, moves_list, workers=workers,
+                                  chunk_size=chunk_size, report=report)
+    values = np.array([features for features, _ in rows], dtype=np.int32).reshape(
+        len(rows), len(FEATURE_COLUMNS))
+    errors = [error for _, error in rows]
+
+    features_df = pd.DataFrame(values, columns=FEATURE_COLUMNS)
+    features_df.insert(0, 'id', list(game_ids))
+    features_df['error'] = errors
+    return features_df
+
+# Define function to write the features as a columnar .npz file, or as csv when
+# the path ends in .csv
+def write_features(features_df, path):
+    if path.endswith('.csv'):
+        features_df.to_csv(path, index=False)
+    else:
+        np.savez(path, **{name: features_df[name].to_numpy(dtype=str)
+                          if features_df[name].dtype.kind not in 'iub'
+                          else features_df[name].to_numpy()
+                          for name in features_df.columns})
+
+# Define load_features function to read a file written by write_features() back
+# into a dataframe, ready to merge with games_df on 'id'
+def load_features(path):
+    if path.endswith('.csv'):
+        return pd.read_csv(path, keep_default_na=False)
+    with np.load(path) as data:
+        return pd.DataFrame({name: data[name] for name in data.files})
+
+# Define function to print progress and throughput for the command line
+def print_progress(done, total, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f'{done}/{total} games replayed, {elapsed:.1f} s, {rate:.0f} games/sec',
+          flush=True)
+
+# Define main function to parse command line arguments and run the pipeline
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay every game and extract per-game features')
+    parser.add_argument('csv_path', nargs='?', default='games.csv')
+    parser.add_argument('-o', '--output', default='game_features.npz')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    # Read the ids and moves through the columnar cache of the csv
+    cache = games_cache.open_cache(args.csv_path)
+    game_ids = cache.series('id').tolist()
+    moves_list = cache.series('moves').tolist()
+
+    started = time.perf_counter()
+    features_df = extract_features(game_ids, moves_list, workers=args.workers,
+                                   chunk_size=args.chunk_size, report=print_progress)
+    elapsed = time.perf_counter() - started
+    write_features(features_df, args.output)
+
+    unparsed = (features_df['illegal_ply'] >= 0).sum()
+    print(f'Replayed {len(features_df)} games with {args.workers} workers in {elapsed:.1f} s '
+          f'({len(features_df) / elapsed:.0f} games/sec), {unparsed} with unparseable moves. '
+          f'Features written to {args.output}')
+
+if __name__ == '__main__':
+    main()
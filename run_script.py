@@ -2,28 +2,52 @@
 # 6/9/2024
 
 # This program is a script that runs the update_prices() function defined in price_tracker_functions.py
-# every ten minutes to get the prices of all items being tracked from the internet and update
-# the databse. This program is meant to run continuously in the background to collect data 
-# at a frequent yet reasonable rate.
+# on a schedule to get the prices of all items being tracked from the internet and update
+# the databse. Each source has its own interval: cryptocurrencies every minute, stocks every
+# five minutes while the market is open, and Amazon items every hour. The intervals can be
+# changed with "schedule_seconds" in trackitems.json. This program is meant to run continuously
+# in the background to collect data at a frequent yet reasonable rate.
+
+import asyncio
+import functools
 
-import schedule
-import time
 import price_tracker_functions as functions
+import scheduler
+
+# Seconds between the updates of each source, and the most each update is delayed
+# at random so the requests do not always go out on the same second
+INTERVALS = {'crypto': 60, 'stock': 300, 'amazon': 3600}
+JITTER = {'crypto': 5, 'stock': 15, 'amazon': 120}
 
-# Schedule the update_prices function to run every ten minutes
-schedule.every(10).minutes.do(functions.update_prices)
+# Define function to make the scheduler with one job per source
+def make_scheduler(intervals=None):
+    intervals = {**INTERVALS, **(intervals or {})}
+    price_scheduler = scheduler.Scheduler()
+    for source in functions.SOURCES:
+        price_scheduler.add(source, functools.partial(functions.update_prices, (source,)),
+                            intervals[source], jitter=JITTER[source],
+                            active=scheduler.market_hours if source == 'stock' else None)
+    return price_scheduler
 
 # Define the function to run the scheduled loop
 def run_schedule():
+    price_scheduler = make_scheduler(functions.data.get('schedule_seconds'))
 
-    #run a continuous loop
-    while True:
-        
-        # Check and run pending tasks
-        schedule.run_pending() 
-
-        #briefly pause the loop to avoid busy waiting
-        time.sleep(1)
+    #run the jobs until the script is stopped. When it stops, wait for the updates
+    #still running in the job threads, then send the waiting alerts, close the
+    #browsers and the database connections the job threads kept open between
+    #updates and print the run times
+    try:
+        asyncio.run(price_scheduler.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        price_scheduler.shutdown()
+        functions.close_alert_queue()
+        functions.close_browser_pool()
+        functions.close_database()
+        for source, metrics in price_scheduler.metrics().items():
+            print(source, metrics)
 
 #execute run_schedule function
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+# Shaurya Jeloka, Akshay Vakharia, Ian Jeong
+# 6/9/2024
+
+# This program runs the price updates of run_script.py on a schedule with asyncio.
+# Every job has its own interval and runs at fixed times counted from when the
+# scheduler started, so a slow run does not push later runs back: the next run is
+# at the next of those times, and the times missed while a run was still going are
+# skipped rather than run back to back. A job never runs twice at once, and
+# blocking jobs run in a thread of their own. A random delay of up to a job's
+# jitter spreads the runs out, a failed run is retried after a delay that doubles
+# with every failure in a row, and a job can be limited to certain times, e.g. stock
+# updates to market hours. The start lag and duration of every run are recorded.
+# The clock and sleep functions can be replaced with a FakeClock for testing.
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import heapq
+import itertools
+import math
+import random
+import statistics
+import time
+from zoneinfo import ZoneInfo
+
+# Time zone and opening hours of the New York Stock Exchange
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
+
+# Define function to return whether the stock market is open at a time, on weekdays
+# between 9:30 and 16:00 New York time. Holidays are not taken into account. A
+# time without a time zone is taken as local time
+def market_hours(now):
+    now = now.astimezone(MARKET_TIMEZONE)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+# Define function to return the mean, median, 95th percentile and maximum of values
+def percentiles(values, prefix):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {f'{prefix}_mean_s': statistics.fmean(values),
+            f'{prefix}_p50_s': values[len(values) // 2],
+            f'{prefix}_p95_s': values[min(len(values) - 1, int(len(values) * 0.95))],
+            f'{prefix}_max_s': values[-1]}
+
+# Define JobStats class counting the runs of a job and keeping the durations and
+# start lags of its most recent runs
+class JobStats:
+
+    def __init__(self, history=1000):
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.inactive = 0
+        self.last_error = None
+        self.durations = deque(maxlen=history)
+        self.lags = deque(maxlen=history)
+
+    # Define summary method to return the counts and the duration and lag percentiles
+    def summary(self):
+        summary = {'runs': self.runs, 'failures': self.failures, 'skipped': self.skipped,
+                   'inactive': self.inactive, 'last_error': self.last_error}
+        summary.update(percentiles(self.durations, 'duration'))
+        summary.update(percentiles(self.lags, 'lag'))
+        return summary
+
+# Define Job class holding what runs and when
+class Job:
+
+    # function takes no arguments and may be a coroutine function. interval, jitter,
+    # retry and max_retry are in seconds; retries wait retry seconds, doubled for
+    # every further failure in a row, at most max_retry (the interval by default).
+    # active is a function of the current datetime that says whether the job runs
+    def __init__(self, name, function, interval, jitter=0.0, retry=30.0, max_retry=None,
+                 active=None):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.retry = retry
+        self.max_retry = interval if max_retry is None else max_retry
+        self.active = active
+        self.stats = JobStats()
+        self.next_run = None
+
+# Define Scheduler class that runs jobs at their intervals
+class Scheduler:
+
+    # clock returns the time in seconds and sleep waits a number of seconds; now
+    # returns the current datetime for the jobs' active functions. All three and
+    # the random number generator can be replaced in tests
+    def __init__(self, clock=time.monotonic, sleep=asyncio.sleep,
+                 now=datetime.datetime.now, rng=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.now = now
+        self.rng = rng or random.Random()
+        self.jobs = {}
+        self._tasks = []
+        self._executors = []
+
+    # Define add method to add a job, taking the same arguments as Job. Returns the job
+    def add(self, name, function, interval, **options):
+        if name in self.jobs:
+            raise ValueError(f'there is already a job named {name!r}')
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        job = self.jobs[name] = Job(name, function, interval, **options)
+        return job
+
+    # Define function to call a job's function once, in the job's own thread if it
+    # is not a coroutine function
+    async def _call(self, job, executor):
+        if asyncio.iscoroutinefunction(job.function):
+            await job.function()
+        else:
+            await asyncio.get_running_loop().run_in_executor(executor, job.function)
+
+    # Define function to run one job forever. The k-th run is due interval * k
+    # seconds after start, plus jitter
+    async def _run_job(self, job, start):
+        stats = job.stats
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'job-{job.name}')
+        self._executors.append(executor)
+        slot = 0
+        due = start
+        failures = 0
+        try:
+            while True:
+                planned = due + self.rng.uniform(0, job.jitter)
+                job.next_run = planned
+                if planned > self.clock():
+                    await self.sleep(planned - self.clock())
+
+                if job.active is None or job.active(self.now()):
+                    started = self.clock()
+                    stats.lags.append(max(0.0, started - planned))
+                    try:
+                        await self._call(job, executor)
+                        failures = 0
+                    except Exception as e:
+                        failures += 1
+                        stats.failures += 1
+                        stats.last_error = repr(e)
+                    stats.runs += 1
+                    stats.durations.append(self.clock() - started)
+                else:
+                    stats.inactive += 1
+
+                # Retry a failed run after the backoff delay, otherwise wait for the
+                # next due time that has not passed, counting the ones skipped
+                if failures:
+                    due = self.clock() + min(job.retry * 2 ** (failures - 1), job.max_retry)
+                    continue
+                next_slot = max(slot + 1, math.floor((self.clock() - start) / job.interval) + 1)
+                stats.skipped += next_slot - slot - 1
+                slot = next_slot
+                due = start + slot * job.interval
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Define run method to run every job until stop() is called
+    async def run(self):
+        start = self.clock()
+        self._tasks = [asyncio.create_task(self._run_job(job, start), name=f'job-{job.name}')
+                       for job in self.jobs.values()]
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    # Define stop method to stop every job. A run going on in a thread finishes
+    # in the background, shutdown() waits for it
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    # Define shutdown method to wait for the runs still going on in the jobs'
+    # threads once the scheduler has stopped, so what they use can be closed
+    def shutdown(self):
+        executors, self._executors = self._executors, []
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # Define metrics method to return the statistics of every job and the seconds
+    # until its next run
+    def metrics(self):
+        metrics = {}
+        for name, job in self.jobs.items():
+            metrics[name] = job.stats.summary()
+            if job.next_run is not None:
+                metrics[name]['next_run_in_s'] = max(0.0, job.next_run - self.clock())
+        return metrics
+
+# Define FakeClock class whose time only moves when advance() is called, for
+# testing the scheduler without waiting
+class FakeClock:
+
+    def __init__(self, start=datetime.datetime(2024, 6, 10, 9, 0, tzinfo=MARKET_TIMEZONE)):
+        self.start = start
+        self.seconds = 0.0
+        self._sleepers = []
+        self._order = itertools.count()
+
+    # Define time method to return the fake time in seconds
+    def time(self):
+        return self.seconds
+
+    # Define now method to return the fake time as a datetime
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.seconds)
+
+    # Define sleep method to wait until the fake time has moved on by delay seconds
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.seconds + max(0.0, delay), next(self._order), future))
+        await future
+
+    # Define advance method to move the fake time on by seconds, waking the
+    # sleepers in order. Before moving on, it waits until waiting tasks (e.g. one
+    # per job) are asleep, so every task has finished what it does at a time
+    async def advance(self, seconds, waiting=1):
+        end = self.seconds + seconds
+        while True:
+            while sum(not future.done() for _, _, future in self._sleepers) < waiting:
+                await asyncio.sleep(0)
+            while self._sleepers and self._sleepers[0][2].done():
+                heapq.heappop(self._sleepers)
+            if self._sleepers[0][0] > end:
+                self.seconds = end
+                return
+            wake, _, future = heapq.heappop(self._sleepers)
+            self.seconds = max(self.seconds, wake)
+            if not future.done():
+                future.set_result(None)
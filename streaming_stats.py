@@ -0,0 +1,256 @@
+# Shaurya Jeloka, Ian Jeong, Akshay Vakharia
+# 1/25/2024
+
+# This file computes the same tables as chess_analytics.py (win_rates_df,
+# turns_win_rates, opening frequencies and opening_stats, and the getwinners
+# percentages) over game exports that are too large to load into memory, such as
+# multi-million game Lichess exports in csv or PGN format. The file is read in
+# chunks and each chunk only updates running counts in a GameAggregates object,
+# so memory stays bounded by the chunk size and the number of distinct openings.
+# Aggregates built from different files or from separate worker processes can be
+# merged, and on a small file the results are identical to the in-memory path.
+#
+# Example: python streaming_stats.py lichess_db_standard_rated_2024-01.pgn.bz2
+
+import argparse
+import bz2
+from collections import Counter
+import gzip
+import re
+
+import numpy as np
+import pandas as pd
+
+from chess_analytics import (OUTCOMES, rating_bins, bucket_labels, bucket_codes,
+                             bucket_rate_frame, outcome_codes, rank_openings,
+                             turn_bins, turn_labels)
+
+# Number of games read per chunk by default
+CHUNK_SIZE = 100_000
+
+# Columns of games.csv that the aggregates need
+STREAM_COLUMNS = ['white_rating', 'black_rating', 'winner', 'turns', 'opening_name']
+
+# Rating comparisons tracked for getwinners()
+RATING_COMPARISONS = [('white_rating', 'black_rating'), ('black_rating', 'white_rating')]
+
+# Define GameAggregates class holding mergeable running counts for every table
+class GameAggregates:
+
+    # Start with empty counts. rating_bins sets the buckets of win_rates_df
+    def __init__(self, rating_bins=rating_bins):
+        self.rating_bins = list(rating_bins)
+        self.games = 0
+        self.rating_tallies = np.zeros((len(self.rating_bins) - 1, 3), dtype=np.int64)
+        self.rating_totals = np.zeros(len(self.rating_bins) - 1, dtype=np.int64)
+        self.turn_counts = Counter()
+        self.opening_totals = Counter()
+        self.opening_wins = Counter()
+        self.first_seen = {}
+        self.comparisons = Counter()
+
+    # Define update method to add one chunk of games. start_row is the row number of
+    # the chunk's first game in the whole file, used to keep tie-breaking order
+    def update(self, chunk, start_row=None):
+        start_row = self.games if start_row is None else start_row
+        rows = np.arange(start_row, start_row + len(chunk))
+        winner = chunk['winner'].to_numpy(dtype=object)
+        outcomes = outcome_codes(winner)
+        white_rating = chunk['white_rating'].to_numpy(dtype=float)
+        black_rating = chunk['black_rating'].to_numpy(dtype=float)
+
+        # Count outcomes per rating bucket of the average rating
+        buckets = bucket_codes((white_rating + black_rating) / 2, self.rating_bins)
+        in_bucket = buckets >= 0
+        counted = in_bucket & (outcomes >= 0)
+        self.rating_tallies += np.bincount(buckets[counted] * 3 + outcomes[counted],
+                                           minlength=self.rating_tallies.size
+                                           ).reshape(self.rating_tallies.shape)
+        self.rating_totals += np.bincount(buckets[in_bucket], minlength=len(self.rating_totals))
+
+        # Count winners per turn category, skipping games without a result
+        turns = bucket_codes(chunk['turns'].to_numpy(dtype=float), turn_bins)
+        counted = (turns >= 0) & pd.notna(winner)
+        self.turn_counts.update(zip(turns[counted].tolist(), winner[counted].tolist()))
+
+        # Count games and wins per opening, and remember the first row each opening
+        # appeared in and each color first won with it
+        openings = chunk['opening_name'].to_numpy(dtype=object)
+        self.opening_totals.update(pd.Series(openings).value_counts().to_dict())
+        pairs = pd.DataFrame({'opening': openings, 'winner': winner, 'row': rows})
+        grouped = pairs.groupby(['opening', 'winner'], sort=False)['row']
+        self.opening_wins.update(grouped.size().to_dict())
+        for key, row in grouped.min().items():
+            self.first_seen[key] = min(row, self.first_seen.get(key, row))
+        for opening, row in pairs.groupby('opening', sort=False)['row'].min().items():
+            self.first_seen[opening] = min(row, self.first_seen.get(opening, row))
+
+        # Count winners when one player's rating is higher than the other's
+        for r1, r2 in RATING_COMPARISONS:
+            higher = chunk[r1].to_numpy(dtype=float) > chunk[r2].to_numpy(dtype=float)
+            self.comparisons[(r1, r2)] += int(higher.sum())
+            self.comparisons.update({(r1, r2, name): count for name, count in
+                                     Counter(winner[higher].tolist()).items()})
+        self.games += len(chunk)
+
+    # Define merge method to add the counts of another GameAggregates into this one
+    def merge(self, other):
+        if other.rating_bins != self.rating_bins:
+            raise ValueError('cannot merge aggregates built with different rating bins')
+        self.games += other.games
+        self.rating_tallies += other.rating_tallies
+        self.rating_totals += other.rating_totals
+        self.turn_counts.update(other.turn_counts)
+        self.opening_totals.update(other.opening_totals)
+        self.opening_wins.update(other.opening_wins)
+        for key, row in other.first_seen.items():
+            self.first_seen[key] = min(row, self.first_seen.get(key, row))
+        self.comparisons.update(other.comparisons)
+        return self
+
+    # Define win_rates_df method to return white and black win rates and total
+    # matches for each rating group
+    def win_rates_df(self):
+        return bucket_rate_frame(self.rating_tallies, self.rating_totals,
+                                 pd.Index(bucket_labels(self.rating_bins)))
+
+    # Define turns_win_rates method to return the share of each winner for every
+    # turn category
+    def turns_win_rates(self):
+        winners = sorted({winner for _, winner in self.turn_counts})
+        counts = np.zeros((len(turn_labels), len(winners)))
+        for (category, winner), count in self.turn_counts.items():
+            counts[category, winners.index(winner)] = count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = counts / counts.sum(axis=1, keepdims=True)
+        index = pd.CategoricalIndex(turn_labels, categories=turn_labels, ordered=True,
+                                    name='turns_category')
+        return pd.DataFrame(shares, index=index,
+                            columns=pd.Index(winners, name='winner')).fillna(0)
+
+    # Define opening_frequencies method to return the number of games played with
+    # each opening, most common first
+    def opening_frequencies(self):
+        names = list(self.opening_totals)
+        counts = np.array([self.opening_totals[name] for name in names])
+        first = np.array([self.first_seen[name] for name in names])
+        order = np.lexsort((first, -counts))
+        return pd.Series(counts[order], name='count',
+                         index=pd.Index(np.array(names, dtype=object)[order],
+                                        name='opening_name'))
+
+    # Define opening_stats method to return the frequency of each opening among the
+    # color's wins and the top 10 openings sorted by win percentage
+    def opening_stats(self, color):
+        names = list(self.opening_totals)
+        wins = np.array([self.opening_wins[(name, color)] for name in names], dtype=np.int64)
+        totals = np.array([self.opening_totals[name] for name in names], dtype=np.int64)
+        first_win = np.array([self.first_seen.get((name, color), self.games)
+                              for name in names])
+        return rank_openings(names, wins, totals, first_win, self.games)
+
+    # Define getwinners method to return percentage of time that r1 is higher than
+    # r2 and winner wins the match
+    def getwinners(self, r1, r2, winner):
+        if (r1, r2) not in RATING_COMPARISONS:
+            raise ValueError(f'only {RATING_COMPARISONS} comparisons are tracked')
+        total = self.comparisons[(r1, r2)]
+        if total == 0:
+            return np.nan
+        return self.comparisons[(r1, r2, winner)] / total * 100
+
+# Define function to open a text file, decompressing .gz and .bz2 files
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+# Define function to read a games csv in chunks holding only the needed columns
+def iter_csv_chunks(path, chunksize=CHUNK_SIZE):
+    yield from pd.read_csv(path, usecols=STREAM_COLUMNS, chunksize=chunksize)
+
+# Patterns used to strip PGN movetext down to the SAN moves
+PGN_HEADER = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+PGN_COMMENT = re.compile(r'\{[^}]*\}|\([^)]*\)|;[^\n]*')
+PGN_MOVE_NUMBER = re.compile(r'\d+\.(\.\.)?')
+PGN_RESULTS = {'1-0': 'white', '0-1': 'black', '1/2-1/2': 'draw'}
+
+# Pattern of the word "rated" in an Event header, e.g. "Rated Blitz game", which
+# does not match "Unrated" or "Casual" events
+PGN_RATED = re.compile(r'\brated\b', re.IGNORECASE)
+
+# Define function to turn the headers and movetext of one PGN game into a row with
+# the same columns as games.csv
+def pgn_row(headers, movetext):
+    text = PGN_MOVE_NUMBER.sub(' ', PGN_COMMENT.sub(' ', movetext))
+    moves = [token for token in text.split()
+             if token not in PGN_RESULTS and token != '*' and not token.startswith('$')]
+    site = headers.get('Site', '')
+    return {'id': site.rsplit('/', 1)[-1],
+            'rated': PGN_RATED.search(headers.get('Event', '')) is not None,
+            'turns': len(moves),
+            'winner': PGN_RESULTS.get(headers.get('Result')),
+            'white_rating': pd.to_numeric(headers.get('WhiteElo'), errors='coerce'),
+            'black_rating': pd.to_numeric(headers.get('BlackElo'), errors='coerce'),
+            'moves': ' '.join(moves),
+            'opening_eco': headers.get('ECO'),
+            'opening_name': headers.get('Opening')}
+
+# Define function to read a PGN file (optionally .gz or .bz2 compressed) in chunks
+# of games, parsing only the headers and SAN moves
+def iter_pgn_chunks(path, chunksize=CHUNK_SIZE):
+    rows = []
+    headers = {}
+    movetext = []
+    with open_text(path) as file:
+        for line in file:
+            match = PGN_HEADER.match(line)
+            if match:
+                # A header after movetext starts the next game
+                if movetext:
+                    rows.append(pgn_row(headers, ' '.join(movetext)))
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2)
+            elif line.strip():
+                movetext.append(line.strip())
+            if len(rows) >= chunksize:
+                yield pd.DataFrame(rows)
+                rows = []
+        if headers or movetext:
+            rows.append(pgn_row(headers, ' '.join(movetext)))
+    if rows:
+        yield pd.DataFrame(rows)
+
+# Define stream_aggregates function to compute the aggregates of a csv or PGN file
+# chunk by chunk
+def stream_aggregates(path, chunksize=CHUNK_SIZE, rating_bins=rating_bins):
+    if re.search(r'\.pgn(\.gz|\.bz2)?$', path):
+        chunks = iter_pgn_chunks(path, chunksize)
+    else:
+        chunks = iter_csv_chunks(path, chunksize)
+    aggregates = GameAggregates(rating_bins)
+    for chunk in chunks:
+        aggregates.update(chunk)
+    return aggregates
+
+# Define main function to print the tables for a file from the command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chunked chess statistics for large exports')
+    parser.add_argument('path')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    aggregates = stream_aggregates(args.path, args.chunksize)
+    print(f'Games: {aggregates.games}')
+    print(aggregates.win_rates_df())
+    print(aggregates.turns_win_rates())
+    print(aggregates.opening_frequencies().head(10))
+    for r1, r2 in RATING_COMPARISONS:
+        for winner in OUTCOMES[:2]:
+            print(f'Win percentage of {winner} when {r1} > {r2}: '
+                  f'{aggregates.getwinners(r1, r2, winner):.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import smtplib
+
+import alerts
+from alerts import AlertQueue, PrintSender, SmtpSender, mail_settings, make_sender
+
+# Define RecordingSender class that keeps the emails it is asked to send
+class RecordingSender:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.emails = []
+        self.sent = 0
+        self.closed = False
+
+    def send(self, subject, body):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected('gone')
+        self.emails.append((subject, body))
+        self.sent += 1
+
+    def close(self):
+        self.closed = True
+
+# Define FakeClock class whose time is set by the test
+class FakeClock:
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self):
+        return self.seconds
+
+def test_repeated_alerts_are_suppressed_until_the_cooldown():
+    clock = FakeClock()
+    queue = AlertQueue(RecordingSender(), cooldown=3600, min_drop=0.01, clock=clock)
+    assert queue.add('stock', 'AAPL', 100.0, 'lowest price')
+    assert not queue.add('stock', 'AAPL', 100.0, 'lowest price')
+    assert not queue.add('stock', 'AAPL', 99.5, 'lowest price')
+    assert queue.add('stock', 'AAPL', 100.0, 'lowest price in a week')
+
+    # A drop of more than min_drop is alerted about at once, the same price again
+    # only after the cooldown
+    assert queue.add('stock', 'AAPL', 98.0, 'lowest price')
+    clock.seconds = 3599
+    assert not queue.add('stock', 'AAPL', 98.0, 'lowest price')
+    clock.seconds = 7200
+    assert queue.add('stock', 'AAPL', 98.0, 'lowest price')
+    queue.close()
+    assert queue.stats()['queued'] == 4 and queue.stats()['suppressed'] == 3
+
+def test_alerts_are_sent_in_one_digest():
+    sender = RecordingSender()
+    queue = AlertQueue(sender, digest_seconds=60)
+    queue.add('crypto', 'bitcoin', 60000, 'lowest price')
+    queue.add('stock', 'AAPL', '1,234.5', 'lowest price')
+    queue.flush()
+    assert sender.emails == [('Low Price: bitcoin, AAPL',
+                              'bitcoin (crypto) is at 60,000.00, its lowest price\n'
+                              'AAPL (stock) is at 1,234.50, its lowest price')]
+    queue.add('amazon', 'kettle', 20, 'lowest price')
+    queue.close()
+    assert len(sender.emails) == 2 and sender.closed
+    assert queue.stats()['digests'] == 2
+
+def test_unsent_alerts_are_not_held_back_by_the_cooldown():
+    queue = AlertQueue(RecordingSender(fail=True))
+    assert queue.add('stock', 'AAPL', 100.0, 'lowest price')
+    queue.flush()
+    assert queue.stats()['failures'] == 1
+    assert queue.add('stock', 'AAPL', 100.0, 'lowest price')
+    queue.close()
+
+def test_password_is_only_read_from_the_environment():
+    settings = mail_settings({'from_email': 'me@example.com', 'password': 'in the file',
+                              'port': '25'},
+                             environ={'PRICE_ALERT_SMTP_PASSWORD': 'secret',
+                                      'PRICE_ALERT_SMTP_STARTTLS': 'false'})
+    assert settings['password'] == 'secret'
+    assert settings['username'] == 'me@example.com'
+    assert settings['port'] == 25 and settings['starttls'] is False
+    assert 'password' not in mail_settings({'password': 'in the file'}, environ={})
+
+def test_emails_are_printed_without_a_recipient(capsys):
+    sender = make_sender(mail_settings({'from_email': 'me@example.com'}, environ={}))
+    assert isinstance(sender, PrintSender)
+    sender.send('Low Price: AAPL', 'AAPL (stock) is at 1.00')
+    assert capsys.readouterr().out == 'Low Price: AAPL\nAAPL (stock) is at 1.00\n'
+
+# Define FakeSMTP class standing in for smtplib.SMTP, whose connections can be
+# dropped by the test
+class FakeSMTP:
+
+    opened = []
+
+    def __init__(self, host, port, timeout=None):
+        self.alive = True
+        self.messages = []
+        FakeSMTP.opened.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        self.login = (username, password)
+
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('gone')
+        return (250, b'OK')
+
+    def send_message(self, msg):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('gone')
+        self.messages.append(msg['Subject'])
+
+    def quit(self):
+        self.alive = False
+
+    def close(self):
+        self.alive = False
+
+def test_smtp_connection_is_kept_and_reopened(monkeypatch):
+    monkeypatch.setattr(alerts.smtplib, 'SMTP', FakeSMTP)
+    FakeSMTP.opened = []
+    clock = FakeClock()
+    sender = SmtpSender('localhost', 8025, 'me@example.com', 'you@example.com',
+                        username='me', password='secret', idle_timeout=240, clock=clock)
+    sender.send('one', 'body')
+    sender.send('two', 'body')
+    assert sender.connections == 1 and FakeSMTP.opened[0].login == ('me', 'secret')
+
+    # A connection the server dropped is opened again, as is one idle for too long
+    FakeSMTP.opened[0].alive = False
+    sender.send('three', 'body')
+    clock.seconds = 300
+    sender.send('four', 'body')
+    assert sender.connections == 3 and sender.sent == 4
+    assert [server.messages for server in FakeSMTP.opened] == [['one', 'two'], ['three'],
+                                                                ['four']]
+    sender.close()
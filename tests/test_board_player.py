@@ -0,0 +1,139 @@
+import asyncio
+
+from board_player import BoardPlayer
+
+# Replay store of one game of 40 plies whose FEN and position key are the ply number
+class FakeReplay:
+
+    def plies(self, row):
+        return 40
+
+    def fen(self, row, ply):
+        return str(ply)
+
+    def key(self, row, ply):
+        return ply
+
+# Define Frames class that renders boards only when the test finishes them, so the
+# test decides which frames are still rendering when the playhead moves
+class Frames:
+
+    def __init__(self):
+        self.requested = []
+        self.futures = {}
+
+    def render(self, key, fen):
+        future = asyncio.get_running_loop().create_future()
+        self.requested.append(key)
+        self.futures[key] = future
+        return future
+
+    # Define finish method to finish rendering the boards of some plies
+    def finish(self, *plies):
+        for ply in plies:
+            future = self.futures[ply]
+            assert not future.cancelled()
+            future.set_result(f'<svg>{ply}</svg>')
+
+# Define Timer class whose sleeps only end when the test ticks it
+class Timer:
+
+    def __init__(self):
+        self.sleepers = []
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self.sleepers.append(future)
+        await future
+
+    # Define tick method to end every sleep in progress
+    def tick(self):
+        sleepers, self.sleepers = self.sleepers, []
+        for future in sleepers:
+            if not future.done():
+                future.set_result(None)
+
+# Define function to let the player's tasks run until they wait again
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+# Define function to make a player that records the plies it shows
+def make_player(lookahead=2):
+    shown = []
+    frames = Frames()
+    timer = Timer()
+    player = BoardPlayer(FakeReplay(), 0, lambda ply, svg: shown.append(ply), None,
+                         lookahead=lookahead, render=frames.render, sleep=timer.sleep)
+    return player, frames, timer, shown
+
+def test_seek_during_playback_keeps_playing():
+    async def main():
+        player, frames, timer, shown = make_player()
+        player.play()
+        await settle()
+        assert frames.requested == [0, 1, 2]
+
+        # Seek away while the first board is rendering. Its frame is kept for the
+        # waiting task instead of being cancelled with the other old frames
+        player.seek(30)
+        assert frames.futures[1].cancelled() and frames.futures[2].cancelled()
+        frames.finish(0)
+        await settle()
+        assert shown == [] and frames.requested == [0, 1, 2, 30, 31, 32]
+
+        # Seek back while ply 30 is rendering, then play on from there
+        player.seek(5)
+        frames.finish(30)
+        await settle()
+        assert shown == []
+        frames.finish(5)
+        await settle()
+        assert shown == [5]
+
+        timer.tick()
+        await settle()
+        frames.finish(6)
+        await settle()
+        assert shown == [5, 6]
+        assert not player._task.done() and player.playing
+        assert frames.requested == [0, 1, 2, 30, 31, 32, 5, 6, 7, 8]
+        player.stop()
+
+    asyncio.run(main())
+
+def test_seek_while_paused_shows_the_ply():
+    async def main():
+        player, frames, timer, shown = make_player(lookahead=8)
+        player.seek(12)
+        player.seek(20)
+
+        # The board of ply 12 finishing last does not replace the board of ply 20
+        frames.finish(20)
+        await settle()
+        frames.finish(12)
+        await settle()
+        assert shown == [20]
+        assert not player.playing and timer.sleepers == []
+        player.stop()
+
+    asyncio.run(main())
+
+def test_plays_to_the_end():
+    async def main():
+        player, frames, timer, shown = make_player()
+        player.seek(38)
+        frames.finish(38)
+        await settle()
+        player.play()
+        for ply in (39, 40):
+            await settle()
+            timer.tick()
+            await settle()
+            frames.finish(ply)
+        await settle()
+        assert shown == [38, 39, 40]
+        assert not player.playing and not player._task.done()
+        player.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from chess_analytics import ChessDataset
+
+# Define function to make a dataset of games with the given increment codes
+def dataset(increment_codes):
+    chess_dataset = ChessDataset()
+    chess_dataset.games_df = pd.DataFrame({'increment_code': increment_codes})
+    return chess_dataset
+
+def test_time_control_with_increments():
+    assert list(dataset(['1+0', '3+2', '10+5', '30+0']).time_control) == [
+        'bullet', 'blitz', 'rapid', 'classical']
+
+def test_time_control_without_any_increment():
+    assert list(dataset(['0', '1', '5', '15', '60']).time_control) == [
+        'ultrabullet', 'bullet', 'blitz', 'rapid', 'classical']
+
+def test_select_games_within_an_opening():
+    chess_dataset = ChessDataset()
+    chess_dataset.games_df = pd.DataFrame({
+        'opening_name': ['Sicilian', 'French', 'Sicilian', 'Sicilian', None],
+        'rating_group': pd.Categorical(['0-1200', '0-1200', '1200-1400', '0-1200', '0-1200']),
+        'winner': ['white', 'white', 'white', 'black', 'white']})
+    assert list(chess_dataset.select_games(opening='Sicilian')) == [0, 2, 3]
+    assert list(chess_dataset.select_games(opening='Sicilian', rating_group='0-1200',
+                                           winner='white')) == [0]
+    assert list(chess_dataset.select_games(winner='white')) == [0, 1, 2, 4]
+    assert list(chess_dataset.select_games(opening='Ruy Lopez')) == []
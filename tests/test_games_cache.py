@@ -0,0 +1,118 @@
+import gc
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import games_cache
+from chess_analytics import ChessDataset
+from game_replay import map_chunks
+
+# Define function to write a csv of games with long, unique move strings
+def write_games(path, games=20000, moves=250):
+    rng = np.random.default_rng(0)
+    squares = np.array([f'{f}{r}' for f in 'abcdefgh' for r in range(1, 9)])
+    pd.DataFrame({
+        'id': [f'g{i}' for i in range(games)],
+        'rated': rng.random(games) < 0.8,
+        'turns': rng.integers(2, 200, games),
+        'winner': rng.choice(['white', 'black', 'draw'], games),
+        'white_rating': rng.integers(800, 2600, games),
+        'black_rating': rng.integers(800, 2600, games),
+        'moves': [' '.join(rng.choice(squares, moves)) for _ in range(games)],
+        'opening_name': rng.choice(['Sicilian Defense', 'French Defense'], games),
+    }).to_csv(path, index=False)
+
+def test_load_games_matches_read_csv(tmp_path):
+    path = tmp_path / 'games.csv'
+    write_games(path, games=50, moves=5)
+    expected = pd.read_csv(path)
+    expected.loc[3, 'moves'] = np.nan
+    expected.to_csv(path, index=False)
+
+    games_df = games_cache.load_games(path)
+    pd.testing.assert_frame_equal(games_df, expected, check_dtype=False,
+                                  check_categorical=False)
+    assert games_df['white_rating'].dtype == expected['white_rating'].dtype
+
+    moves = games_cache.open_cache(path).text('moves')
+    assert len(moves) == 50 and moves[0] == expected['moves'][0] and np.isnan(moves[3])
+    assert moves[-1] == expected['moves'][49]
+    assert list(moves.take([1, 2])) == expected['moves'][1:3].tolist()
+
+# Define function to return, in kB, how much of the files in a directory is mapped
+# into this process and how much anonymous memory the process has written to,
+# i.e. holds privately. Read from /proc/self/smaps
+def memory_kb(directory):
+    memory = {'mapped': 0, 'private': 0}
+    path = ''
+    with open('/proc/self/smaps') as file:
+        for line in file:
+            mapping = MAPPING.match(line)
+            if mapping:
+                path = mapping.group(1)
+                continue
+            name, _, value = line.partition(':')
+            if name == 'Rss' and path.startswith(directory):
+                memory['mapped'] += int(value.split()[0])
+            elif name == 'Private_Dirty' and not path.startswith('/'):
+                memory['private'] += int(value.split()[0])
+    return memory
+
+# Pattern of the first line of each mapping in /proc/self/smaps, holding its path
+MAPPING = re.compile(r'^[0-9a-f]+-[0-9a-f]+ \S+ \S+ \S+ \S+\s*(.*)$')
+
+# Datasets read by read_games(), kept so a worker reading another one cannot reuse
+# their memory
+kept = []
+
+# Define function run in worker processes to read every move of a dataset, either
+# through the shared cache or from a private dataframe, and return by how much the
+# cached files mapped into the process and its private memory grew in kB
+def read_games(items):
+    grown = []
+    for path, shared in items:
+        directory = games_cache.cache_dir_for(path)
+        gc.collect()
+        gc.freeze()
+        before = memory_kb(directory)
+        if shared:
+            dataset = ChessDataset(path)
+            ratings = int(dataset.games_df['white_rating'].sum())
+            characters = sum(len(moves) for moves in dataset.moves)
+            kept.append(dataset)
+        else:
+            games_df = games_cache.load_games(path)
+            ratings = int(games_df['white_rating'].sum())
+            characters = int(games_df['moves'].str.len().sum())
+            kept.append(games_df)
+        after = memory_kb(directory)
+        grown.append({'mapped': after['mapped'] - before['mapped'],
+                      'private': after['private'] - before['private'],
+                      'characters': characters, 'ratings': ratings})
+    return grown
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps'), reason='needs /proc/self/smaps')
+def test_worker_processes_share_the_cached_pages(tmp_path):
+    path = str(tmp_path / 'games.csv')
+    write_games(path)
+    cache = games_cache.open_cache(path)
+    moves_bytes = cache.array('moves').nbytes
+    moves_kb = moves_bytes // 1024
+
+    grown = map_chunks(read_games, [(path, True), (path, True), (path, False), (path, False)],
+                       workers=2, chunk_size=1)
+    assert {(run['characters'], run['ratings']) for run in grown} == {
+        (moves_bytes, int(pd.read_csv(path)['white_rating'].sum()))}
+
+    # Reading the shared cache maps the move buffer's file pages into the process,
+    # which every worker shares, without copying them. The private dataframe holds
+    # its own copy of every move string, so its process writes several times more
+    for shared in grown[:2]:
+        assert shared['mapped'] > moves_kb * 0.9
+        for private in grown[2:]:
+            assert private['mapped'] < moves_kb * 0.1
+            assert private['private'] > moves_kb
+            assert shared['private'] * 4 < private['private']
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+from price_fetching import Fetcher, SourceLimits
+from quote_providers import FakeQuoteProvider
+
+# Define function to make a fetcher whose retry delays are recorded instead of waited
+def fetcher(limits):
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    return Fetcher(limits, sleep=sleep), delays
+
+def test_failed_lookups_are_retried_with_backoff():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError('no answer')
+        return 42
+
+    price_fetcher, delays = fetcher({'stock': SourceLimits(retries=3, backoff=0.5)})
+    results, errors = price_fetcher.fetch_sync([('stock', 'AAPL', flaky)])
+    assert results == {('stock', 'AAPL'): 42} and errors == {}
+    assert delays == [0.5, 1.0]
+    assert price_fetcher.metrics()['stock']['retries'] == 2
+    assert price_fetcher.metrics()['stock']['successes'] == 1
+
+def test_lookup_failing_every_attempt_is_an_error():
+    def broken():
+        raise ConnectionError('no answer')
+
+    price_fetcher, delays = fetcher({'crypto': SourceLimits(retries=2, backoff=1.0)})
+    results, errors = price_fetcher.fetch_sync([('crypto', 'bitcoin', broken)])
+    assert results == {}
+    assert isinstance(errors[('crypto', 'bitcoin')], ConnectionError)
+    assert delays == [1.0, 2.0]
+    assert price_fetcher.metrics()['crypto']['attempts'] == 3
+    assert price_fetcher.metrics()['crypto']['failures'] == 1
+
+def test_hanging_lookup_times_out():
+    release = threading.Event()
+    price_fetcher, _ = fetcher({'amazon': SourceLimits(timeout=0.05, retries=1)})
+    try:
+        results, errors = price_fetcher.fetch_sync([('amazon', 'url', release.wait)])
+    finally:
+        release.set()
+    assert isinstance(errors[('amazon', 'url')], asyncio.TimeoutError)
+    assert price_fetcher.metrics()['amazon']['timeouts'] == 2
+
+def test_concurrency_is_limited_per_source():
+    lock = threading.Lock()
+    running = []
+    most = []
+
+    # Each lookup waits for a second one to be running, so a limit of one would
+    # fail the barrier and a limit above two would show up in most
+    pairs = threading.Barrier(2, timeout=5)
+
+    def lookup():
+        with lock:
+            running.append(1)
+            most.append(len(running))
+        pairs.wait()
+        with lock:
+            running.pop()
+        return 1
+
+    price_fetcher, _ = fetcher({'amazon': SourceLimits(concurrency=2, retries=0)})
+    results, errors = price_fetcher.fetch_sync([('amazon', i, lookup) for i in range(6)])
+    assert errors == {} and len(results) == 6
+    assert max(most) == 2
+
+def test_repeated_jobs_run_once():
+    provider = FakeQuoteProvider({'AAPL': 190.5, 'MSFT': 410.0})
+    tickers = ('AAPL', 'MSFT', 'NOPE')
+    price_fetcher, _ = fetcher({'stock': SourceLimits()})
+    results, errors = price_fetcher.fetch_sync(
+        [('stock', tickers, lambda: provider.quotes(tickers))] * 3)
+    assert results == {('stock', tickers): {'AAPL': 190.5, 'MSFT': 410.0}}
+    assert provider.requests == 1
@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import random
+import threading
+
+from scheduler import FakeClock, MARKET_TIMEZONE, Scheduler, market_hours
+
+# Define function to make a scheduler driven by a fake clock
+def fake_scheduler(clock, seed=0):
+    return Scheduler(clock=clock.time, sleep=clock.sleep, now=clock.now,
+                     rng=random.Random(seed))
+
+# Define function to run a scheduler for a number of fake seconds
+def run_for(price_scheduler, clock, seconds):
+    async def main():
+        task = asyncio.create_task(price_scheduler.run())
+        await clock.advance(seconds, waiting=len(price_scheduler.jobs))
+        price_scheduler.stop()
+        await task
+
+    asyncio.run(main())
+
+def test_runs_stay_on_their_slots_with_jitter():
+    clock = FakeClock()
+    price_scheduler = fake_scheduler(clock, seed=3)
+    times = []
+
+    async def job():
+        times.append(clock.time())
+
+    price_scheduler.add('crypto', job, 60, jitter=5)
+    run_for(price_scheduler, clock, 300)
+
+    # Every run is within the jitter of its slot, so the delays do not add up
+    rng = random.Random(3)
+    assert times == [60 * slot + rng.uniform(0, 5) for slot in range(5)]
+
+def test_slots_missed_by_a_slow_run_are_skipped():
+    clock = FakeClock()
+    price_scheduler = fake_scheduler(clock)
+    times = []
+
+    async def job():
+        times.append(clock.time())
+        if len(times) == 1:
+            await clock.sleep(130)
+
+    price_scheduler.add('stock', job, 60)
+    run_for(price_scheduler, clock, 300)
+    assert times == [0, 180, 240, 300]
+    assert price_scheduler.jobs['stock'].stats.skipped == 2
+
+def test_failed_runs_are_retried_with_doubling_delays():
+    clock = FakeClock()
+    price_scheduler = fake_scheduler(clock)
+    times = []
+
+    async def job():
+        times.append(clock.time())
+        if len(times) <= 3:
+            raise ConnectionError('no answer')
+
+    price_scheduler.add('amazon', job, 100, retry=10, max_retry=35)
+    run_for(price_scheduler, clock, 200)
+
+    # Retries after 10, 20 and at most 35 seconds, then back on the 100 second slots
+    assert times == [0, 10, 30, 65, 100, 200]
+    stats = price_scheduler.jobs['amazon'].stats
+    assert stats.failures == 3 and stats.runs == 6
+    assert stats.last_error == "ConnectionError('no answer')"
+
+def test_jobs_only_run_while_active():
+    clock = FakeClock()
+    price_scheduler = fake_scheduler(clock)
+    times = []
+
+    async def job():
+        times.append(clock.now().time())
+
+    # The fake clock starts on a Monday at 9:00 in New York
+    price_scheduler.add('stock', job, 900, active=market_hours)
+    run_for(price_scheduler, clock, 3600)
+    assert times == [datetime.time(9, 30), datetime.time(9, 45), datetime.time(10, 0)]
+    assert price_scheduler.jobs['stock'].stats.inactive == 2
+
+def test_market_hours():
+    def at(day, hour, minute):
+        return datetime.datetime(2024, 6, day, hour, minute, tzinfo=MARKET_TIMEZONE)
+
+    assert market_hours(at(10, 9, 30))
+    assert market_hours(at(14, 15, 59))
+    assert not market_hours(at(10, 9, 29))
+    assert not market_hours(at(10, 16, 0))
+    assert not market_hours(at(15, 12, 0))
+    assert market_hours(datetime.datetime(2024, 6, 10, 14, 0, tzinfo=datetime.timezone.utc))
+
+def test_shutdown_waits_for_a_run_in_a_thread():
+    clock = FakeClock()
+    price_scheduler = fake_scheduler(clock)
+    started = threading.Event()
+    release = threading.Event()
+    finished = []
+
+    def job():
+        started.set()
+        release.wait(5)
+        finished.append(1)
+
+    price_scheduler.add('amazon', job, 3600)
+
+    async def main():
+        task = asyncio.create_task(price_scheduler.run())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        price_scheduler.stop()
+        await task
+
+    asyncio.run(main())
+    assert finished == []
+
+    # The run is still going in its thread until it is released
+    waiter = threading.Thread(target=price_scheduler.shutdown)
+    waiter.start()
+    assert waiter.is_alive()
+    release.set()
+    waiter.join(5)
+    assert not waiter.is_alive() and finished == [1]
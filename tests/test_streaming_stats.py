@@ -0,0 +1,14 @@
+from streaming_stats import pgn_row
+
+# Define function to return whether a game with the given Event header is rated
+def rated(event):
+    return pgn_row({'Event': event, 'Result': '1-0'}, '1. e4 e5 1-0')['rated']
+
+def test_rated_events():
+    assert rated('Rated Blitz game')
+    assert rated('rated classical tournament https://lichess.org/tournament/x')
+
+def test_unrated_events():
+    assert not rated('Unrated Blitz game')
+    assert not rated('Casual Rapid game')
+    assert not rated('')